@@ -0,0 +1,4 @@
+"""
+Micro-benchmarks for the synchronization client. Run them from the project
+root, for example ``python -m benchmarks.metavfs_merge``.
+"""
@@ -0,0 +1,94 @@
+"""
+Time :py:meth:`sync.auth.Authenticator.get_authorization_header`, called
+before every HTTP call to a LocalBox server, on a temporary database:
+
+- ``reopen``: selecting the token from the database on every call, with the
+  former database access parsing sync.ini, checking the database file and
+  opening, committing and closing a connection per query
+- ``pooled``: selecting the token from the database on every call, with
+  :py:func:`sync.database.database_execute` as it is
+- ``memory``: the token kept in memory by the authenticator, as it is
+
+Usage: ``python -m benchmarks.auth_header [calls, default 10000]``
+"""
+from __future__ import print_function
+
+import shutil
+import sys
+import tempfile
+from os.path import exists, join
+from sqlite3 import Binary, connect
+from timeit import default_timer
+
+try:
+    from ConfigParser import ConfigParser, NoSectionError, NoOptionError
+except ImportError:
+    from configparser import ConfigParser, NoSectionError, NoOptionError  # pylint: disable=F0401
+
+from sync import auth, config, database
+
+LABEL = 'benchmark'
+
+
+def reopen_execute(command, params=None):
+    parser = ConfigParser()
+    parser.read(config.SYNCINI_PATH)
+    try:
+        parser.get('database', 'type')
+    except (NoSectionError, NoOptionError):
+        pass
+    parser = ConfigParser()
+    parser.read(config.SYNCINI_PATH)
+    try:
+        filename = parser.get('database', 'filename')
+    except (NoSectionError, NoOptionError):
+        filename = database.DATABASE_PATH
+    exists(filename)
+    connection = connect(filename)
+    try:
+        connection.text_factory = Binary
+        cursor = connection.cursor()
+        cursor.execute(command, params)
+        connection.commit()
+        return [list(map(lambda i: i.obj.decode('utf-8') if hasattr(i, 'decode') else str(i), row))
+                for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def select_header(authenticator, execute):
+    result = execute('select token from sites where client_id = ?', (authenticator.client_id,))
+    return 'Bearer ' + result[0][0]
+
+
+def run(mode, authenticator, count):
+    if mode == 'memory':
+        get_header = authenticator.get_authorization_header
+    else:
+        execute = reopen_execute if mode == 'reopen' else database.database_execute
+        get_header = lambda: select_header(authenticator, execute)
+    start = default_timer()
+    for _ in range(count):
+        assert get_header() == 'Bearer token'
+    elapsed = default_timer() - start
+    print('%-7s %d calls: %6.2f s, %7.1f us each' % (mode, count, elapsed, elapsed * 1000000.0 / count))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    directory = tempfile.mkdtemp()
+    try:
+        config.SYNCINI_PATH = join(directory, 'sync.ini')
+        database.DATABASE_PATH = join(directory, 'database.sqlite3')
+        database.database_execute('insert into sites (site, user, client_id, client_secret, token) '
+                                  'values (?, ?, ?, ?, ?);', (LABEL, 'user', 'id1', 'secret1', 'token'))
+        authenticator = auth.Authenticator('http://127.0.0.1/', LABEL)
+        for mode in ('reopen', 'pooled', 'memory'):
+            run(mode, authenticator, count)
+    finally:
+        database.close_connection()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
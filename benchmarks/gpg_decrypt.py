@@ -0,0 +1,52 @@
+"""
+Compare the gpg backends of :py:func:`sync.gpg.get_gpg` on decrypting key
+material like ``LocalBox.call_keys`` does: a 32 byte key encrypted for a
+2048 bit key pair in a temporary keyring, decrypted over and over.
+
+Usage: ``python -m benchmarks.gpg_decrypt [decryptions, default 1000]``
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+from sync.gpg import gpg, InProcessGpg, PGPKey
+
+PASSPHRASE = 'benchmark'
+
+
+def run(backend, encrypted, expected, count):
+    start = default_timer()
+    for _ in range(count):
+        assert backend.decrypt(encrypted, PASSPHRASE) == expected
+    elapsed = default_timer() - start
+    print('%-10s %d decryptions: %6.2f s, %6.2f ms each' % (
+        type(backend).__name__, count, elapsed, elapsed * 1000.0 / count))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    folder = tempfile.mkdtemp()
+    try:
+        subprocess_backend = gpg(folder)
+        key_input = subprocess_backend.gpg.gen_key_input(key_length=2048, passphrase=PASSPHRASE)
+        fingerprint = subprocess_backend.gpg.gen_key(key_input).fingerprint
+        key = os.urandom(32)
+        encrypted = subprocess_backend.gpg.encrypt(key, fingerprint, always_trust=True, armor=False).data
+
+        backends = [subprocess_backend]
+        if PGPKey is not None:
+            backends.append(InProcessGpg(folder))
+        else:
+            print('PGPy is not installed, skipping InProcessGpg')
+        for backend in backends:
+            run(backend, encrypted, key, count)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
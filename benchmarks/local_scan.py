@@ -0,0 +1,145 @@
+"""
+Compare scans of a generated sync folder of about 100k files (mostly '.lox'
+files, some with their decrypted twin):
+
+- ``recursive``: the former recursive scan, with listdir, isdir, exists and
+  getmtime per entry
+- ``walker``: :py:meth:`sync.syncer.Syncer.populate_filepath_metadata` without
+  stat cache
+- ``cached``: the same with a warm :py:class:`sync.stat_cache.StatCache`
+
+Each mode runs in its own process. Python level calls of os.stat and
+os.listdir are counted; with ``strace`` installed the system calls are
+counted as well.
+
+Usage: ``python -m benchmarks.local_scan [files, default 100000]``
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from distutils.spawn import find_executable
+from os.path import isdir, join
+from timeit import default_timer
+
+FILES_PER_DIRECTORY = 100
+DIRECTORIES_PER_DIRECTORY = 10
+
+
+def make_tree(root, files):
+    """
+    'files' files in directories of FILES_PER_DIRECTORY files, nested
+    DIRECTORIES_PER_DIRECTORY wide; every tenth '.lox' file has a decrypted twin
+    """
+    directories = [root]
+    for number in range(files):
+        if number % FILES_PER_DIRECTORY == 0:
+            index = number // FILES_PER_DIRECTORY
+            parent = directories[index // DIRECTORIES_PER_DIRECTORY] if index else root
+            directory = join(parent, 'dir%d' % index)
+            os.mkdir(directory)
+            directories.append(directory)
+        name = join(directory, 'file%d.txt' % number)
+        with open(name + '.lox', 'wb') as lox_file:
+            lox_file.write(b'x' * 64)
+        if number % 10 == 0:
+            with open(name, 'wb') as plain_file:
+                plain_file.write(b'x' * 60)
+
+    # directories changed just before a scan are not taken from the stat cache
+    for directory in directories:
+        os.utime(directory, (1000000000, 1000000000))
+
+
+def recursive_scan(syncer, path='/', parent=None):
+    from loxcommon import os_utils
+    from sync import defaults
+    from sync.metavfs import MetaVFS
+
+    path = path.lstrip('.').rstrip("/\\")
+    fs_path = syncer.filepath if path == '' else join(syncer.filepath, path)
+    is_dir = isdir(fs_path)
+    path_dec = os_utils.remove_extension(path, defaults.LOCALBOX_EXTENSION)
+    fs_path_dec = os_utils.remove_extension(fs_path, defaults.LOCALBOX_EXTENSION)
+    if is_dir:
+        vfsnode = MetaVFS(os.path.getmtime(fs_path), path_dec, is_dir)
+        for entry in os.listdir(fs_path):
+            recursive_scan(syncer, join(path, entry), parent=vfsnode)
+    else:
+        if not path.endswith(defaults.LOCALBOX_EXTENSION):
+            if not os.path.exists(fs_path + defaults.LOCALBOX_EXTENSION):
+                modtime = os.path.getmtime(fs_path)
+            else:
+                return
+        else:
+            if os.path.exists(fs_path_dec):
+                modtime = max(os.path.getmtime(fs_path), os.path.getmtime(fs_path_dec))
+            else:
+                modtime = os.path.getmtime(fs_path)
+        vfsnode = MetaVFS(modtime, path_dec, is_dir)
+
+    if parent is None:
+        syncer.filepath_metadata = vfsnode
+    else:
+        parent.add_child(vfsnode)
+
+
+def run(mode, root):
+    from sync import defaults, stat_cache
+    from sync.syncer import Syncer
+
+    stat_cache.STAT_CACHE = join(root, '..', 'statcache.')
+    defaults.STAT_CACHE_ENABLED = mode == 'cached'
+    syncer = Syncer(None, root, 'sync', name='benchmark')
+    if mode == 'cached':
+        # warm up
+        syncer.populate_filepath_metadata()
+
+    calls = {'stat': 0, 'listdir': 0}
+
+    def counted(name, function):
+        def call(*args, **kwargs):
+            calls[name] += 1
+            return function(*args, **kwargs)
+        return call
+
+    os.stat, os.listdir = counted('stat', os.stat), counted('listdir', os.listdir)
+    sys.setrecursionlimit(10000)
+    start = default_timer()
+    if mode == 'recursive':
+        recursive_scan(syncer)
+    else:
+        syncer.populate_filepath_metadata()
+    elapsed = default_timer() - start
+    print('%-9s %6.2f s, %7d entries, os.stat: %7d, os.listdir: %5d' % (
+        mode, elapsed, len(syncer.filepath_metadata.get_paths()), calls['stat'], calls['listdir']))
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = tempfile.mkdtemp()
+    root = join(directory, 'box')
+    try:
+        os.mkdir(root)
+        make_tree(root, files)
+        strace = find_executable('strace')
+        for mode in ('recursive', 'walker', 'cached'):
+            command = [sys.executable, '-m', 'benchmarks.local_scan', '--run', mode, root]
+            if strace:
+                command = [strace, '-f', '-c', '-e', 'trace=stat,lstat,newfstatat,statx,getdents,getdents64'] + \
+                          command
+            subprocess.check_call(command)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--run':
+        import logging
+        logging.disable(logging.INFO)
+        run(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,53 @@
+"""
+Report the memory used per :py:class:`sync.metavfs.MetaVFS` node for the
+trees ``Syncer.syncsync`` keeps alive: remote, local, old and the merged one.
+Sizes come from ``sys.getsizeof``; objects shared between nodes (like
+interned paths) are counted once.
+"""
+from __future__ import print_function
+
+from sys import getsizeof
+
+from benchmarks.metavfs_merge import make_tree
+from sync.metavfs import MetaVFS
+
+ENTRIES = 10000
+
+
+def deep_size(trees):
+    """
+    return the number of nodes and the bytes used by them, their attribute
+    storage, children lists and path strings
+    """
+    seen = set()
+    nodes = 0
+    total = 0
+
+    def count(obj):
+        if obj is None or id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        return getsizeof(obj)
+
+    for tree in trees:
+        for node in tree.gen():
+            nodes += 1
+            total += count(node)
+            total += count(getattr(node, '__dict__', None))
+            total += count(node.children)
+            total += count(node.path)
+    return nodes, total
+
+
+def main():
+    remote = make_tree(ENTRIES, 1)
+    local = make_tree(ENTRIES, 2)
+    old = make_tree(ENTRIES, 0)
+    merged = MetaVFS.merge(remote, local, old)
+
+    nodes, total = deep_size((remote, local, old, merged))
+    print('%d nodes in 4 trees: %d bytes, %.1f bytes per node' % (nodes, total, float(total) / nodes))
+
+
+if __name__ == '__main__':
+    main()
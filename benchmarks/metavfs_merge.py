@@ -0,0 +1,47 @@
+"""
+Benchmark :py:meth:`sync.metavfs.MetaVFS.merge` on synthetic trees, the way
+``Syncer.syncsync`` merges the remote, local and old trees.
+"""
+from __future__ import print_function
+
+from timeit import default_timer
+
+from sync.metavfs import MetaVFS
+
+SIZES = (1000, 10000, 100000)
+FILES_PER_DIRECTORY = 50
+
+
+def make_tree(entries, modified_at=0, skip_every=0):
+    """
+    build a tree with about 'entries' entries, 'FILES_PER_DIRECTORY' files per
+    directory. When 'skip_every' is set, every n-th file is left out so the
+    trees to merge differ.
+    """
+    root = MetaVFS(modified_at, '/', True)
+    directory = None
+    for number in range(entries):
+        if number % FILES_PER_DIRECTORY == 0:
+            directory = MetaVFS(modified_at, '/dir%d' % number, True)
+            root.add_child(directory)
+        elif not skip_every or number % skip_every:
+            directory.add_child(MetaVFS(modified_at, '%s/file%d' % (directory.path, number), False))
+    return root
+
+
+def main():
+    for size in SIZES:
+        remote = make_tree(size, 1, skip_every=7)
+        local = make_tree(size, 2, skip_every=11)
+        old = make_tree(size, 0)
+
+        start = default_timer()
+        merged = MetaVFS.merge(remote, local, old)
+        elapsed = default_timer() - start
+
+        print('%7d entries: merge took %.3f s (%d entries in result)' %
+              (size, elapsed, len(merged.get_paths())))
+
+
+if __name__ == '__main__':
+    main()
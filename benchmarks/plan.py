@@ -0,0 +1,48 @@
+"""
+Benchmark :py:class:`sync.plan.Planner` on synthetic trees, without a file
+system or server: the local tree answers the file system questions of the
+planner and every local file counts as modified.
+"""
+from __future__ import print_function
+
+from timeit import default_timer
+
+from benchmarks.metavfs_merge import make_tree
+from sync.metavfs import MetaVFS
+from sync.plan import Planner, summarize
+
+SIZES = (1000, 10000, 100000)
+
+
+class TreePlanner(Planner):
+    def exists(self, filesystem_path):
+        return filesystem_path in self.local
+
+    def isdir(self, filesystem_path):
+        entry = self.local.get_entry(filesystem_path)
+        return entry is not None and entry.is_dir
+
+    def is_modified(self, filesystem_path):
+        return True
+
+
+def main():
+    for size in SIZES:
+        remote = make_tree(size, 1, skip_every=7)
+        local = make_tree(size, 2, skip_every=11)
+        old = make_tree(size, 0)
+        planner = TreePlanner(remote, local, old, lambda metavfs: metavfs.path)
+
+        start = default_timer()
+        full_tree = MetaVFS.merge(remote, local, old)
+        merged = default_timer()
+        actions = planner.plan(full_tree)
+        planned = default_timer()
+
+        counts = ', '.join('%s: %d' % (action, count)
+                           for action, (count, _) in sorted(summarize(actions).items()) if count)
+        print('%7d entries: merge %.3f s, plan %.3f s (%s)' % (size, merged - start, planned - merged, counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Compare the peak memory of preparing an upload the old way (read, pad and
+encrypt the whole file, then base64 it into a JSON body) with
+:py:func:`sync.localbox.encrypt_stream`. Each mode runs in its own process
+because the peak resident set size only grows.
+
+Usage: ``python -m benchmarks.upload_memory [size in MB, default 1024]``
+"""
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import tempfile
+from base64 import b64encode
+from json import dumps
+from resource import getrusage, RUSAGE_SELF
+from timeit import default_timer
+
+from Crypto.Cipher.AES import MODE_CFB
+from Crypto.Cipher.AES import new as AES_Key
+
+from sync.gpg import gpg
+from sync.localbox import encrypt_stream
+
+KEY = b'k' * 32
+IV = b'i' * 16
+
+
+def in_memory(filename):
+    with open(filename, 'rb') as plain_file:
+        contents = plain_file.read()
+    contents = AES_Key(KEY, MODE_CFB, IV, segment_size=128).encrypt(gpg.add_pkcs7_padding(contents))
+    with open(filename + '.lox', 'wb') as encrypted_file:
+        encrypted_file.write(contents)
+    return len(dumps({'contents': b64encode(contents), 'path': '/benchmark'}))
+
+
+def streaming(filename):
+    with open(filename, 'rb') as plain_file:
+        with open(filename + '.lox', 'wb') as encrypted_file:
+            encrypt_stream(AES_Key(KEY, MODE_CFB, IV, segment_size=128), plain_file, encrypted_file)
+    return os.path.getsize(filename + '.lox')
+
+
+def run(mode, filename):
+    start = default_timer()
+    {'memory': in_memory, 'stream': streaming}[mode](filename)
+    elapsed = default_timer() - start
+    # kilobytes on Linux
+    print('%-6s peak RSS: %7.1f MB, %.1f s' % (mode, getrusage(RUSAGE_SELF).ru_maxrss / 1024.0, elapsed))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    fd, filename = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as plain_file:
+            block = os.urandom(1024 * 1024)
+            for _ in range(size):
+                plain_file.write(block)
+        print('%d MB file' % size)
+        for mode in ('stream', 'memory'):
+            subprocess.check_call([sys.executable, '-m', 'benchmarks.upload_memory', '--run', mode, filename])
+    finally:
+        os.remove(filename)
+        if os.path.exists(filename + '.lox'):
+            os.remove(filename + '.lox')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--run':
+        run(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -84,6 +84,8 @@ setup(
     description='Desktop Client for the LocalBox',
     packages=find_packages(),
     install_requires=required,
+    # gpg_backend = inprocess in sync.ini
+    extras_require={'inprocess': ['PGPy']},
     data_files=data_files,
     # cmdclass={'install': Install},
     include_package_data=True,
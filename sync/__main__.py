@@ -1,6 +1,11 @@
 """
 main module for localbox sync
+
+``python -m sync --plan <label>`` prints what a sync of that label would do
+without doing it.
 """
+from __future__ import print_function
+
 import os
 import signal
 import sys
@@ -9,6 +14,7 @@ from logging import getLogger, ERROR
 from os import makedirs, mkdir
 from os.path import dirname, isdir, exists
 from threading import Event
+from timeit import default_timer
 
 import sync.__version__
 from loxcommon import os_utils
@@ -21,12 +27,13 @@ from sync.event_handler import create_watchdog
 from sync.gui import gui_utils
 from sync.gui.taskbar import taskbarmain
 from sync.heartbeat import Heartbeat
-from sync.localbox import LocalBox
+from sync.client_registry import get_localbox
 from sync.memory_fs import LocalBoxMemoryFS
 from sync.open_file import open_file
 from sync.notif.notif_handler import NotifHandler
 from sync.notif.notifs import Notifs
-from sync.syncer import MainSyncer
+from sync.plan import SKIP, summarize
+from sync.syncer import MainSyncer, Syncer
 from .controllers import openfiles_ctrl as openfiles_ctrl
 from .defaults import LOG_PATH, APPDIR, SYNCINI_PATH
 
@@ -94,7 +101,7 @@ def run_file_decryption(filename, memory=False):
             if filename.startswith(sync_path):
                 localbox_filename = os_utils.remove_extension(filename.replace(sync_item.path, ''),
                                                               defaults.LOCALBOX_EXTENSION)
-                localbox_client = LocalBox(sync_item.url, sync_item.label, sync_item.path)
+                localbox_client = get_localbox(sync_item.url, sync_item.label, sync_item.path)
                 break
 
         if not localbox_client or not localbox_filename:
@@ -133,6 +140,33 @@ def run_file_decryption(filename, memory=False):
         gui_utils.show_error_dialog(_('Exception {}').format(ex), 'Error', standalone=True)
 
 
+def run_plan(label):
+    """
+    Print the plan of a sync of 'label' without executing it.
+
+    :return: exit status
+    """
+    sync_item = SyncsController().get(label)
+    if sync_item is None:
+        print('%s is not a configured localbox' % label, file=sys.stderr)
+        return 1
+
+    localbox_client = get_localbox(sync_item.url, sync_item.label, sync_item.path)
+    syncer = Syncer(localbox_client, sync_item.path, sync_item.direction, name=sync_item.label)
+    start = default_timer()
+    actions = syncer.plan()
+    elapsed = default_timer() - start
+
+    for action in actions:
+        if action.action != SKIP:
+            print('%-13s %12s  %s' % (action.action, '?' if action.size is None else action.size, action.path))
+    print()
+    for action, (count, size) in sorted(summarize(actions).items()):
+        print('%-13s %8d entries %14d bytes' % (action, count, size))
+    print('planned in %.3f s' % elapsed)
+    return 0
+
+
 if __name__ == '__main__':
     try:
         memory = LocalBoxMemoryFS()
@@ -172,7 +206,9 @@ if __name__ == '__main__':
             database_execute(sql)
             getLogger(__name__).debug('TOKEN column added to table SITES')
 
-        if len(sys.argv) > 1:
+        if len(sys.argv) == 3 and sys.argv[1] == '--plan':
+            sys.exit(run_plan(sys.argv[2]))
+        elif len(sys.argv) > 1:
             filename = ' '.join(sys.argv[1:])
 
             run_file_decryption(filename, memory)
@@ -1,13 +1,23 @@
 """
 Authentication module for LocalBox/loauth
+
+The access token of a label is kept in memory by its :py:class:`Authenticator`
+and only written to the database when it changes. It is renewed with the
+client credentials 'token_refresh_margin' seconds (see sync.ini) before it
+expires, by a timer, and on demand when it expired or was refused (HTTP
+401, see :py:meth:`sync.localbox.LocalBox._make_call`). Threads that need a new
+token at the same time wait for one renewal and go on with its token: the
+Authenticator counts the renewals done ('refreshes') and the ones saved
+('coalesced').
 """
-from _ssl import PROTOCOL_TLSv1_2
 from json import loads
+from threading import Lock, Timer
 from time import time
 
+from . import connection_pool, defaults
+from .config import get_option
 from .database import database_execute
 from logging import getLogger
-from ssl import SSLContext  # pylint: disable=E0611
 
 try:
     from httplib import BadStatusLine
@@ -16,11 +26,11 @@ except:
 
 try:
     from urllib import urlencode  # pylint: disable=E0611
-    from urllib2 import urlopen, HTTPError, URLError
+    from urllib2 import Request, HTTPError, URLError
     from urllib2 import HTTPError
     from urllib2 import URLError
 except ImportError:
-    from urllib.request import urlopen  # pylint: disable=F0401,E0611
+    from urllib.request import Request  # pylint: disable=F0401,E0611
     from urllib.parse import urlencode  # pylint: disable=F0401,E0611
     from urllib.error import HTTPError  # pylint: disable=F0401,E0611
     from urllib.error import URLError  # pylint: disable=F0401,E0611
@@ -32,6 +42,9 @@ from random import randint
 # expiration
 EXPIRATION_LEEWAY = 5
 
+# held while an Authenticator is created, there is one per label
+_instances_lock = Lock()
+
 
 def generate_client_id():
     """
@@ -53,28 +66,38 @@ class Authenticator(object):
     """
 
     def __new__(cls, authentication_url, label):
-        if not hasattr(cls, 'instance'):
-            cls.instance = dict()
+        with _instances_lock:
+            if not hasattr(cls, 'instance'):
+                cls.instance = dict()
 
-        if label not in cls.instance.keys():
-            cls.instance[label] = super(Authenticator, cls).__new__(cls, authentication_url, label)
+            if label not in cls.instance.keys():
+                cls.instance[label] = super(Authenticator, cls).__new__(cls, authentication_url, label)
 
-        return cls.instance[label]
+            return cls.instance[label]
 
     def __init__(self, authentication_url, label):
-        if not hasattr(self, 'label'):
-            getLogger(__name__).debug('New authenticator for %s' % label)
-            self.authentication_url = authentication_url
-            self.label = label
-            self.client_id = None
-            self.client_secret = None
-            self.access_token = None
-            self.expires = 0
-            self.scope = None
-            self.username = None
-
-            self.refresh_token = None
-            self.load_client_data()
+        with _instances_lock:
+            if not hasattr(self, 'label'):
+                getLogger(__name__).debug('New authenticator for %s' % label)
+                self.authentication_url = authentication_url
+                self.label = label
+                self.client_id = None
+                self.client_secret = None
+                self.access_token = None
+                self.expires = 0
+                self.scope = None
+                self.username = None
+
+                self.refresh_token = None
+                # held while the token is renewed, see reauthenticate
+                self._refresh_lock = Lock()
+                self._refresh_timer = None
+                # set by stop_refresh, once the label is forgotten
+                self._refresh_stopped = False
+                # renewals done by reauthenticate, and renewals saved because another thread just did one
+                self.refreshes = 0
+                self.coalesced = 0
+                self.load_client_data()
 
     def save_client_data(self):
         """
@@ -210,18 +233,21 @@ class Authenticator(object):
         request_data = urlencode(authdata).encode('utf-8')
         try:
             getLogger(__name__).debug('calling authentication server: %s' % self.authentication_url)
-            non_verifying_context = SSLContext(PROTOCOL_TLSv1_2)
-            http_request = urlopen(self.authentication_url, request_data,
-                                   context=non_verifying_context, timeout=5)
+            http_request = connection_pool.urlopen(Request(self.authentication_url, request_data), timeout=5)
             json_text = http_request.read().decode('utf-8')
             json = loads(json_text)
+            old_token = self.access_token
             self.access_token = json.get('access_token')
             self.refresh_token = json.get('refresh_token')
             self.scope = json.get('scope')
-            self.expires = time() + json.get('expires_in', 0) - EXPIRATION_LEEWAY
-
-            sql = 'update sites set token = ? where client_id = ?'
-            database_execute(sql, (self.access_token, self.client_id))
+            lifetime = json.get('expires_in')
+            # 0 when the server does not tell
+            self.expires = time() + max(lifetime - EXPIRATION_LEEWAY, lifetime / 2.0) if lifetime else 0
+
+            if self.access_token != old_token:
+                sql = 'update sites set token = ? where client_id = ?'
+                database_execute(sql, (self.access_token, self.client_id))
+            self._schedule_refresh()
         except (HTTPError, URLError, BadStatusLine) as error:
             getLogger(__name__).debug('HTTPError when calling '
                                       'the authentication server')
@@ -241,14 +267,79 @@ class Authenticator(object):
         if self.access_token is None and self.client_id is None and self.client_secret is None:
             raise AuthenticationError('Please authenticate with resource owner credentials first')
 
-        sql = 'select token from sites where client_id = ?'
-        result = database_execute(sql, (self.client_id,))
-        if result:
-            self.access_token = result[0][0]
-            return 'Bearer ' + self.access_token
+        access_token = self.access_token
+        if access_token is None or (self.expires and time() >= self.expires):
+            access_token = self.reauthenticate(access_token)
+        if access_token:
+            return 'Bearer ' + access_token
         else:
             return {}
 
+    def reauthenticate(self, stale_token):
+        """
+        Renew the access token with the client credentials, unless another
+        thread renewed it since the caller got stale_token: threads asking at
+        the same time wait for one renewal.
+
+        :param stale_token: the access token the caller found expired or refused
+        :return: the access token to use
+        """
+        with self._refresh_lock:
+            if self.access_token != stale_token and self.access_token is not None:
+                self.coalesced += 1
+                return self.access_token
+            self.authenticate_with_client_secret()
+            self.refreshes += 1
+            getLogger(__name__).debug('access token of %s renewed, renewals: %d done, %d coalesced',
+                                      self.label, self.refreshes, self.coalesced)
+            return self.access_token
+
+    def _schedule_refresh(self):
+        """
+        Start a timer renewing the token 'token_refresh_margin' seconds before
+        it expires (or halfway, for short lived tokens).
+        """
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+        if not self.expires or not self.has_client_credentials() or self._refresh_stopped:
+            return
+        remaining = self.expires - time()
+        margin = get_option('sync', 'token_refresh_margin', defaults.TOKEN_REFRESH_MARGIN)
+        self._refresh_timer = Timer(max(remaining - margin, remaining / 2.0, 0), self._refresh_in_background,
+                                    (self.access_token,))
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _refresh_in_background(self, access_token):
+        try:
+            getLogger(__name__).debug('renewing the access token of %s before it expires', self.label)
+            self.reauthenticate(access_token)
+        except Exception as error:  # pylint: disable=W0703
+            # renewed on demand instead
+            getLogger(__name__).warning('could not renew the access token of %s: %s', self.label, error)
+
+    def stop_refresh(self):
+        """
+        Cancel the renewal of the token before it expires, for good.
+        """
+        self._refresh_stopped = True
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+
+
+def forget(label):
+    """
+    Drop the Authenticator of label and stop renewing its token, ex: when its
+    LocalBox is removed. A new one is made, from the database, when asked for.
+    """
+    with _instances_lock:
+        authenticator = getattr(Authenticator, 'instance', dict()).pop(label, None)
+    if authenticator is not None:
+        authenticator.stop_refresh()
+
+
 class AuthenticationError(Exception):
     """
     Custom error class to signify problems in authentication
@@ -0,0 +1,116 @@
+"""
+The :py:class:`sync.localbox.LocalBox` clients of the process, one per server
+url and label, shared by the syncers, the watchdogs, the heartbeat, the
+controllers and the GUI.
+
+Creating a client costs a request to the server to find the url of its
+authentication server in the WWW-Authenticate header of the answer. Those
+urls are kept, per server url, in defaults.AUTHENTICATION_URLS for
+'authentication_url_ttl' seconds (see sync.ini), so other processes
+(``python -m sync file.lox``) and restarts use them as well.
+"""
+import os
+import pickle
+from logging import getLogger
+from threading import Lock
+from time import time
+
+from sync import defaults
+from sync.config import get_option
+from sync.localbox import LocalBox
+
+_lock = Lock()
+# (url, label) -> LocalBox
+_clients = dict()
+# server url -> (authentication url, time it was found), None until read from AUTHENTICATION_URLS
+_authentication_urls = None
+
+
+def get_localbox(url, label, path, timeout=None):
+    """
+    :param url: url of the LocalBox server
+    :param label: label of the LocalBox
+    :param path: filesystem path of the LocalBox, '' or None when it does not matter
+    :param timeout: seconds, or (connect, read) seconds, to wait for the
+    server when a new client has to ask it for its authentication url
+    :return: the shared LocalBox client of label at url. A client of another
+    path is replaced by a new one, ex: when the sync folder moved.
+    """
+    url = _normalize(url)
+    with _lock:
+        localbox_client = _clients.get((url, label))
+    if localbox_client is not None and (not path or localbox_client.path == path):
+        return localbox_client
+
+    authentication_url = get_authentication_url(url)
+    localbox_client = LocalBox(url, label, path, authentication_url=authentication_url, timeout=timeout)
+    if authentication_url is None:
+        set_authentication_url(url, localbox_client.get_authentication_url())
+    with _lock:
+        # another thread may have created one meanwhile
+        existing = _clients.get((url, label))
+        if existing is not None and (not path or existing.path == path):
+            return existing
+        _clients[(url, label)] = localbox_client
+    getLogger(__name__).debug('new client for %s at %s', label, url)
+    return localbox_client
+
+
+def forget(label):
+    """
+    Drop the clients of label, ex: when its LocalBox is removed.
+    """
+    with _lock:
+        for key in [key for key in _clients if key[1] == label]:
+            del _clients[key]
+
+
+def get_authentication_url(url):
+    """
+    :return: the authentication url of the server at url found less than
+    'authentication_url_ttl' seconds ago, None when there is none
+    """
+    ttl = get_option('sync', 'authentication_url_ttl', defaults.AUTHENTICATION_URL_TTL)
+    with _lock:
+        entry = _get_authentication_urls().get(_normalize(url))
+    if entry is None or time() - entry[1] > ttl:
+        return None
+    return entry[0]
+
+
+def set_authentication_url(url, authentication_url):
+    """
+    Keep the authentication url of the server at url, in memory and in defaults.AUTHENTICATION_URLS.
+    """
+    with _lock:
+        authentication_urls = _get_authentication_urls()
+        authentication_urls[_normalize(url)] = (authentication_url, time())
+        content = dict(authentication_urls)
+    temporary = defaults.AUTHENTICATION_URLS + '.tmp'
+    try:
+        with open(temporary, 'wb') as urls_file:
+            pickle.dump(content, urls_file)
+        if os.path.exists(defaults.AUTHENTICATION_URLS) and os.name == 'nt':
+            os.remove(defaults.AUTHENTICATION_URLS)
+        os.rename(temporary, defaults.AUTHENTICATION_URLS)
+    except (IOError, OSError) as error:
+        getLogger(__name__).warning('could not save the authentication urls: %s', error)
+
+
+def _get_authentication_urls():
+    """
+    :return: the authentication urls, read from AUTHENTICATION_URLS on first use. Call with _lock held.
+    """
+    global _authentication_urls
+    if _authentication_urls is None:
+        try:
+            with open(defaults.AUTHENTICATION_URLS, 'rb') as urls_file:
+                _authentication_urls = pickle.load(urls_file)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError) as error:
+            getLogger(__name__).debug('no authentication urls in %s: %s', defaults.AUTHENTICATION_URLS, error)
+            _authentication_urls = dict()
+    return _authentication_urls
+
+
+def _normalize(url):
+    return url if url.endswith('/') else url + '/'
@@ -0,0 +1,60 @@
+"""
+access to the options in sync.ini
+"""
+from logging import getLogger
+from os import stat
+from threading import Lock
+
+from sync.defaults import SYNCINI_PATH
+
+try:
+    from ConfigParser import ConfigParser, NoSectionError, NoOptionError
+except ImportError:
+    from configparser import ConfigParser, NoSectionError, NoOptionError  # pylint: disable=F0401
+
+# ((path, mtime) of sync.ini, its parser)
+_parser = (None, None)
+_parser_lock = Lock()
+
+
+def get_option(section, option, default):
+    """
+    Get an option from sync.ini converted to the type of 'default', or
+    'default' itself when the option is missing or invalid.
+
+    :param section: section in sync.ini, ex: 'sync'
+    :param option: option in that section, ex: 'delay'
+    :param default: value used when the option is not configured
+    :return:
+    """
+    try:
+        value = _get_parser().get(section, option)
+    except (NoSectionError, NoOptionError):
+        return default
+
+    try:
+        if isinstance(default, bool):
+            return value.strip().lower() in ('1', 'yes', 'true', 'on')
+        return type(default)(value)
+    except ValueError:
+        getLogger(__name__).warning("invalid value '%s' for %s.%s in '%s', using %s",
+                                    value, section, option, SYNCINI_PATH, default)
+        return default
+
+
+def _get_parser():
+    """
+    :return: the parsed sync.ini, parsed again only when sync.ini (or its path) changed
+    """
+    global _parser
+    try:
+        mtime = stat(SYNCINI_PATH).st_mtime
+    except OSError:
+        mtime = None
+    key = (SYNCINI_PATH, mtime)
+    with _parser_lock:
+        if _parser[1] is None or _parser[0] != key:
+            parser = ConfigParser()
+            parser.read(SYNCINI_PATH)
+            _parser = (key, parser)
+        return _parser[1]
@@ -0,0 +1,311 @@
+"""
+Keep-alive HTTP(S) connections shared by all calls to the same server.
+
+:py:func:`urlopen` is a replacement for ``urllib2.urlopen`` for the requests
+done by :py:class:`sync.localbox.LocalBox` and
+:py:class:`sync.auth.Authenticator`: instead of a new TCP connection and TLS
+handshake per request, connections are kept open and reused. It is safe to use
+from several threads.
+
+Like ``urllib2.urlopen``, requests go through the proxies of the http_proxy
+and https_proxy environment variables, except for the hosts in no_proxy.
+HTTPS requests are tunneled through the proxy with CONNECT.
+
+A request is sent again, once, only when it failed on a reused connection
+that the server had closed meanwhile: the server cannot have handled it.
+"""
+import errno
+import socket
+from base64 import b64encode
+from io import BytesIO
+from logging import getLogger
+from threading import Lock
+from _ssl import PROTOCOL_TLSv1_2
+from ssl import SSLContext  # pylint: disable=E0611
+
+from sync import defaults
+from sync.config import get_option
+
+try:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException, BadStatusLine
+    from urllib import getproxies, proxy_bypass, unquote
+    from urllib2 import HTTPError, URLError
+    from urlparse import urlsplit, urljoin
+except ImportError:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException, BadStatusLine  # pylint: disable=F0401
+    from urllib.request import getproxies, proxy_bypass  # pylint: disable=F0401,E0611
+    from urllib.error import HTTPError, URLError  # pylint: disable=F0401,E0611
+    from urllib.parse import urlsplit, urljoin, unquote  # pylint: disable=F0401,E0611
+
+#: one SSL context for all connections (certificates are not verified, as before)
+SSL_CONTEXT = SSLContext(PROTOCOL_TLSv1_2)
+
+#: how many redirects urlopen follows, like urllib2
+MAX_REDIRECTS = 10
+
+#: socket errors telling that the server closed an idle connection
+CLOSED_ERRNOS = (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+
+_pools = dict()
+_pools_lock = Lock()
+
+
+class ConnectionPool(object):
+    """
+    Idle keep-alive connections to one server (scheme, host and port).
+    """
+
+    def __init__(self, scheme, host, port, size, proxy=None):
+        """
+        :param proxy: (host, port, Proxy-Authorization header or None) of the
+        proxy to go through, None to connect to the server directly
+        """
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.size = size
+        self.proxy = proxy
+        self.opened = 0
+        self.reused = 0
+        self._idle = []
+        self._lock = Lock()
+
+    def get(self, timeout):
+        """
+        return an idle connection, or a new one when there is none
+
+        :return: (connection, reused)
+        """
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                connection = self._idle.pop()
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+            self.opened += 1
+
+        host, port = (self.host, self.port) if self.proxy is None else self.proxy[:2]
+        if self.scheme == 'https':
+            connection = HTTPSConnection(host, port, timeout=timeout, context=SSL_CONTEXT)
+            if self.proxy is not None:
+                tunnel_headers = {'Proxy-Authorization': self.proxy[2]} if self.proxy[2] else None
+                connection.set_tunnel(self.host, self.port, tunnel_headers)
+        else:
+            connection = HTTPConnection(host, port, timeout=timeout)
+        return connection, False
+
+    def put(self, connection):
+        """
+        give back a connection whose response has been read completely
+        """
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class PooledResponse(object):
+    """
+    Response of :py:func:`urlopen`, with the parts of the ``urllib2`` response
+    interface used in this project. Unless it was asked for as a stream, the
+    body has been read already and the connection is back in the pool.
+    Streamed responses give their connection back once read to the end and
+    should be closed when not.
+    """
+
+    def __init__(self, url, response, connection, pool, stream):
+        self.url = url
+        self.code = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+        self._connection = connection
+        self._pool = pool
+        if stream:
+            self._response = response
+            self._body = None
+        else:
+            self._response = None
+            self._body = BytesIO(response.read())
+            self._release(response)
+
+    def _release(self, response):
+        if self._connection is None:
+            return
+        if response.will_close:
+            self._connection.close()
+        else:
+            self._pool.put(self._connection)
+        self._connection = None
+
+    def read(self, amt=None):
+        if self._body is not None:
+            return self._body.read() if amt is None else self._body.read(amt)
+        data = self._response.read() if amt is None else self._response.read(amt)
+        if amt is None or not data:
+            self._release(self._response)
+        return data
+
+    def close(self):
+        if self._connection is not None:
+            # unread data left, the connection cannot be reused
+            self._connection.close()
+            self._connection = None
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.code
+
+    def geturl(self):
+        return self.url
+
+
+def get_pool(scheme, host, port):
+    key = (scheme, host, port)
+    with _pools_lock:
+        if key not in _pools:
+            size = get_option('sync', 'http_pool_size', defaults.HTTP_POOL_SIZE)
+            _pools[key] = ConnectionPool(scheme, host, port, size, get_proxy(scheme, host))
+        return _pools[key]
+
+
+def get_proxy(scheme, host):
+    """
+    :return: (host, port, Proxy-Authorization header or None) of the proxy
+    configured in the environment for scheme, or None when host is reached directly
+    """
+    proxy_url = getproxies().get(scheme)
+    if not proxy_url or proxy_bypass(host):
+        return None
+    if '://' not in proxy_url:
+        proxy_url = 'http://' + proxy_url
+    parts = urlsplit(proxy_url)
+    authorization = None
+    if parts.username is not None:
+        credentials = '%s:%s' % (unquote(parts.username), unquote(parts.password or ''))
+        authorization = 'Basic ' + b64encode(credentials.encode('utf-8')).decode('ascii')
+    return parts.hostname, parts.port or 80, authorization
+
+
+def get_stats():
+    """
+    :return: dictionary 'scheme://host:port' -> {'opened': n, 'reused': n}
+    """
+    with _pools_lock:
+        return dict(('%s://%s:%s' % key, {'opened': pool.opened, 'reused': pool.reused})
+                    for key, pool in _pools.items())
+
+
+def close_all():
+    """
+    close all idle connections
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+def urlopen(request, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, stream=False):
+    """
+    Do the request on a pooled connection.
+
+    :param request: ``urllib2.Request``
+    :param timeout: in seconds, or a tuple (connect timeout, read timeout)
+    :param stream: if False the body is read before returning
+    :return: :py:class:`PooledResponse`
+    :raises HTTPError: for HTTP errors, like ``urllib2.urlopen``
+    :raises URLError: when the server cannot be reached
+    """
+    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+        timeout = socket.getdefaulttimeout()
+    url = request.get_full_url()
+    method = request.get_method()
+    body = request.data
+    headers = dict(request.header_items())
+    if body is not None and 'Content-type' not in headers:
+        headers['Content-type'] = 'application/x-www-form-urlencoded'
+
+    for _ in range(MAX_REDIRECTS + 1):
+        response = _do_request(method, url, body, headers, timeout, stream)
+        location = response.headers.get('location')
+        if response.code in (301, 302, 303, 307, 308) and location:
+            getLogger(__name__).debug('redirected from %s to %s', url, location)
+            response.read()
+            url = urljoin(url, location)
+            if response.code in (301, 302, 303):
+                method, body = 'GET', None
+                headers.pop('Content-type', None)
+            continue
+        if response.code >= 400:
+            raise HTTPError(url, response.code, response.msg, response.headers, BytesIO(response.read()))
+        return response
+    raise HTTPError(url, response.code, 'too many redirects', response.headers, BytesIO(response.read()))
+
+
+def _do_request(method, url, body, headers, timeout, stream):
+    connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    pool = get_pool(parts.scheme, parts.hostname, port)
+    selector = parts.path or '/'
+    if parts.query:
+        selector += '?' + parts.query
+    if pool.proxy is not None and parts.scheme == 'http':
+        # plain http proxies are asked for the whole url
+        selector = '%s://%s%s' % (parts.scheme, parts.netloc, selector)
+        if pool.proxy[2]:
+            headers = dict(headers, **{'Proxy-Authorization': pool.proxy[2]})
+
+    retried = False
+    while True:
+        connection, reused = pool.get(connect_timeout)
+        if hasattr(body, 'seek'):
+            # file bodies are read again on retries
+            body.seek(0)
+        sent = False
+        try:
+            if connection.sock is None:
+                connection.connect()
+            connection.sock.settimeout(read_timeout)
+            connection.request(method, selector, body, headers)
+            sent = True
+            response = connection.getresponse()
+            return PooledResponse(url, response, connection, pool, stream)
+        except (socket.error, HTTPException) as error:
+            connection.close()
+            if reused and not retried and _closed_by_server(error, sent):
+                # the server closed the idle connection without handling the request, try again on a new one
+                getLogger(__name__).debug('stale connection to %s: %s', parts.netloc, error)
+                retried = True
+                continue
+            if isinstance(error, socket.error):
+                raise URLError(error)
+            raise
+
+
+def _closed_by_server(error, sent):
+    """
+    :param error: what a request on a reused connection failed with
+    :param sent: whether the request was sent completely
+    :return: whether the server closed the connection before it could answer
+    the request, in which case it did not handle it
+    """
+    if isinstance(error, socket.timeout):
+        return False
+    if not sent:
+        return True
+    if isinstance(error, BadStatusLine):
+        # the connection closed before the first byte of the answer
+        return True
+    return isinstance(error, socket.error) and error.errno in CLOSED_ERRNOS
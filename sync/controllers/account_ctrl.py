@@ -8,7 +8,7 @@ except ImportError:
 
 from sync.controllers.localbox_ctrl import SyncsController
 from sync.defaults import LOCALBOX_ACCOUNT_PATH
-from sync.localbox import LocalBox
+from sync.client_registry import get_localbox
 
 
 class AccountController:
@@ -51,7 +51,7 @@ class AccountController:
         invite_list = []
         for item in SyncsController().load():
             try:
-                localbox_client = LocalBox(url=item.url, label=item.label, path=item.path)
+                localbox_client = get_localbox(url=item.url, label=item.label, path=item.path)
 
                 result = localbox_client.get_invite_list(user=item.user)
 
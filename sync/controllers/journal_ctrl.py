@@ -0,0 +1,217 @@
+"""
+Change journal of the sync folders, one per label.
+
+The watchdog appends the LocalBox path of every local create, modify, delete
+and move to the journal of its label (see sync.event_handler), so a sync can
+look at those paths only instead of scanning the whole sync folder (see
+:py:meth:`sync.syncer.Syncer.syncsync`). A journal is a file with one path per
+line. Appended paths are written and synced to disk in groups, at most
+defaults.JOURNAL_COMMIT_DELAY seconds later, with one fsync per journal for
+all the paths that came in meanwhile. Paths not written yet when the client
+crashes are not missed: after a restart the first sync scans everything.
+A journal holds at most 'journal_max_entries' paths (read once); when more
+come in it overflows, later paths are dropped and the next sync scans
+everything.
+
+A sync takes the journal before it looks at the sync folder and commits it
+once it is done; paths taken by a sync that did not finish are taken again by
+the next one.
+"""
+import atexit
+import os
+from logging import getLogger
+from threading import Lock, Timer
+from time import time
+
+from sync import defaults
+from sync.config import get_option
+
+#: line marking a journal that overflowed; paths start with '/'
+OVERFLOW = b'*'
+
+_lock = Lock()
+# held while journal files are written, taken before _lock, so appending does not wait for the disk
+_write_lock = Lock()
+# label -> number of paths in the journal, written or not, None once it overflowed
+_sizes = dict()
+# label -> lines appended and not written yet
+_pending = dict()
+_commit_timer = None
+_max_entries = None
+# label -> time the watchdog of the label was started
+_watched = dict()
+
+
+def get_filename(label):
+    return defaults.CHANGE_JOURNAL + label
+
+
+def append(label, *paths):
+    """
+    Add paths, as in the MetaVFS trees ('/dir/name', without '.lox'), to the
+    journal of label.
+    """
+    global _commit_timer
+    lines = [path if isinstance(path, bytes) else path.encode('utf8') for path in paths]
+    with _lock:
+        if label not in _sizes:
+            _sizes[label] = _count(get_filename(label))
+        size = _sizes[label]
+        if size is None:
+            return
+        if size + len(lines) > _get_max_entries() or any(b'\n' in line for line in lines):
+            getLogger(__name__).info('change journal of %s overflowed, the next sync scans everything', label)
+            lines, size = [OVERFLOW], None
+        else:
+            size += len(lines)
+        _sizes[label] = size
+        _pending.setdefault(label, []).extend(lines)
+        if _commit_timer is None:
+            # paths coming in meanwhile are written with these
+            _commit_timer = Timer(defaults.JOURNAL_COMMIT_DELAY, flush)
+            _commit_timer.daemon = True
+            _commit_timer.start()
+
+
+def flush():
+    """
+    Write the appended paths to the journals and sync them to disk.
+    """
+    global _commit_timer
+    with _write_lock:
+        with _lock:
+            if _commit_timer is not None:
+                _commit_timer.cancel()
+                _commit_timer = None
+            pending = dict(_pending)
+            _pending.clear()
+        for label, lines in pending.items():
+            if not _write(label, lines):
+                # without a durable journal the paths could be missed, a full scan will not miss them
+                with _lock:
+                    if label in _sizes:
+                        _sizes[label] = None
+
+
+def take(label):
+    """
+    Hand the journal of label to a sync; new paths go to a fresh journal.
+
+    :return: (paths, overflowed) with the set of paths taken, including those
+    of a previous sync that was not committed, and whether paths were dropped
+    """
+    with _write_lock:
+        with _lock:
+            lines = _pending.pop(label, None)
+            _sizes[label] = 0
+        written = not lines or _write(label, lines)
+        filename = get_filename(label)
+        taken = filename + '.taken'
+        if os.path.exists(filename):
+            if os.path.exists(taken):
+                with open(filename, 'rb') as journal:
+                    with open(taken, 'ab') as taken_journal:
+                        taken_journal.write(journal.read())
+                        taken_journal.flush()
+                        os.fsync(taken_journal.fileno())
+                os.remove(filename)
+            else:
+                os.rename(filename, taken)
+        paths, overflowed = _read(taken)
+        return paths, overflowed or not written
+
+
+def commit(label):
+    """
+    Forget the paths handed out by take(): the sync that took them is done.
+    """
+    with _write_lock:
+        _remove(get_filename(label) + '.taken')
+
+
+def remove(label):
+    """
+    Forget the journal of a sync that is removed.
+    """
+    with _write_lock:
+        with _lock:
+            _pending.pop(label, None)
+            _sizes.pop(label, None)
+            _watched.pop(label, None)
+        _remove(get_filename(label))
+        _remove(get_filename(label) + '.taken')
+
+
+def watch(label):
+    """
+    Register that the watchdog of label started: from now on all local changes are journaled.
+    """
+    _watched[label] = time()
+
+
+def watched_since(label):
+    """
+    :return: the time the watchdog of label started, None when it is not running
+    """
+    return _watched.get(label)
+
+
+def _write(label, lines):
+    """
+    Append lines to the journal file of label. Call with _write_lock held.
+
+    :return: whether the lines are on disk
+    """
+    filename = get_filename(label)
+    try:
+        with open(filename, 'ab') as journal:
+            journal.write(b''.join(line + b'\n' for line in lines))
+            journal.flush()
+            os.fsync(journal.fileno())
+    except (IOError, OSError) as error:
+        getLogger(__name__).error('could not append to the change journal %s: %s', filename, error)
+        return False
+    return True
+
+
+def _get_max_entries():
+    """
+    :return: 'journal_max_entries' from sync.ini, read on first use. Call with _lock held.
+    """
+    global _max_entries
+    if _max_entries is None:
+        _max_entries = get_option('sync', 'journal_max_entries', defaults.JOURNAL_MAX_ENTRIES)
+    return _max_entries
+
+
+def _count(filename):
+    """
+    :return: the number of paths in a journal file, None when it overflowed
+    """
+    paths, overflowed = _read(filename)
+    return None if overflowed else len(paths)
+
+
+def _read(filename):
+    paths, overflowed = set(), False
+    try:
+        with open(filename, 'rb') as journal:
+            for line in journal:
+                line = line.rstrip(b'\n')
+                if line == OVERFLOW:
+                    overflowed = True
+                elif line:
+                    paths.add(line if str is bytes else line.decode('utf8'))
+    except IOError as error:
+        getLogger(__name__).debug('no change journal in %s: %s', filename, error)
+    return paths, overflowed
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+atexit.register(flush)
@@ -5,6 +5,9 @@ from logging import getLogger
 from pathlib import Path
 
 import sync.models.label_model as label_model
+from sync import auth, client_registry
+from sync.controllers import journal_ctrl
+from sync.controllers.login_ctrl import LoginController
 from sync.defaults import LOCALBOX_SITES_PATH
 
 
@@ -32,6 +35,10 @@ class SyncsController(object):
         """
         label = self._list[index].label
         label_model.delete_client_data(label)
+        LoginController().remove_passphrase(label)
+        journal_ctrl.remove(label)
+        client_registry.forget(label)
+        auth.forget(label)
         del self._list[index]
         if save:
             self.save()
@@ -5,7 +5,8 @@ except:
     import urllib
 from logging import getLogger
 
-from sync.gpg import gpg
+from sync import key_cache
+from sync.gpg import gpg, InProcessGpg
 
 
 class LoginController(object):
@@ -46,7 +47,7 @@ class LoginController(object):
             result = localbox_client.call_user(data_json)
 
         if result is not None:
-            self._passphrase[site] = passphrase
+            self._set_passphrase(site, passphrase)
         return result
 
     def get_passphrase(self, label):
@@ -67,10 +68,25 @@ class LoginController(object):
         if gpg().is_passphrase_valid(passphrase=passphrase,
                                      label=label,
                                      user=user):
-            self._passphrase[label] = passphrase
+            self._set_passphrase(label, passphrase)
         else:
             raise InvalidPassphraseError
 
+    def _set_passphrase(self, label, passphrase):
+        if self._passphrase.get(label) != passphrase:
+            # keys decrypted with the old passphrase must not outlive it
+            key_cache.invalidate(label)
+            InProcessGpg.forget()
+        self._passphrase[label] = passphrase
+
+    def remove_passphrase(self, label):
+        """
+        Forget the passphrase of label and the keys it unlocked.
+        """
+        self._passphrase.pop(label, None)
+        key_cache.invalidate(label)
+        InProcessGpg.forget()
+
     @property
     def logged_in(self):
         return self._logged_in
@@ -78,6 +94,9 @@ class LoginController(object):
     @logged_in.setter
     def logged_in(self, value):
         self._logged_in = value
+        if not value:
+            key_cache.invalidate()
+            InProcessGpg.forget()
 
 
 class InvalidPassphraseError(Exception):
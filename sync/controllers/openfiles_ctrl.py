@@ -1,61 +1,222 @@
+"""
+Registry of the decrypted ('opened') files: filesystem path -> (hash
+algorithm, hash of the contents) when the file was decrypted, see
+:py:mod:`sync.hash_cache` and :py:func:`is_modified`. Registries of older
+versions hold plain ``os_utils.hash_file`` digests.
+
+The registry is asked about for every file of a sync and several times per
+watchdog event, so it is kept in memory. Changes are written behind, at most
+defaults.OPENFILES_SAVE_DELAY seconds later and batched, to a temporary file
+that replaces LOCALBOX_OPENFILES. Files are also opened by other processes
+(``python -m sync file.lox``): when LOCALBOX_OPENFILES was replaced by
+another process its changes are merged into the registry. Every change is
+notified with Notifs().openfilesCtrl().
+"""
+import atexit
+import os
 import pickle
 from logging import getLogger
 from os.path import exists, isfile
+from threading import RLock, Timer
 
 from loxcommon import os_utils
-from sync.defaults import LOCALBOX_OPENFILES
+from sync import defaults, hash_cache
 from sync.notif.notifs import Notifs
 
+_lock = RLock()
+# filesystem path -> (algorithm, hex digest), the registry of this process
+_openfiles = None
+# the registry as last read from or written to LOCALBOX_OPENFILES, and the stat of that file then
+_on_disk = None
+_stamp = None
+_save_timer = None
+
 
 def add(filename):
     getLogger(__name__).debug('adding %s to opened files' % filename)
-    openfiles_list = load()
-    if not openfiles_list or isinstance(openfiles_list, list):
-        openfiles_list = dict()
-    if not filename in openfiles_list and exists(filename):
-        openfiles_list[filename] = os_utils.hash_file(filename)
-    save(openfiles_list)
+    if not exists(filename):
+        return
+    registered = (hash_cache.get_hash_cache().algorithm, hash_cache.hash_file(filename))
+    with _lock:
+        openfiles = _get_openfiles()
+        if filename in openfiles:
+            return
+        openfiles[filename] = registered
+        _schedule_save()
     Notifs().openfilesCtrl()
 
 
 def remove(filesystem_path):
-    openfiles_list = load()
-    if filesystem_path in openfiles_list.keys():
-        del openfiles_list[filesystem_path]
-        save(openfiles_list)
+    with _lock:
+        openfiles = _get_openfiles()
+        removed = openfiles.pop(filesystem_path, None) is not None
+        if removed:
+            _schedule_save()
+    if removed:
+        Notifs().openfilesCtrl()
     elif isfile(filesystem_path):
         getLogger(__name__).error('%s was not found in the list of opened files' % filesystem_path)
-    Notifs().openfilesCtrl()
 
 
 def save(openfiles_list):
-    with open(LOCALBOX_OPENFILES, 'wb') as f:
-        pickle.dump(openfiles_list, f)
-    getLogger(__name__).debug('saved opened files: %s' % openfiles_list)
+    """
+    Replace the registry and write it right away.
+    """
+    with _lock:
+        _get_openfiles()
+        _openfiles.clear()
+        _openfiles.update(openfiles_list or dict())
+        flush()
 
 
 def load():
+    """
+    :return: a copy of the registry, without the files that do not exist anymore
+    """
+    with _lock:
+        openfiles = dict(_get_openfiles())
+    return dict((k, v) for k, v in openfiles.items() if exists(k))
+
+
+def contains(filesystem_path):
+    with _lock:
+        return filesystem_path in _get_openfiles()
+
+
+def get_hash(filesystem_path):
+    with _lock:
+        return _get_openfiles().get(filesystem_path)
+
+
+def is_modified(filesystem_path):
+    """
+    :return: whether the contents of filesystem_path differ from the ones it
+    was registered with, True when it is not registered
+    """
+    with _lock:
+        registered = _get_openfiles().get(filesystem_path)
+    if registered is None:
+        return True
+    cache = hash_cache.get_hash_cache()
+    if isinstance(registered, tuple) and registered[0] == cache.algorithm:
+        return cache.hash_file(filesystem_path) != registered[1]
+
+    # registered with another 'hash_algorithm', or by an older version: hash the file the same way
     try:
-        with open(LOCALBOX_OPENFILES, 'rb') as f:
-            old_openfiles_list = pickle.load(f)
-            getLogger(__name__).debug('found this opened files: %s' % old_openfiles_list)
-            openfiles_list = {k: v for k, v in old_openfiles_list.items() if exists(k)}
-    except (IOError, AttributeError) as ex:
-        getLogger(__name__).error(ex)
-        openfiles_list = dict()
+        if isinstance(registered, tuple):
+            unchanged = hash_cache.hash_stream(filesystem_path, registered[0]) == registered[1]
+        else:
+            unchanged = os_utils.hash_file(filesystem_path) == registered
+    except ValueError as error:
+        getLogger(__name__).warning('cannot compare %s with its registered hash: %s', filesystem_path, error)
+        return True
+    if unchanged:
+        # the contents are still the registered ones, register them with the current algorithm
+        digest = cache.hash_file(filesystem_path)
+        with _lock:
+            openfiles = _get_openfiles()
+            if openfiles.get(filesystem_path) == registered:
+                openfiles[filesystem_path] = (cache.algorithm, digest)
+                _schedule_save()
+    return not unchanged
 
-    save(openfiles_list)
-    return openfiles_list
+
+def flush():
+    """
+    Write pending changes to LOCALBOX_OPENFILES, leaving out the files that
+    do not exist anymore.
+    """
+    global _on_disk, _stamp, _save_timer
+    with _lock:
+        if _save_timer is not None:
+            _save_timer.cancel()
+            _save_timer = None
+        openfiles = _get_openfiles()
+        for filesystem_path in [k for k in openfiles if not exists(k)]:
+            del openfiles[filesystem_path]
+        temporary = defaults.LOCALBOX_OPENFILES + '.tmp'
+        try:
+            with open(temporary, 'wb') as f:
+                pickle.dump(openfiles, f)
+            if os_utils.is_windows() and exists(defaults.LOCALBOX_OPENFILES):
+                os.remove(defaults.LOCALBOX_OPENFILES)
+            os.rename(temporary, defaults.LOCALBOX_OPENFILES)
+        except (IOError, OSError) as ex:
+            getLogger(__name__).error('could not save opened files: %s' % ex)
+            return
+        _on_disk, _stamp = dict(openfiles), _stat()
+    getLogger(__name__).debug('saved opened files: %s' % openfiles)
 
 
 def remove_all(*args, **kwargs):
     getLogger(__name__).info('removing all decrypted files')
-    remove_these = filter(lambda fp: os_utils.shred(fp), load())
-    map(lambda fp: remove(fp), remove_these)
+    for filesystem_path in load():
+        if os_utils.shred(filesystem_path):
+            remove(filesystem_path)
+    flush()
 
 
-def get_hash(filesystem_path):
+def _get_openfiles():
+    """
+    :return: the registry, merged with the changes other processes saved since
+    it was last read or written. Call with _lock held.
+    """
+    global _openfiles, _on_disk, _stamp
+    stamp = _stat()
+    if _openfiles is not None and stamp == _stamp:
+        return _openfiles
+
+    on_disk = _read()
+    if _openfiles is None:
+        _openfiles = dict(on_disk)
+    else:
+        for filesystem_path, digest in on_disk.items():
+            if _on_disk.get(filesystem_path) != digest:
+                _openfiles[filesystem_path] = digest
+        for filesystem_path in _on_disk:
+            if filesystem_path not in on_disk:
+                _openfiles.pop(filesystem_path, None)
+    _on_disk, _stamp = on_disk, stamp
+    return _openfiles
+
+
+def _schedule_save():
+    global _save_timer
+    if _save_timer is None:
+        # changes coming in meanwhile are saved with this one
+        _save_timer = Timer(defaults.OPENFILES_SAVE_DELAY, flush)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def _stat():
+    """
+    :return: what tells whether LOCALBOX_OPENFILES was replaced, None when it does not exist
+    """
     try:
-        return load()[filesystem_path]
-    except KeyError:
+        stats = os.stat(defaults.LOCALBOX_OPENFILES)
+    except OSError:
         return None
+    return stats.st_mtime, stats.st_size, stats.st_ino
+
+
+def _read():
+    try:
+        with open(defaults.LOCALBOX_OPENFILES, 'rb') as f:
+            openfiles_list = pickle.load(f)
+            getLogger(__name__).debug('found this opened files: %s' % openfiles_list)
+    except (IOError, EOFError, AttributeError, pickle.UnpicklingError) as ex:
+        getLogger(__name__).debug(ex)
+        openfiles_list = dict()
+    if not isinstance(openfiles_list, dict):
+        # written as a list by older versions
+        openfiles_list = dict()
+    return openfiles_list
+
+
+def _save_pending():
+    if _save_timer is not None:
+        flush()
+
+
+atexit.register(_save_pending)
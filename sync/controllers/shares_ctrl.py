@@ -3,7 +3,7 @@ from logging import getLogger
 
 from sync.controllers.localbox_ctrl import SyncsController
 from sync.defaults import LOCALBOX_SHARES_PATH
-from sync.localbox import LocalBox
+from sync.client_registry import get_localbox
 from sync.database import database_execute
 
 try:
@@ -36,7 +36,7 @@ class SharesController(object):
         :return:
         """
         item = self._list[index]
-        localbox_client = LocalBox(url=item.url, label=item.label, path=item.path)
+        localbox_client = get_localbox(url=item.url, label=item.label, path=item.path)
         localbox_client.delete_share(item.id)
         sql = 'delete from keys where site = ? and user != ?'
         database_execute(sql, (item.label, item.user))
@@ -58,7 +58,7 @@ class SharesController(object):
         self._list = []
         for item in SyncsController().load():
             try:
-                localbox_client = LocalBox(url=item.url, label=item.label, path=item.path)
+                localbox_client = get_localbox(url=item.url, label=item.label, path=item.path)
 
                 for share in localbox_client.get_share_list(user=item.user):
                     share_item = ShareItem(user=share['user'],
@@ -77,7 +77,7 @@ class SharesController(object):
         self._list = []
         for item in SyncsController().load():
             try:
-                localbox_client = LocalBox(url=item.url, label=item.label, path=item.path)
+                localbox_client = get_localbox(url=item.url, label=item.label, path=item.path)
 
                 for share in localbox_client.get_invite_list(user=item.user):
                     share_item = ShareItem(user=share['user'],
@@ -100,7 +100,7 @@ class SharesController(object):
         :return:
         """
         item = self._list[index]
-        localbox_client = LocalBox(url=item.url, label=item.label, path=item.path)
+        localbox_client = get_localbox(url=item.url, label=item.label, path=item.path)
         localbox_client.delete_invite(item.id)
         sql = 'delete from keys where site = ? and user != ?'
         database_execute(sql, (item.label, item.user))
@@ -116,7 +116,7 @@ class SharesController(object):
             :return:
             """
             item = self._list[index]
-            localbox_client = LocalBox(url=item.url, label=item.label, path=item.path)
+            localbox_client = get_localbox(url=item.url, label=item.label, path=item.path)
             localbox_client.accept_invite(item.id)
             if save:
                 self.save()
@@ -0,0 +1,99 @@
+"""
+State of interrupted uploads and downloads, so they can be resumed, also after
+a restart of the client. Entries are keyed by (direction, label, path).
+
+Only transfers of more than one chunk (defaults.TRANSFER_CHUNK_SIZE) are
+recorded, by several transfer threads at once, so the state is kept in
+memory. Changes are written behind, at most defaults.TRANSFERS_SAVE_DELAY
+seconds later and batched, to a temporary file that replaces
+LOCALBOX_TRANSFERS.
+"""
+import atexit
+import os
+import pickle
+from logging import getLogger
+from threading import Lock, Timer
+
+from loxcommon import os_utils
+from sync import defaults
+
+_lock = Lock()
+# key -> state, read from _filename
+_transfers = None
+_filename = None
+_save_timer = None
+
+
+def get(key):
+    with _lock:
+        return _get_transfers().get(key)
+
+
+def put(key, state):
+    getLogger(__name__).debug('saving transfer state of %s: %s' % (key, state))
+    with _lock:
+        _get_transfers()[key] = state
+        _schedule_save()
+
+
+def remove(key):
+    with _lock:
+        if _get_transfers().pop(key, None) is not None:
+            _schedule_save()
+
+
+def flush():
+    """
+    Write the pending changes to LOCALBOX_TRANSFERS, if any.
+    """
+    global _save_timer
+    with _lock:
+        if _save_timer is None:
+            return
+        _save_timer.cancel()
+        _save_timer = None
+        save(_transfers)
+
+
+def save(transfers):
+    temporary = _filename + '.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            pickle.dump(transfers, f)
+        if os_utils.is_windows() and os.path.exists(_filename):
+            os.remove(_filename)
+        os.rename(temporary, _filename)
+    except (IOError, OSError) as ex:
+        getLogger(__name__).error('could not save the transfer states: %s' % ex)
+
+
+def load():
+    try:
+        with open(defaults.LOCALBOX_TRANSFERS, 'rb') as f:
+            return pickle.load(f)
+    except (IOError, EOFError, AttributeError, pickle.UnpicklingError) as ex:
+        getLogger(__name__).debug(ex)
+        return dict()
+
+
+def _get_transfers():
+    """
+    :return: the transfer states, read on first use. Call with _lock held.
+    """
+    global _transfers, _filename
+    if _transfers is None or _filename != defaults.LOCALBOX_TRANSFERS:
+        _transfers = load()
+        _filename = defaults.LOCALBOX_TRANSFERS
+    return _transfers
+
+
+def _schedule_save():
+    global _save_timer
+    if _save_timer is None:
+        # changes coming in meanwhile are saved with this one
+        _save_timer = Timer(defaults.TRANSFERS_SAVE_DELAY, flush)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+atexit.register(flush)
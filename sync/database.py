@@ -1,25 +1,24 @@
 """
 Database implementation class
+
+Statements run on a sqlite connection kept per thread (see
+:py:func:`get_connection`) in WAL mode, so readers do not wait for writers
+and the statements a thread ran before are reused from the connection's
+statement cache. Worker threads close theirs when they finish (see
+:py:mod:`sync.workers`). The [database] section of sync.ini is read with
+:py:func:`sync.config.get_option`.
 """
 
-from .defaults import SYNCINI_PATH
+from .config import get_option
 from .defaults import DATABASE_PATH
 from sqlite3 import Binary
 
-from logging import getLogger
+from logging import getLogger, DEBUG
 from os.path import exists
 from os.path import expandvars
 from os.path import dirname
 from os import makedirs
-
-try:
-    from ConfigParser import ConfigParser
-    from ConfigParser import NoSectionError
-    from ConfigParser import NoOptionError
-except ImportError:
-    from configparser import ConfigParser  # pylint: disable=F0401,W0611
-    from configparser import NoSectionError  # pylint: disable=F0401
-    from configparser import NoOptionError  # pylint: disable=F0401
+from threading import local
 
 try:
     from MySQLdb import connect as mysql_connect
@@ -31,13 +30,11 @@ from sqlite3 import Error as SQLiteError
 from sqlite3 import connect as sqlite_connect
 from sync.gui import gui_utils
 
-WARNINGS_ENABLED = False
+#: prepared statements kept per connection
+CACHED_STATEMENTS = 100
 
-
-def warning_no_database_section(error):
-    if WARNINGS_ENABLED:
-        getLogger(__name__).warning("%s in '%s'",
-                                    error.message, SYNCINI_PATH)
+# sqlite connection of each thread
+_connections = local()
 
 
 class DatabaseError(Exception):
@@ -47,26 +44,28 @@ class DatabaseError(Exception):
     pass
 
 
+def get_config():
+    """
+    :return: the [database] section of sync.ini as a dictionary with 'type'
+    and, for sqlite, 'filename' or, for mysql, 'hostname'
+    """
+    config = {'type': get_option('database', 'type', 'sqlite')}
+    if config['type'] in ['sqlite', 'sqlite3']:
+        config['filename'] = get_option('database', 'filename', DATABASE_PATH)
+    else:
+        config['hostname'] = get_option('database', 'hostname', 'localhost')
+    return config
+
+
 def get_sql_log_dict():
     """
     get logging dictionary related to the database
     """
-    parser = ConfigParser()
-    parser.read(SYNCINI_PATH)
-    try:
-        dbtype = parser.get('database', 'type')
-    except (NoSectionError, NoOptionError) as error:
-        warning_no_database_section(error)
-
-        dbtype = "sqlite"
-    if dbtype in ['sqlite', 'sqlite3']:
-        try:
-            ip_address = parser.get('database', 'filename')
-        except (NoSectionError, NoOptionError) as error:
-            warning_no_database_section(error)
-            ip_address = DATABASE_PATH
+    config = get_config()
+    if config['type'] in ['sqlite', 'sqlite3']:
+        ip_address = config['filename']
     else:
-        ip_address = parser.get('database', 'hostname')
+        ip_address = config.get('hostname')
     return {'ip': ip_address, 'user': '', 'path': 'database/'}
 
 
@@ -79,15 +78,10 @@ def database_execute(command, params=None):
     @param params a list of tuple of values to substitute in command
     @returns a list of dictionaries representing the sql result
     """
-    getLogger(__name__).debug("database_execute(" + command + ", " +
-                              str(params) + ")", extra=get_sql_log_dict())
-    parser = ConfigParser()
-    parser.read(SYNCINI_PATH)
-    try:
-        dbtype = parser.get('database', 'type')
-    except (NoSectionError, NoOptionError) as error:
-        warning_no_database_section(error)
-        dbtype = 'sqlite'
+    logger = getLogger(__name__)
+    if logger.isEnabledFor(DEBUG):
+        logger.debug("database_execute(" + command + ", " + str(params) + ")", extra=get_sql_log_dict())
+    dbtype = get_config()['type']
 
     if dbtype == "mysql":
         if mysql_execute is None:
@@ -101,48 +95,99 @@ def database_execute(command, params=None):
         raise DatabaseError("Unknown database type, cannot continue")
 
 
-def sqlite_execute(command, params=None):
+def database_executemany(command, seq_of_params):
     """
-    Function to execute a sql statement on the mysql database. This function is
+    Execute one sql statement for every tuple of values in seq_of_params, in
+    a single transaction.
+    @param command the sql command to execute
+    @param seq_of_params a list of tuples of values to substitute in command
+    """
+    getLogger(__name__).debug("database_executemany(" + command + ")")
+    dbtype = get_config()['type']
+
+    if dbtype == "mysql":
+        if mysql_execute is None:
+            exit("Trying to use a MySQL database without python-MySQL module.")
+        return mysql_execute(command.replace('?', '%s'), seq_of_params, many=True)
+    elif dbtype in ["sqlite3", "sqlite"]:
+        return sqlite_execute(command, seq_of_params, many=True)
+    else:
+        raise DatabaseError("Unknown database type, cannot continue")
+
+
+def get_connection():
+    """
+    :return: the sqlite connection of the current thread, opened (and the
+    database created) on first use or when the configured file changed
+    """
+    filename = get_config().get('filename')
+    if not filename:
+        raise DatabaseError("Please configure the 'filename' parameter"
+                            " in the [database] section in the ini file")
+    connection = getattr(_connections, 'connection', None)
+    if connection is not None and _connections.filename == filename:
+        return connection
+    close_connection()
+
+    init_db = not exists(expandvars(filename))
+    # make sure the folder in which the database is saved exists
+    if init_db and dirname(filename) and not exists(dirname(filename)):
+        makedirs(dirname(filename))
+    connection = sqlite_connect(filename, cached_statements=CACHED_STATEMENTS)
+    connection.text_factory = Binary
+    try:
+        connection.execute('PRAGMA journal_mode=WAL')
+    except SQLiteError as error:
+        # ex: file systems without shared memory support
+        getLogger(__name__).warning('WAL mode not available for %s: %s', filename, error)
+    if init_db:
+        logo_path = "http://104.45.14.234/media/logos/penguin.jpg"
+        for sql in ('CREATE TABLE sites (site char(255), client_id'
+                    ' char(255), client_secret char(255), user char(255), token char(255));',
+                    'CREATE TABLE keys (site char(255), user char(255), fingerprint char(40));',
+                    'CREATE TABLE servers (label char(255), url char(255), picture blob);',
+                    'INSERT INTO servers (label, url, picture) VALUES ("PF-EUMAIN", "https://104.45.14.234:5001/", "{}");'.format(logo_path)
+                    ):
+            connection.execute(sql)
+        connection.commit()
+    _connections.connection = connection
+    _connections.filename = filename
+    return connection
+
+
+def close_connection():
+    """
+    Close the sqlite connection of the current thread, if any.
+    """
+    connection = getattr(_connections, 'connection', None)
+    _connections.connection = None
+    if connection is not None:
+        connection.close()
+
+
+def sqlite_execute(command, params=None, many=False):
+    """
+    Function to execute a sql statement on the sqlite database. This function is
     called by the database_execute function when the sqlite backend is set in
     the configuration file
     @param command the sql command to execute
     @param params a list of tuple of values to substitute in command
+    @param many whether params is a list of tuples to execute command for each
     @returns a list of dictionaries representing the sql result
     """
-    # NOTE mostly copypasta'd from mysql_execute, may be a better way
     try:
-        parser = ConfigParser()
-        parser.read(SYNCINI_PATH)
+        connection = get_connection()
         try:
-            filename = parser.get('database', 'filename')
-        except (NoSectionError, NoOptionError) as error:
-            warning_no_database_section(error)
-            filename = DATABASE_PATH
-
-        init_db = not exists(expandvars(filename))
-        # make sure the folder in which the database is saved exists
-        if init_db and not exists(dirname(filename)):
-            makedirs(dirname(filename))
-        connection = sqlite_connect(filename)
-        connection.text_factory = Binary
-        cursor = connection.cursor()
-        logo_path = "http://104.45.14.234/media/logos/penguin.jpg"
-        if init_db:
-            for sql in ('CREATE TABLE sites (site char(255), client_id'
-                        ' char(255), client_secret char(255), user char(255), token char(255));',
-                        'CREATE TABLE keys (site char(255), user char(255), fingerprint char(40));',
-                        'CREATE TABLE servers (label char(255), url char(255), picture blob);',
-                        'INSERT INTO servers (label, url, picture) VALUES ("PF-EUMAIN", "https://104.45.14.234:5001/", "{}");'.format(logo_path)
-                        ):
-                if sql != "" and sql is not None:
-                    cursor.execute(sql)
-                    connection.commit()
-        if params:
-            cursor.execute(command, params)
-        else:
-            cursor.execute(command)
-        connection.commit()
+            if many:
+                cursor = connection.executemany(command, params)
+            elif params:
+                cursor = connection.execute(command, params)
+            else:
+                cursor = connection.execute(command)
+            connection.commit()
+        except SQLiteError:
+            connection.rollback()
+            raise
 
         final_result = []
         for l in cursor.fetchall():
@@ -151,43 +196,35 @@ def sqlite_execute(command, params=None):
     except SQLiteError as sqlerror:
         getLogger(__name__).exception(sqlerror)
         raise DatabaseError("SQLite Error: %s" % (sqlerror.args[0]))
-    except (NoSectionError, NoOptionError) as error:
-        getLogger(__name__).exception(error)
-        raise DatabaseError("Please configure the database section"
-                            " in the ini file")
     except TypeError as error:
         getLogger(__name__).exception(error)
         raise DatabaseError("Please configure the 'filename' parameter"
                             " in the [database] section in the ini file")
-    finally:
-        try:
-            if connection:
-                connection.close()
-        except UnboundLocalError as error:
-            getLogger(__name__).exception(error)
 
 
-def mysql_execute(command, params=None):
+def mysql_execute(command, params=None, many=False):
     """
     Function to execute a sql statement on the mysql database. This function is
     called by the database_execute function when the mysql backend is set in
     the configuration file.
     @param command the sql command to execute
     @param params a list of tuple of values to substitute in command
+    @param many whether params is a list of tuples to execute command for each
     @returns a list of dictionaries representing the sql result
     """
-    parser = ConfigParser()
-    parser.read(SYNCINI_PATH)
     try:
-        host = parser.get('database', 'hostname')
-        user = parser.get('database', 'username')
-        pawd = parser.get('database', 'password')
-        dbse = parser.get('database', 'database')
-        port = parser.getint('database', 'port')
+        host = get_option('database', 'hostname', 'localhost')
+        user = get_option('database', 'username', '')
+        pawd = get_option('database', 'password', '')
+        dbse = get_option('database', 'database', '')
+        port = get_option('database', 'port', 3306)
         connection = mysql_connect(host=host, port=port, user=user,
                                    passwd=pawd, db=dbse)
         cursor = connection.cursor()
-        cursor.execute(command, params)
+        if many:
+            cursor.executemany(command, params)
+        else:
+            cursor.execute(command, params)
         connection.commit()
         return cursor.fetchall()
     except MySQLError as mysqlerror:
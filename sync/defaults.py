@@ -29,7 +29,87 @@ DEFAULT_LANGUAGE = 'ENGLISH'
 LOCALBOX_EXTENSION = '.lox'
 
 OLD_SYNC_STATUS = join(APPDIR, 'localbox.pickle.')
+REMOTE_SYNC_STATUS = join(APPDIR, 'localbox.remote.pickle.')
 LOCALBOX_OPENFILES = join(APPDIR, 'openfiles.pickle')
+LOCALBOX_TRANSFERS = join(APPDIR, 'transfers.pickle')
+STAT_CACHE = join(APPDIR, 'statcache.')
+CHANGE_JOURNAL = join(APPDIR, 'journal.')
+HASH_CACHE = join(APPDIR, 'hashcache.pickle')
+AUTHENTICATION_URLS = join(APPDIR, 'authentication_urls.pickle')
+
+#: Whether directory listings are kept between scans of the sync folder ('stat_cache' in the [sync] section of
+#: sync.ini)
+STAT_CACHE_ENABLED = True
+
+#: Whether a sync only looks at the local paths in the change journal kept by the watchdog, instead of scanning the
+#: whole sync folder ('incremental_sync' in the [sync] section of sync.ini)
+INCREMENTAL_SYNC = True
+
+#: Paths kept in the change journal of a sync; when it overflows the next sync scans the whole sync folder
+#: ('journal_max_entries' in the [sync] section of sync.ini)
+JOURNAL_MAX_ENTRIES = 10000
+
+#: Seconds paths appended to the change journals wait to be written and synced to disk together
+JOURNAL_COMMIT_DELAY = 0.05
+
+#: Hashes of decrypted files kept between syncs ('hash_cache_size' in the [sync] section of sync.ini)
+HASH_CACHE_SIZE = 10000
+
+#: hashlib algorithm used to tell whether a decrypted file changed ('hash_algorithm' in the [sync] section of
+#: sync.ini, ex: 'md5' or 'sha1' for faster hashing)
+HASH_ALGORITHM = 'sha256'
+
+#: Seconds changes to the registry of opened files are kept in memory before they are written together
+OPENFILES_SAVE_DELAY = 1
+
+#: Seconds changes to the state of interrupted transfers are kept in memory before they are written together
+TRANSFERS_SAVE_DELAY = 1
+
+#: Extension of downloads in progress, next to the final '.lox' file
+PARTIAL_EXTENSION = '.part'
+
+#: Levels of the remote tree requested per lox_api/meta call, -1 for all of them
+META_DEPTH = -1
+
+#: Concurrent lox_api/meta calls when crawling the remote tree ('meta_workers' in the [sync] section of sync.ini)
+META_WORKERS = 4
+
+#: Idle keep-alive connections kept per server ('http_pool_size' in the [sync] section of sync.ini)
+HTTP_POOL_SIZE = 4
+
+#: Concurrent uploads, downloads, deletes and directory creations of one sync ('transfer_workers' in the [sync]
+#: section of sync.ini)
+TRANSFER_WORKERS = 4
+
+#: Bytes read and written at a time when transferring files (a multiple of the AES block size)
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+
+#: Seconds a decrypted share key stays cached ('key_cache_ttl' in the [sync] section of sync.ini, 0 disables the cache)
+KEY_CACHE_TTL = 300
+
+#: Maximum number of cached share keys ('key_cache_size' in the [sync] section of sync.ini)
+KEY_CACHE_SIZE = 256
+
+#: Concurrent lox_api/key calls and decryptions when fetching the keys for a sync ('key_workers' in the [sync] section
+#: of sync.ini)
+KEY_WORKERS = 4
+
+#: How key material is decrypted: 'subprocess' (gpg binary per call) or 'inprocess' (PGPy)
+#: ('gpg_backend' in the [sync] section of sync.ini)
+GPG_BACKEND = 'subprocess'
+
+#: Seconds before the access token expires that it is renewed ('token_refresh_margin' in the [sync] section of
+#: sync.ini)
+TOKEN_REFRESH_MARGIN = 60
+
+#: Seconds the authentication url of a server is used without asking the server again ('authentication_url_ttl' in
+#: the [sync] section of sync.ini)
+AUTHENTICATION_URL_TTL = 24 * 60 * 60
+
+#: Seconds to connect to a server and to wait for its answer to a heartbeat ('heartbeat_connect_timeout' and
+#: 'heartbeat_read_timeout' in the [sync] section of sync.ini)
+HEARTBEAT_CONNECT_TIMEOUT = 5
+HEARTBEAT_READ_TIMEOUT = 10
 
 #: If the call fails because of HTTP 401, reauthenticate and retry the call this amount of times
 MAX_AUTH_RETRIES = 5
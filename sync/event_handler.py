@@ -15,9 +15,10 @@ from watchdog.observers import Observer
 
 import sync.defaults as defaults
 from loxcommon import os_utils
-from sync.controllers import openfiles_ctrl
+from sync.controllers import journal_ctrl, openfiles_ctrl
 from sync.controllers.login_ctrl import LoginController
-from sync.localbox import get_localbox_path, LocalBox
+from sync.client_registry import get_localbox
+from sync.localbox import get_localbox_path
 
 
 def log_exception(f):
@@ -37,6 +38,19 @@ class LocalBoxEventHandler(LoggingEventHandler):
     def __init__(self, localbox_client):
         self.localbox_client = localbox_client
 
+    def _journal(self, event, *filesystem_paths):
+        """
+        Add the paths of an event to the change journal of this sync, so the
+        next sync looks at them, whatever is done with the event here.
+        """
+        if event.is_directory and event.event_type == 'modified':
+            # a changed directory listing: the entries that changed have events of their own
+            return
+        paths = [get_localbox_path(self.localbox_client.path, filesystem_path)
+                 for filesystem_path in filesystem_paths if not _is_partial_download(filesystem_path)]
+        if paths:
+            journal_ctrl.append(self.localbox_client.label, *paths)
+
     @log_exception
     def on_moved(self, event):
         """
@@ -47,6 +61,11 @@ class LocalBoxEventHandler(LoggingEventHandler):
         :return:
         """
         super(LocalBoxEventHandler, self).on_moved(event)
+        self._journal(event, event.src_path, event.dest_path)
+
+        if _is_partial_download(event.src_path):
+            getLogger(__name__).debug('on_moved ignored, finished download: %s' % event.dest_path)
+            return
 
         passphrase = LoginController().get_passphrase(self.localbox_client.label)
 
@@ -72,6 +91,7 @@ class LocalBoxEventHandler(LoggingEventHandler):
     @log_exception
     def on_created(self, event):
         super(LocalBoxEventHandler, self).on_created(event)
+        self._journal(event, event.src_path)
 
         if event.is_directory:
             self.localbox_client.create_directory(get_localbox_path(self.localbox_client.path, event.src_path))
@@ -85,6 +105,7 @@ class LocalBoxEventHandler(LoggingEventHandler):
     @log_exception
     def on_deleted(self, event):
         super(LocalBoxEventHandler, self).on_deleted(event)
+        self._journal(event, event.src_path)
 
         if _should_delete_file(event, self.localbox_client):
             self.localbox_client.delete(get_localbox_path(self.localbox_client.path, event.src_path))
@@ -96,6 +117,7 @@ class LocalBoxEventHandler(LoggingEventHandler):
     @log_exception
     def on_modified(self, event):
         super(LocalBoxEventHandler, self).on_modified(event)
+        self._journal(event, event.src_path)
 
         if _should_modify_file(event.src_path):
             self.localbox_client.upload_file(fs_path=event.src_path,
@@ -106,17 +128,23 @@ class LocalBoxEventHandler(LoggingEventHandler):
             getLogger(__name__).debug('on_modified ignored: %s' % event.src_path)
 
 
+def _is_partial_download(path):
+    return path.endswith(defaults.LOCALBOX_EXTENSION + defaults.PARTIAL_EXTENSION)
+
+
 def _should_upload_file(path):
-    return exists(path) and not path.endswith(defaults.LOCALBOX_EXTENSION) and os.path.getsize(
-        path) > 0 and path not in openfiles_ctrl.load() and isfile(path)
+    return not _is_partial_download(path) and exists(path) and not path.endswith(
+        defaults.LOCALBOX_EXTENSION) and os.path.getsize(path) > 0 and not openfiles_ctrl.contains(path) and isfile(path)
 
 
 def _should_modify_file(path):
-    return exists(path) and not path.endswith(defaults.LOCALBOX_EXTENSION) and isfile(path) and os.path.getsize(
-        path) > 0 and os_utils.hash_file(path) != openfiles_ctrl.get_hash(path)
+    return not _is_partial_download(path) and exists(path) and not path.endswith(
+        defaults.LOCALBOX_EXTENSION) and isfile(path) and os.path.getsize(path) > 0 and openfiles_ctrl.is_modified(path)
 
 
 def _should_delete_file(event, localbox_client):
+    if _is_partial_download(event.src_path):
+        return False
     if os_utils.is_windows():
         # The watchdog library has a bug on event.is_directory: https://github.com/gorakhargosh/watchdog/issues/92
         # so everything else is false we'll ask the backend for help
@@ -131,13 +159,14 @@ def create_watchdog(sync_item):
     try:
         url = sync_item.url
         label = sync_item.label
-        localbox_client = LocalBox(url, label, sync_item.path)
+        localbox_client = get_localbox(url, label, sync_item.path)
 
         event_handler = LocalBoxEventHandler(localbox_client)
         observer = Observer()
         observer.setName('th-evt-%s' % sync_item.label)
         observer.schedule(event_handler, localbox_client.path, recursive=True)
         observer.start()
+        journal_ctrl.watch(label)
         getLogger(__name__).info('started watchdog for %s' % sync_item.path)
     except NoOptionError as error:
         getLogger(__name__).exception(error)
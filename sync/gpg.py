@@ -1,5 +1,12 @@
+from sync import defaults
+from sync.config import get_option
 from sync.database import database_execute, DatabaseError
+from copy import copy
+from hashlib import sha256
+from itertools import chain
 from logging import getLogger
+from threading import Lock
+from time import time
 from gnupg import GPG
 from os.path import join
 from os.path import isfile
@@ -13,6 +20,12 @@ except ImportError:
     from configparser import ConfigParser  # pylint: disable=F0401
     from io import StringIO
 
+try:
+    from pgpy import PGPKey, PGPMessage
+    from pgpy.errors import PGPDecryptionError, PGPError
+except ImportError:
+    PGPKey = None
+
 from distutils.sysconfig import project_base
 from distutils.spawn import find_executable
 
@@ -195,6 +208,126 @@ class gpg(object):
         return contents[0:(len(contents) - bytes_to_remove)]
 
 
+class InProcessGpg(gpg):
+    """
+    gpg that decrypts in this process with PGPy instead of starting the gpg
+    binary for every call. The secret keys are exported from the gpg keyring
+    once and kept in memory, unlocked per passphrase for 'key_cache_ttl'
+    seconds (see sync.ini): unlocking costs the passphrase's key derivation,
+    far more than the decryption itself. :py:meth:`forget` drops them, ex: on
+    logout. All other operations go through the gpg binary as before.
+
+    The lock is only held while a key is exported and unlocked; decrypting
+    with an unlocked key does not change it, so decryptions run in parallel.
+    """
+
+    # exported secret keys, shared by all instances: key id -> PGPKey, protected by its passphrase
+    _secret_keys = dict()
+    # (key id, passphrase hash) -> (unlocked copy of the PGPKey in _secret_keys, time it expires)
+    _unlocked_keys = dict()
+    _secret_keys_lock = Lock()
+
+    def decrypt(self, data, passphrase):
+        """
+        decrypt data received from site.
+        """
+        try:
+            message = PGPMessage.from_blob(data)
+            key = self._get_unlocked_key(message.encrypters, passphrase)
+            if key is None:
+                getLogger(__name__).error('no secret key for %s', ', '.join(message.encrypters))
+                return ''
+            result = key.decrypt(message).message
+        except (PGPError, PGPDecryptionError, ValueError, NotImplementedError) as error:
+            getLogger(__name__).error('in-process decryption failed: %s', error)
+            return ''
+        return bytes(result) if isinstance(result, (bytes, bytearray)) else result.encode('utf8')
+
+    def _get_unlocked_key(self, key_ids, passphrase):
+        """
+        :return: the secret key of one of key_ids unlocked with passphrase, None
+        when the keyring has none. Raises PGPDecryptionError for a wrong passphrase.
+        """
+        passphrase_hash = sha256(passphrase.encode('utf8') if not isinstance(passphrase, bytes)
+                                 else passphrase).digest()
+        now = time()
+        with self._secret_keys_lock:
+            # expired keys are dropped, not wiped: a decryption may still be using them
+            for cache_key in [cache_key for cache_key, entry in self._unlocked_keys.items() if entry[1] <= now]:
+                del self._unlocked_keys[cache_key]
+            for key_id in key_ids:
+                entry = self._unlocked_keys.get((key_id, passphrase_hash))
+                if entry is not None:
+                    return entry[0]
+
+            key = self._get_secret_key(key_ids, passphrase)
+            if key is None:
+                return None
+            # PGPKey.unlock locks the key again when its block ends, unprotect the copy for good
+            unlocked = copy(key)
+            for secret_key in chain([unlocked], unlocked.subkeys.values()):
+                secret_key._key.unprotect(passphrase)  # pylint: disable=W0212
+            ttl = get_option('sync', 'key_cache_ttl', defaults.KEY_CACHE_TTL)
+            if ttl > 0:
+                for key_id in chain([key.fingerprint.keyid], key.subkeys.keys()):
+                    self._unlocked_keys[(key_id, passphrase_hash)] = (unlocked, now + ttl)
+            return unlocked
+
+    @classmethod
+    def forget(cls):
+        """
+        Drop the secret keys kept in memory and wipe the unlocked ones, ex:
+        when the user logs out or a passphrase is removed or changed.
+        """
+        with cls._secret_keys_lock:
+            unlocked_keys = set(entry[0] for entry in cls._unlocked_keys.values())
+            cls._unlocked_keys.clear()
+            cls._secret_keys.clear()
+            for unlocked in unlocked_keys:
+                for secret_key in chain([unlocked], unlocked.subkeys.values()):
+                    secret_key._key.keymaterial.clear()  # pylint: disable=W0212
+        getLogger(__name__).debug('forgot the secret keys kept in memory')
+
+    def _get_secret_key(self, key_ids, passphrase):
+        """
+        :return: the secret key of one of key_ids, still protected by its
+        passphrase, exported from the keyring on first use. Call with
+        _secret_keys_lock held.
+        """
+        for key_id in key_ids:
+            if key_id in self._secret_keys:
+                return self._secret_keys[key_id]
+
+        for secret_key in self.gpg.list_keys(True):
+            ids = [secret_key['keyid']] + [subkey[0] for subkey in secret_key.get('subkeys', [])]
+            if not set(ids) & set(key_ids):
+                continue
+            exported = self.gpg.export_keys(secret_key['fingerprint'], True, armor=False, passphrase=passphrase)
+            if not exported:
+                return None
+            key, _ = PGPKey.from_blob(exported)
+            for key_id in ids:
+                self._secret_keys[key_id] = key
+            return key
+        return None
+
+
+def get_gpg(folder_path=None, binary_path=None):
+    """
+    Get the gpg backend configured with 'gpg_backend' in the [sync] section
+    of sync.ini: 'subprocess' (the default) runs the gpg binary for every
+    call, 'inprocess' decrypts with :py:class:`InProcessGpg`.
+    """
+    backend = get_option('sync', 'gpg_backend', defaults.GPG_BACKEND)
+    if backend == 'inprocess':
+        if PGPKey is not None:
+            return InProcessGpg(folder_path, binary_path)
+        getLogger(__name__).warning("gpg_backend 'inprocess' needs PGPy, using 'subprocess'")
+    elif backend != 'subprocess':
+        getLogger(__name__).warning("unknown gpg_backend '%s', using 'subprocess'", backend)
+    return gpg(folder_path, binary_path)
+
+
 if __name__ == '__main__':
     import doctest
 
@@ -20,7 +20,8 @@ from sync.gui.gui_utils import MAIN_FRAME_SIZE, MAIN_PANEL_SIZE, \
     MAIN_TITLE, DEFAULT_BORDER, PASSPHRASE_DIALOG_SIZE, PASSPHRASE_TITLE
 from sync.gui.wizard import NewSyncWizard
 from sync.language import LANGUAGES, set_language
-from sync.localbox import LocalBox, InvalidLocalBoxPathError, get_localbox_path, remove_decrypted_files
+from sync.client_registry import get_localbox
+from sync.localbox import InvalidLocalBoxPathError, get_localbox_path, remove_decrypted_files
 from sync.notif.notifs import Notifs
 
 
@@ -909,7 +910,7 @@ class NewSharePanel(wx.Panel):
     @property
     def localbox_client(self):
         localbox_item = localbox_ctrl.ctrl.get(self.selected_localbox)
-        return LocalBox(url=localbox_item.url, label=localbox_item.label, path=localbox_item.path)
+        return get_localbox(url=localbox_item.url, label=localbox_item.label, path=localbox_item.path)
 
     @property
     def localbox_path(self):
@@ -1005,7 +1006,7 @@ class ShareEditPanel(wx.Panel):
     @property
     def localbox_client(self):
         localbox_item = localbox_ctrl.ctrl.get(self.share.label)
-        return LocalBox(url=localbox_item.url, label=localbox_item.label, path=localbox_item.path)
+        return get_localbox(url=localbox_item.url, label=localbox_item.label, path=localbox_item.path)
 
 
 class ShareAddUserPanel(wx.Panel):
@@ -1070,7 +1071,7 @@ class ShareAddUserPanel(wx.Panel):
     @property
     def localbox_client(self):
         localbox_item = localbox_ctrl.ctrl.get(self.share.label)
-        return LocalBox(url=localbox_item.url, label=localbox_item.label, path=localbox_item.path)
+        return get_localbox(url=localbox_item.url, label=localbox_item.label, path=localbox_item.path)
 
 
 class PasshphrasePanel(wx.Panel):
@@ -0,0 +1,187 @@
+"""
+Content hashes of the decrypted files, kept between calls and restarts of the
+client.
+
+Whether a decrypted file changed is decided by comparing its hash with the
+one registered in :py:mod:`sync.controllers.openfiles_ctrl` when it was
+opened, for every file of every sync and for every watchdog event. A hash is
+kept with the size, mtime (in nanoseconds) and inode of the file it was
+computed from, and only computed again when one of those changed. Files are
+hashed in chunks of defaults.TRANSFER_CHUNK_SIZE bytes, with the
+'hash_algorithm' of sync.ini: any algorithm of hashlib, ex: 'md5' or 'sha1'
+are faster than the default 'sha256'.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock
+from time import time
+
+try:
+    from cPickle import dump, load, HIGHEST_PROTOCOL
+except ImportError:
+    from pickle import dump, load, HIGHEST_PROTOCOL
+
+from sync import defaults
+from sync.config import get_option
+
+#: seconds a file must have been unchanged when it was hashed before the hash
+#: is kept: changes in the same mtime tick would go unnoticed
+RACY_INTERVAL = 2
+
+#: seconds between two saves of the cache while hashing, it is saved after every sync as well
+SAVE_INTERVAL = 60
+
+
+class HashCache(object):
+    """
+    Thread-safe cache of file hashes with LRU eviction, keyed by path and
+    validated by (size, mtime_ns, inode).
+    """
+
+    def __init__(self, filename, max_size, algorithm):
+        """
+        :param filename: file the cache is kept in
+        :param max_size: maximum number of hashes kept
+        :param algorithm: name of a hashlib algorithm
+        """
+        self.filename = filename
+        self.max_size = max_size
+        self.algorithm = algorithm
+        self.hits = 0
+        self.misses = 0
+        # path -> (size, mtime_ns, inode, algorithm, hex digest)
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._changed = False
+        self._saved_at = time()
+
+    def load(self):
+        try:
+            with open(self.filename, 'rb') as cache_file:
+                entries = load(cache_file)
+        except (IOError, EOFError, ValueError, TypeError) as error:
+            getLogger(__name__).debug('no hash cache in %s: %s', self.filename, error)
+            entries = OrderedDict()
+        with self._lock:
+            self._entries = entries
+            self._changed = False
+        return self
+
+    def save(self):
+        """
+        Write the cache when it changed, to a temporary file that replaces the
+        previous one.
+        """
+        with self._lock:
+            if not self._changed:
+                return
+            entries = OrderedDict(self._entries)
+            self._changed = False
+            self._saved_at = time()
+        temporary = self.filename + '.tmp'
+        try:
+            with open(temporary, 'wb') as cache_file:
+                dump(entries, cache_file, HIGHEST_PROTOCOL)
+            if os.path.exists(self.filename) and os.name == 'nt':
+                os.remove(self.filename)
+            os.rename(temporary, self.filename)
+        except (IOError, OSError) as error:
+            getLogger(__name__).warning('could not save the hash cache %s: %s', self.filename, error)
+
+    def hash_file(self, path):
+        """
+        :return: the hex digest of the contents of path, from the cache when
+        the file did not change since it was hashed
+        """
+        stats = os.stat(path)
+        signature = (stats.st_size, _mtime_ns(stats), stats.st_ino, self.algorithm)
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None and entry[:4] == signature:
+                # most recently used entries go last
+                self._entries[path] = entry
+                self.hits += 1
+                return entry[4]
+            self.misses += 1
+
+        digest = hash_stream(path, self.algorithm)
+        if time() - stats.st_mtime <= RACY_INTERVAL:
+            return digest
+
+        with self._lock:
+            self._entries[path] = signature + (digest,)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._changed = True
+            save = time() - self._saved_at > SAVE_INTERVAL
+        if save:
+            self.save()
+        return digest
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def hash_stream(path, algorithm, chunk_size=None):
+    """
+    :return: the hex digest of the contents of path, read chunk_size bytes
+    (defaults.TRANSFER_CHUNK_SIZE by default) at a time
+    """
+    digest = hashlib.new(algorithm)
+    chunk_size = chunk_size or defaults.TRANSFER_CHUNK_SIZE
+    with open(path, 'rb') as hashed_file:
+        chunk = hashed_file.read(chunk_size)
+        while chunk:
+            digest.update(chunk)
+            chunk = hashed_file.read(chunk_size)
+    return digest.hexdigest()
+
+
+def _mtime_ns(stats):
+    mtime_ns = getattr(stats, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        # python 2 only has the float
+        mtime_ns = int(stats.st_mtime * 1000000000)
+    return mtime_ns
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def get_hash_cache():
+    """
+    :return: the process-wide :py:class:`HashCache`, sized by 'hash_cache_size'
+    in the [sync] section of sync.ini and hashing with its 'hash_algorithm'
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            algorithm = get_option('sync', 'hash_algorithm', defaults.HASH_ALGORITHM)
+            try:
+                hashlib.new(algorithm)
+            except ValueError:
+                getLogger(__name__).warning("unknown hash_algorithm '%s', using %s",
+                                            algorithm, defaults.HASH_ALGORITHM)
+                algorithm = defaults.HASH_ALGORITHM
+            _cache = HashCache(defaults.HASH_CACHE,
+                               get_option('sync', 'hash_cache_size', defaults.HASH_CACHE_SIZE),
+                               algorithm).load()
+        return _cache
+
+
+def hash_file(path):
+    """
+    Hash a file, see :py:meth:`HashCache.hash_file`.
+    """
+    return get_hash_cache().hash_file(path)
+
+
+def save():
+    """
+    Save the process-wide cache if it was used.
+    """
+    if _cache is not None:
+        _cache.save()
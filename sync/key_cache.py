@@ -0,0 +1,116 @@
+"""
+Cache of the decrypted (key, iv) pairs of the LocalBox shares.
+
+Fetching a key costs a lox_api/key call and two gpg decryptions, while all
+files below the same keys path (see ``os_utils.get_keys_path``) share one
+key. Entries are kept per label and keys path for a limited time, the least
+recently used ones are evicted when the cache is full. The key material is
+held in bytearrays that are overwritten with zeros when an entry leaves the
+cache.
+"""
+from collections import OrderedDict
+from hashlib import sha256
+from logging import getLogger
+from threading import Lock
+from time import time
+
+from sync import defaults
+from sync.config import get_option
+
+
+class KeyCache(object):
+    """
+    Thread-safe TTL cache with LRU eviction, keyed by (label, keys_path).
+    """
+
+    def __init__(self, ttl, max_size):
+        """
+        :param ttl: seconds an entry stays valid
+        :param max_size: maximum number of entries
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, label, keys_path, passphrase):
+        """
+        :return: (key, iv) or None when not cached, expired or cached with another passphrase
+        """
+        with self._lock:
+            entry = self._entries.pop((label, keys_path), None)
+            if entry is None:
+                self.misses += 1
+                return None
+            key, iv, passphrase_hash, expires_at = entry
+            if expires_at <= time() or passphrase_hash != _hash_passphrase(passphrase):
+                _wipe(key, iv)
+                self.misses += 1
+                return None
+            # most recently used entries go last
+            self._entries[(label, keys_path)] = entry
+            self.hits += 1
+            return bytes(key), bytes(iv)
+
+    def set(self, label, keys_path, passphrase, key, iv):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        entry = (bytearray(key), bytearray(iv), _hash_passphrase(passphrase), time() + self.ttl)
+        with self._lock:
+            old_entry = self._entries.pop((label, keys_path), None)
+            if old_entry is not None:
+                _wipe(*old_entry[:2])
+            self._entries[(label, keys_path)] = entry
+            while len(self._entries) > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                _wipe(*evicted[:2])
+
+    def invalidate(self, label=None):
+        """
+        Forget the keys of one label, or all keys when label is None.
+        """
+        with self._lock:
+            for cache_key in list(self._entries):
+                if label is None or cache_key[0] == label:
+                    _wipe(*self._entries.pop(cache_key)[:2])
+        getLogger(__name__).debug('invalidated cached keys of %s', 'all labels' if label is None else label)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _hash_passphrase(passphrase):
+    if not isinstance(passphrase, bytes):
+        passphrase = passphrase.encode('utf8')
+    return sha256(passphrase).digest()
+
+
+def _wipe(key, iv):
+    key[:] = b'\0' * len(key)
+    iv[:] = b'\0' * len(iv)
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def get_key_cache():
+    """
+    :return: the process-wide :py:class:`KeyCache`, sized by 'key_cache_ttl'
+    and 'key_cache_size' in the [sync] section of sync.ini
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = KeyCache(get_option('sync', 'key_cache_ttl', defaults.KEY_CACHE_TTL),
+                              get_option('sync', 'key_cache_size', defaults.KEY_CACHE_SIZE))
+        return _cache
+
+
+def invalidate(label=None):
+    """
+    Forget cached keys, see :py:meth:`KeyCache.invalidate`.
+    """
+    get_key_cache().invalidate(label)
@@ -6,31 +6,32 @@ import errno
 import hashlib
 import re
 import os
-from _ssl import PROTOCOL_TLSv1_2
 from base64 import b64decode
 from base64 import b64encode
 from json import dumps
 from json import loads
 from logging import getLogger
 from os import stat
+from time import time
 from socket import error as SocketError
-from ssl import SSLContext  # pylint: disable=E0611
 
 from Crypto.Cipher.AES import MODE_CFB
 from Crypto.Cipher.AES import new as AES_Key
 from Crypto.Random import new as CryptoRandom
 
 from loxcommon import os_utils
-from sync import defaults
+from sync import connection_pool, defaults, key_cache
 from sync.auth import Authenticator, AlreadyAuthenticatedError
+from sync.config import get_option
+from sync.controllers import transfers_ctrl
 from sync.controllers.login_ctrl import LoginController
-from sync.gpg import gpg
+from sync.gpg import gpg, get_gpg
 from sync.notif.notifs import Notifs
+from sync.workers import map_threaded
 
 try:
     from urllib2 import HTTPError, URLError
     from urllib2 import Request
-    from urllib2 import urlopen
     from urllib import urlencode
     from urllib import quote_plus
     from httplib import BadStatusLine
@@ -39,7 +40,6 @@ except ImportError:
     from urllib.error import HTTPError  # pylint: disable=F0401,E0611
     from urllib.parse import quote_plus  # pylint: disable=F0401,E0611
     from urllib.parse import urlencode  # pylint: disable=F0401,E0611
-    from urllib.request import urlopen  # pylint: disable=F0401,E0611
     from urllib.request import Request  # pylint: disable=F0401,E0611
     from http.client import BadStatusLine  # pylint: disable=F0401,E0611
     from configparser import ConfigParser  # pylint: disable=F0401,E0611
@@ -59,20 +59,31 @@ class LocalBox(object):
     object representing localbox
     """
 
-    def __init__(self, url, label, path):
+    def __init__(self, url, label, path, authentication_url=None, timeout=None):
         """
+        Use :py:func:`sync.client_registry.get_localbox` to get the client
+        shared by the process instead.
 
         :param url:
         :param label:
         :param path: filesystem path for the LocalBox, ex: /home/john/my_localbox
+        :param authentication_url: url of the authentication server, asked to the server when None
+        :param timeout: seconds, or (connect, read) seconds, to wait for the server when asking it
         """
         if url[-1] != '/':
             url += "/"
         self.url = url
         self.label = label
         self.path = path
-        self._authentication_url = None
-        self._authentication_url = self.get_authentication_url()
+        self._authentication_url = authentication_url
+        self._authentication_url = self.get_authentication_url(timeout)
+        # whether the server accepts upload sessions and raw uploads, None until known
+        self._upload_sessions = None
+        self._raw_upload = None
+        # whether the server answers lox_api/keys, None until known
+        self._batch_keys = None
+        # whether the server answers lox_api/changes, None until known
+        self._changes = None
         self._authenticator = Authenticator(self._authentication_url, label)
 
     @property
@@ -83,17 +94,21 @@ class LocalBox(object):
     def username(self):
         return self._authenticator.username
 
-    def get_authentication_url(self):
+    def get_authentication_url(self, timeout=None):
         """
         return an authentication url belonging to a localbox instance.
+
+        :param timeout: seconds, or (connect, read) seconds, to wait for the server
         """
         if self._authentication_url is not None:
             return self._authentication_url
         else:
             try:
-                non_verifying_context = SSLContext(PROTOCOL_TLSv1_2)
                 getLogger(__name__).debug("validating localbox server: %s" % self.url)
-                urlopen(self.url, context=non_verifying_context)
+                if timeout is None:
+                    connection_pool.urlopen(Request(self.url))
+                else:
+                    connection_pool.urlopen(Request(self.url), timeout=timeout)
             except BadStatusLine as error:
                 getLogger(__name__).exception(error)
                 raise error
@@ -115,12 +130,18 @@ class LocalBox(object):
                         bearer = True
         raise AlreadyAuthenticatedError()
 
-    def _make_call(self, request, retry_count=1):
+    def _make_call(self, request, retry_count=1, stream=False, timeout=None):
         """
-        Do the actual call to the server with authentication data.
+        Do the actual call to the server with authentication data. When the
+        token is refused (HTTP 401) it is renewed, once for all the calls that
+        were refused the same token (see
+        :py:meth:`sync.auth.Authenticator.reauthenticate`), and the call is
+        retried with the new one.
 
         :param request:
         :param retry_count: counts the amount of retries.
+        :param stream: if True the body is not read in advance, see :py:func:`sync.connection_pool.urlopen`
+        :param timeout: seconds, or (connect, read) seconds, see :py:func:`sync.connection_pool.urlopen`
         :return:
         """
         auth_header = self.authenticator.get_authorization_header()
@@ -129,25 +150,36 @@ class LocalBox(object):
         getLogger(__name__).debug('_make_call: %s' % request.get_full_url())
         getLogger(__name__).debug('_make_call auth header: %s' % auth_header)
         request.add_header('Authorization', auth_header)
-        non_verifying_context = SSLContext(PROTOCOL_TLSv1_2)
 
+        options = {'stream': stream}
+        if timeout is not None:
+            options['timeout'] = timeout
         try:
-            return urlopen(request, context=non_verifying_context)
+            return connection_pool.urlopen(request, **options)
         except HTTPError as error:
             if hasattr(error, 'code'):
                 if error.code == 401:
                     if retry_count <= defaults.MAX_AUTH_RETRIES:
                         # getLogger(__name__).info('Error authenticating client, retry number %s: request %s' % (retry_count, request))
-                        self.authenticator.authenticate_with_client_secret()
-                        return self._make_call(request, retry_count + 1)
+                        self.authenticator.reauthenticate(auth_header[len('Bearer '):])
+                        return self._make_call(request, retry_count + 1, stream, timeout)
             raise error
 
-    def get_meta(self, path=''):
+    def get_meta(self, path='', depth=None):
         """
         do the meta call
+
+        :param path:
+        :param depth: how many levels of children to return, -1 for the whole
+        subtree. Servers that support it answer with a 'depth' field and give
+        every listed directory its own 'children'. Older servers ignore it and
+        return one level.
         """
-        request = Request(url=self.url + 'lox_api/meta', data=dumps({'path': path}))
-        getLogger(__name__).debug('calling lox_api/meta for path: %s' % path)
+        data = {'path': path}
+        if depth is not None:
+            data['depth'] = depth
+        request = Request(url=self.url + 'lox_api/meta', data=dumps(data))
+        getLogger(__name__).debug('calling lox_api/meta for path: %s, depth: %s' % (path, depth))
         try:
             result = self._make_call(request)
             json_text = result.read()
@@ -159,18 +191,117 @@ class LocalBox(object):
                 getLogger(__name__).exception(error)
                 raise error
 
-    def get_file(self, path=''):
+    def get_changes(self, cursor=None):
+        """
+        Ask the server what changed since a cursor, with lox_api/changes.
+        {'cursor': cursor} is answered with {'cursor': next cursor, 'changes':
+        [change, ...], 'has_more': bool}, where a change is {'path',
+        'deleted': true} or an entry as in a lox_api/meta answer ({'path',
+        'is_dir', 'modified_at', 'size'}), in the order the changes happened.
+        Without a cursor the server only hands out its current cursor. Answers
+        with 'has_more' set are followed by a call with the next cursor.
+
+        :param cursor: cursor handed out by a previous call
+        :return: (changes, next cursor), or None when the server has no lox_api/changes
+        :raises CursorExpiredError: the server no longer knows the cursor (HTTP 410)
+        """
+        if self._changes is False:
+            return None
+        changes = []
+        while True:
+            request = Request(url=self.url + 'lox_api/changes', data=dumps({'cursor': cursor}))
+            try:
+                answer = loads(self._make_call(request).read())
+            except HTTPError as error:
+                if error.code == 410:
+                    raise CursorExpiredError(cursor)
+                if self._changes or error.code not in (404, 405, 501):
+                    raise
+                getLogger(__name__).info('%s does not support lox_api/changes', self.url)
+                self._changes = False
+                return None
+            self._changes = True
+            changes.extend(answer.get('changes', []))
+            cursor = answer['cursor']
+            if not answer.get('has_more'):
+                getLogger(__name__).debug('%d changes on %s, next cursor %s', len(changes), self.url, cursor)
+                return changes, cursor
+
+    def get_file(self, path='', filename=None, modified_at=None, size=None):
         """
         do the file call
+
+        :param path: path relative to localbox location. eg: /some_folder/image.jpg
+        :param filename: if given, the (encrypted) contents are streamed into this file instead of being returned.
+        They are written to filename + defaults.PARTIAL_EXTENSION in chunks of defaults.TRANSFER_CHUNK_SIZE bytes,
+        which is renamed to filename once complete. An interrupted download of more than one chunk is resumed with
+        a ranged request when the remote file still has the same modified_at and size.
+        :param modified_at: modification time to set on filename
+        :param size: size of the remote file, as listed by the server
+        :return: the contents, or the number of bytes written to filename
         """
         request = Request(url=self.url + "lox_api/files", data=dumps({'path': path}))
-        webdata = self._make_call(request)
-        websize = webdata.headers.get('content-length', -1)
-        data = webdata.read()
-        ldata = len(data)
-        getLogger(__name__).info("Downloaded %s: Websize: %d, readsize: %d cryptosize: %d", path, websize, ldata,
-                                 len(data))
-        return data
+        if filename is None:
+            webdata = self._make_call(request)
+            websize = webdata.headers.get('content-length', -1)
+            data = webdata.read()
+            ldata = len(data)
+            getLogger(__name__).info("Downloaded %s: Websize: %s, readsize: %d cryptosize: %d", path, websize, ldata,
+                                     len(data))
+            return data
+
+        partial_filename = filename + defaults.PARTIAL_EXTENSION
+        transfer = ('download', self.label, path)
+        resumable = size is not None and size > defaults.TRANSFER_CHUNK_SIZE
+        version = {'modified_at': modified_at, 'size': size}
+        offset = 0
+        if os.path.exists(partial_filename):
+            if resumable and transfers_ctrl.get(transfer) == version:
+                offset = os.path.getsize(partial_filename)
+            else:
+                os.remove(partial_filename)
+        if offset:
+            request.add_header('Range', 'bytes=%d-' % offset)
+        if resumable:
+            transfers_ctrl.put(transfer, version)
+
+        try:
+            webdata = self._make_call(request, stream=True)
+        except HTTPError as error:
+            if error.code != 416:
+                raise
+            # the partial file does not fit the remote one, start over
+            os.remove(partial_filename)
+            return self.get_file(path, filename, modified_at, size)
+
+        if webdata.code == 206:
+            total = int(webdata.headers['content-range'].rsplit('/', 1)[1])
+            getLogger(__name__).info("Resuming download of %s at %d bytes", path, offset)
+        else:
+            total = int(webdata.headers.get('content-length', -1))
+            offset = 0
+
+        size = offset
+        try:
+            with open(partial_filename, 'ab' if offset else 'wb') as partial_file:
+                chunk = webdata.read(defaults.TRANSFER_CHUNK_SIZE)
+                while chunk:
+                    partial_file.write(chunk)
+                    size += len(chunk)
+                    chunk = webdata.read(defaults.TRANSFER_CHUNK_SIZE)
+        finally:
+            webdata.close()
+        if total >= 0 and size != total:
+            raise IOError('incomplete download of %s: %d of %d bytes' % (path, size, total))
+
+        if modified_at is not None:
+            os.utime(partial_filename, (time(), modified_at))
+        replace_file(partial_filename, filename)
+        if resumable:
+            transfers_ctrl.remove(transfer)
+
+        getLogger(__name__).info("Downloaded %s to %s: size: %d", path, filename, size)
+        return size
 
     def create_directory(self, path):
         """
@@ -255,25 +386,18 @@ class LocalBox(object):
         :return:
         """
         metapath = path.encode('utf8')
+        encrypted_filename = fs_path + defaults.LOCALBOX_EXTENSION
+        # ignored by the scans and the watchdog, like a download in progress
+        partial_filename = encrypted_filename + defaults.PARTIAL_EXTENSION
 
         try:
-            # read plain file
+            # encrypt file, chunk by chunk, and replace the '.lox' file by a rename,
+            # the stat cache does not look at '.lox' files in unchanged directories
             stats = stat(fs_path)
-            openfile = open(fs_path, 'rb')
-            contents = openfile.read(stats.st_size)
-            openfile.flush()
-
-            # encrypt file
-            contents = gpg.add_pkcs7_padding(contents)
-            clen = len(contents)
-            contents = self.encode_file(path, contents, passphrase)
-
-            # save encrypted file
-            encrypted_file = open(fs_path + defaults.LOCALBOX_EXTENSION, 'wb')
-            encrypted_file.write(contents)
-            encrypted_file.close()
-
-            openfile.close()
+            with open(fs_path, 'rb') as plain_file:
+                with open(partial_filename, 'wb') as encrypted_file:
+                    self.encode_file_stream(path, plain_file, encrypted_file, passphrase)
+            replace_file(partial_filename, encrypted_filename)
 
             # remove plain file
             if remove:
@@ -281,21 +405,112 @@ class LocalBox(object):
                 os_utils.shred(fs_path)
 
             # upload encrypted file
-            getLogger(__name__).info("Uploading %s: Statsize: %d, readsize: %d cryptosize: %d",
-                                     fs_path, stats.st_size, clen, len(contents))
+            getLogger(__name__).info("Uploading %s: Statsize: %d, cryptosize: %d",
+                                     fs_path, stats.st_size, os.path.getsize(encrypted_filename))
 
-            request = Request(url=self.url + 'lox_api/files',
-                              data=dumps({'contents': b64encode(contents), 'path': metapath}))
-
-            res = self._make_call(request)
+            res = self._upload_encrypted_file(metapath, encrypted_filename, (stats.st_size, stats.st_mtime))
             Notifs().uploadedFile(os.path.basename(fs_path))
             return res
 
-        except (BadStatusLine, HTTPError, OSError) as error:
+        except (BadStatusLine, HTTPError, OSError, IOError) as error:
             getLogger(__name__).error('Failed to upload file: %s, error=%s' % (path, error))
 
         return None
 
+    def _upload_encrypted_file(self, metapath, encrypted_filename, source=None):
+        """
+        Send an encrypted file to the server. Files bigger than one chunk go
+        through a resumable upload session (see _upload_session), others are
+        streamed as the raw body of lox_api/files/raw. Servers without those
+        routes get the contents base64 encoded in a JSON body on lox_api/files.
+
+        :param metapath: utf-8 encoded path relative to localbox location
+        :param encrypted_filename: file system path of the encrypted file
+        :param source: identifies the version of the plain file, an interrupted
+        session is only resumed for the same source
+        :return:
+        """
+        if self._upload_sessions is not False and os.path.getsize(encrypted_filename) > defaults.TRANSFER_CHUNK_SIZE:
+            try:
+                res = self._upload_session(metapath, encrypted_filename, source)
+                self._upload_sessions = True
+                return res
+            except HTTPError as error:
+                if self._upload_sessions or error.code not in (404, 405, 501):
+                    raise
+                getLogger(__name__).info('%s does not support upload sessions', self.url)
+                self._upload_sessions = False
+
+        if self._raw_upload is not False:
+            with open(encrypted_filename, 'rb') as encrypted_file:
+                request = Request(url=self.url + 'lox_api/files/raw?' + urlencode({'path': metapath}),
+                                  data=encrypted_file)
+                request.add_header('Content-Type', 'application/octet-stream')
+                request.add_header('Content-Length', str(os.fstat(encrypted_file.fileno()).st_size))
+                try:
+                    res = self._make_call(request)
+                    self._raw_upload = True
+                    return res
+                except HTTPError as error:
+                    if self._raw_upload or error.code not in (404, 405, 501):
+                        raise
+                    getLogger(__name__).info('%s does not support raw uploads, falling back to JSON', self.url)
+                    self._raw_upload = False
+
+        with open(encrypted_filename, 'rb') as encrypted_file:
+            contents = encrypted_file.read()
+        request = Request(url=self.url + 'lox_api/files',
+                          data=dumps({'contents': b64encode(contents), 'path': metapath}))
+        return self._make_call(request)
+
+    def _upload_session(self, metapath, encrypted_filename, source):
+        """
+        Upload a file in chunks of defaults.TRANSFER_CHUNK_SIZE bytes:
+        lox_api/files/upload?path=...&size=... opens a session ({'id', 'offset'}),
+        lox_api/files/upload/<id>?offset=... takes a chunk and answers the new
+        offset, lox_api/files/upload/<id> without data answers the current
+        offset and lox_api/files/upload/<id>/commit completes the upload. The
+        session is kept with transfers_ctrl until it is committed, so an
+        interrupted upload continues at the offset known to the server.
+        """
+        size = os.path.getsize(encrypted_filename)
+        transfer = ('upload', self.label, metapath)
+        state = transfers_ctrl.get(transfer)
+        session_url = None
+        offset = None
+        if state is not None and state['size'] == size and state['source'] == source:
+            session_url = self.url + 'lox_api/files/upload/' + quote_plus(str(state['id']))
+            try:
+                offset = loads(self._make_call(Request(session_url)).read())['offset']
+                getLogger(__name__).info('Resuming upload of %s at %d bytes', metapath, offset)
+            except HTTPError as error:
+                if error.code != 404:
+                    raise
+                getLogger(__name__).debug('upload session of %s expired', metapath)
+
+        if offset is None:
+            request = Request(url=self.url + 'lox_api/files/upload?' + urlencode({'path': metapath, 'size': size}),
+                              data='')
+            session = loads(self._make_call(request).read())
+            session_url = self.url + 'lox_api/files/upload/' + quote_plus(str(session['id']))
+            offset = session.get('offset', 0)
+            transfers_ctrl.put(transfer, {'id': session['id'], 'size': size, 'source': source})
+
+        with open(encrypted_filename, 'rb') as encrypted_file:
+            while offset < size:
+                encrypted_file.seek(offset)
+                request = Request(url=session_url + '?offset=%d' % offset,
+                                  data=encrypted_file.read(defaults.TRANSFER_CHUNK_SIZE))
+                request.add_header('Content-Type', 'application/octet-stream')
+                new_offset = loads(self._make_call(request).read())['offset']
+                if new_offset <= offset:
+                    raise IOError('upload of %s does not progress at offset %d' % (metapath, offset))
+                offset = new_offset
+
+        res = self._make_call(Request(url=session_url + '/commit', data=''))
+        transfers_ctrl.remove(transfer)
+        return res
+
     def _call_move(self, from_path, to_path):
         """
         Call the backend service to move files within the same "root" directory.
@@ -360,7 +575,7 @@ class LocalBox(object):
         """
         if not passphrase:
             raise InvalidPassphraseError
-        pgp_client = gpg()
+        pgp_client = get_gpg()
         keys_path = os_utils.get_keys_path(localbox_path)
         keys_path = quote_plus(keys_path.encode('utf8'))
         getLogger(__name__).debug("call lox_api/key on localbox_path %s = %s", localbox_path, keys_path)
@@ -368,18 +583,73 @@ class LocalBox(object):
         request = Request(url=self.url + 'lox_api/key/' + keys_path)
         result = self._make_call(request)
 
-        key_data = loads(result.read())
-        key = pgp_client.decrypt(b64decode(key_data['key']), passphrase)
-        iv = pgp_client.decrypt(b64decode(key_data['iv']), passphrase)
-
-        if not key or not iv:
-            getLogger(__name__).error("Failed to decrypt keys with passphrase = %s", passphrase)
-            raise InvalidPassphraseError()
+        key, iv = _decrypt_key_data(pgp_client, loads(result.read()), passphrase)
 
         getLogger(__name__).debug("Got key %s for localbox_path %s", getChecksum(key), localbox_path)
 
         return key, iv
 
+    def prime_keys(self, paths, passphrase):
+        """
+        Put the keys for all 'paths' in the key cache before they are needed
+        one file at a time. Keys that are not cached yet are asked for in one
+        lox_api/keys call ({'paths': [keys paths]} answered with
+        {keys path: {'key', 'iv'}}); servers without that route get one
+        lox_api/key call per keys path, on up to 'key_workers' threads (see
+        sync.ini). The keys are decrypted concurrently as well.
+
+        :param paths: localbox paths of the files about to be transferred
+        :param passphrase: used to decrypt the keys
+        :return: number of keys added to the cache
+        """
+        cache = key_cache.get_key_cache()
+        paths_by_keys_path = dict()
+        for path in paths:
+            keys_path = os_utils.get_keys_path(path)
+            if keys_path not in paths_by_keys_path and cache.get(self.label, keys_path, passphrase) is None:
+                paths_by_keys_path[keys_path] = path
+        if not paths_by_keys_path:
+            return 0
+
+        workers = get_option('sync', 'key_workers', defaults.KEY_WORKERS)
+        keys_paths = sorted(paths_by_keys_path)
+        key_data = self._call_keys_batch(keys_paths)
+        if key_data is not None:
+            keys_paths = [keys_path for keys_path in keys_paths if keys_path in key_data]
+            keys = map_threaded(lambda keys_path: _decrypt_key_data(get_gpg(), key_data[keys_path], passphrase),
+                                keys_paths, workers)
+        else:
+            keys = map_threaded(lambda keys_path: self.call_keys(paths_by_keys_path[keys_path], passphrase),
+                                keys_paths, workers)
+
+        primed = 0
+        for keys_path, result in zip(keys_paths, keys):
+            if result is None or isinstance(result, Exception):
+                getLogger(__name__).debug('no key for %s: %s', keys_path, result)
+                continue
+            cache.set(self.label, keys_path, passphrase, *result)
+            primed += 1
+        getLogger(__name__).info('primed %d of %d keys for %s', primed, len(paths_by_keys_path), self.label)
+        return primed
+
+    def _call_keys_batch(self, keys_paths):
+        """
+        :return: {keys path: {'key', 'iv'}}, or None when the server has no lox_api/keys
+        """
+        if self._batch_keys is False:
+            return None
+        request = Request(url=self.url + 'lox_api/keys', data=dumps({'paths': keys_paths}))
+        try:
+            key_data = loads(self._make_call(request).read())
+        except HTTPError as error:
+            if self._batch_keys or error.code not in (404, 405, 501):
+                raise
+            getLogger(__name__).info('%s does not support lox_api/keys', self.url)
+            self._batch_keys = False
+            return None
+        self._batch_keys = True
+        return key_data
+
     def get_all_users(self):
         """
         gets a list from the localbox server with all users.
@@ -537,28 +807,33 @@ class LocalBox(object):
         # should be more robust then this
         return result
 
-    def do_heartbeat(self):
+    def do_heartbeat(self, timeout=None):
         getLogger(__name__).debug("Do heartbeat localbox.py")
         """
         The sync will perform a heartbeat operation by requesting the heartbeat
-        route from the backend
+        route from the backend, and removes the decrypted files
 
         If the heartbeat is successful, method returns True. If the call
         returns a 404 or if the server can't be reached, return False
         """
-        request = Request(url=self.url + 'lox_api/heartbeat')
+        result = self.heartbeat(timeout)
+        self.remove_decrypted_files()
+        return result
 
-        result = False
+    def heartbeat(self, timeout=None):
+        """
+        Request the heartbeat route from the backend.
 
+        :param timeout: seconds, or (connect, read) seconds
+        :return: True when the server answered, False when it answered with an error
+        :raises URLError: the server cannot be reached
+        """
+        request = Request(url=self.url + 'lox_api/heartbeat')
         try:
-            self._make_call(request)
-            result = True
-
-        except HTTPError as error:
-            result = False
-
-        self.remove_decrypted_files()
-        return result
+            self._make_call(request, timeout=timeout)
+            return True
+        except HTTPError:
+            return False
 
     def decode_file(self, path, filename, passphrase):
         """
@@ -586,6 +861,15 @@ class LocalBox(object):
         result = key.encrypt(contents)
         return result
 
+    def encode_file_stream(self, path, plain_file, encrypted_file, passphrase):
+        """
+        encode the contents of plain_file into encrypted_file, a chunk at a time
+        """
+        key = self.get_aes_key(path, passphrase)
+        if not key:
+            raise NoKeysFoundError()
+        encrypt_stream(key, plain_file, encrypted_file)
+
     def is_valid_url(self):
         getLogger(__name__).debug("validating localbox server: %s" % (self.url))
         try:
@@ -611,12 +895,23 @@ class LocalBox(object):
         return key, iv
 
     def get_aes_key(self, path, passphrase):
-        try:
-            key, iv = self.call_keys(path, passphrase)
-        except (HTTPError, TypeError, ValueError):
-            raise NoKeysFoundError(message='No keys found for %s' % path)
+        """
+        Get a new AES cipher for path. The (key, iv) pair is kept in
+        :py:mod:`sync.key_cache` for all files with the same keys path.
+        """
+        keys_path = os_utils.get_keys_path(path)
+        cache = key_cache.get_key_cache()
+        cached = cache.get(self.label, keys_path, passphrase) if passphrase else None
+        if cached is not None:
+            key, iv = cached
+        else:
+            try:
+                key, iv = self.call_keys(path, passphrase)
+            except (HTTPError, TypeError, ValueError):
+                raise NoKeysFoundError(message='No keys found for %s' % path)
+            if key:
+                cache.set(self.label, keys_path, passphrase, key, iv)
 
-        # TODO: use timed cache (see cachetools.TTLCache: https://pythonhosted.org/cachetools/)
         return AES_Key(key, MODE_CFB, iv, segment_size=128) if key else None
 
     def remove_decrypted_files(self):
@@ -640,6 +935,56 @@ def get_localbox_path(localbox_location, filesystem_path):
                   filesystem_path.replace(localbox_location, '', 1).replace('\\', '/'))
 
 
+def encrypt_stream(cipher, plain_file, encrypted_file, chunk_size=None):
+    """
+    Encrypt plain_file into encrypted_file with PKCS#7 padding, reading
+    chunk_size bytes (defaults.TRANSFER_CHUNK_SIZE by default) at a time. Gives
+    the same result as encrypting the padded contents at once.
+
+    :param cipher: AES cipher in CFB mode, as returned by get_aes_key
+    :param plain_file: file object to read from
+    :param encrypted_file: file object to write to
+    :param chunk_size: must be a multiple of the AES block size
+    """
+    chunk_size = chunk_size or defaults.TRANSFER_CHUNK_SIZE
+    chunk = plain_file.read(chunk_size)
+    while True:
+        next_chunk = plain_file.read(chunk_size)
+        if not next_chunk:
+            encrypted_file.write(cipher.encrypt(gpg.add_pkcs7_padding(chunk)))
+            return
+        encrypted_file.write(cipher.encrypt(chunk))
+        chunk = next_chunk
+
+
+def _decrypt_key_data(pgp_client, key_data, passphrase):
+    """
+    :param key_data: {'key', 'iv'} as returned by lox_api/key, base64 encoded and encrypted
+    :return: (key, iv)
+    :raises InvalidPassphraseError: when they cannot be decrypted
+    """
+    key = pgp_client.decrypt(b64decode(key_data['key']), passphrase)
+    iv = pgp_client.decrypt(b64decode(key_data['iv']), passphrase)
+
+    if not key or not iv:
+        getLogger(__name__).error("Failed to decrypt keys with passphrase = %s", passphrase)
+        raise InvalidPassphraseError()
+    return key, iv
+
+
+def replace_file(source, destination):
+    """
+    Rename source to destination, replacing destination if it exists. This is
+    atomic, except on Windows with Python 2 where destination is removed first.
+    """
+    try:
+        os.replace(source, destination)
+    except AttributeError:
+        if os_utils.is_windows() and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
 def remove_decrypted_files():
     import os, sync.controllers.openfiles_ctrl as ctrl
 
@@ -693,6 +1038,13 @@ class InvalidLocalBoxPathError(Exception):
         return '%s is not a valid LocalBox path' % self.path
 
 
+class CursorExpiredError(Exception):
+    """
+    The server no longer knows the changes since a cursor of lox_api/changes.
+    """
+    pass
+
+
 class InvalidPassphraseError(Exception):
     """
     Passphrase supplied is invalid.
@@ -1,11 +1,13 @@
 from logging import getLogger
-from itertools import chain
-from copy import deepcopy
 from os.path import sep
 try:
     from cPickle import dump, load
 except ImportError:
     from pickle import dump, load
+try:
+    from sys import intern
+except ImportError:
+    pass  # builtin on python 2
 
 import sync.defaults as defaults
 
@@ -27,18 +29,28 @@ class MetaVFS(object):
 
     """
     virtual meta filesystem
+
+    Several full trees are alive during a sync, so nodes are kept small: no
+    instance dictionary, paths are interned (and thus shared between the
+    trees) and leaves share an empty tuple instead of owning a children list.
     """
 
+    __slots__ = ('path', 'is_dir', 'modified_at', 'size', 'children', 'parent', '_index')
+
     def __init__(self, modified_at=None, path=None, is_dir=None,
-                 children=None):
+                 children=None, size=None):
         path=path.encode('utf-8')
-        self.path = normalize_path(path)
+        self.path = intern(normalize_path(path))
         self.is_dir = is_dir
         self.modified_at = modified_at
-        self.children = children
-        if self.children is None:
-            self.children = []
+        # in bytes, None when unknown
+        self.size = size
+        self.children = ()
         self.parent = None
+        # path -> node index, only kept on the root of a tree
+        self._index = None
+        for child in children or []:
+            self.add_child(child)
 
     def __str__(self):
         return self.path
@@ -70,23 +82,133 @@ class MetaVFS(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __contains__(self, path):
+        return self.get_entry(path) is not None
+
+    def __getstate__(self):
+        """
+        The index is not pickled, it is rebuilt on first use after loading.
+        """
+        state = dict((name, getattr(self, name)) for name in self.__slots__)
+        state['_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        # pickles written before the index and size existed have neither
+        self._index = None
+        self.size = None
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.path = intern(self.path)
+
+    def get_root(self):
+        """
+        return the top node of the tree this node belongs to
+        """
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    def _get_index(self):
+        """
+        return the path -> node index of the tree this node belongs to,
+        building it if needed (e.g. after unpickling)
+        """
+        root = self.get_root()
+        if root._index is None:
+            root._index = dict((entry.path, entry) for entry in root.gen())
+        return root._index
+
+    def _in_subtree(self, path):
+        """
+        is path this node's path or the path of one of its descendants?
+        """
+        if self.parent is None or path == self.path:
+            return True
+        return path.startswith(self.path.rstrip('/') + '/')
+
     def gen(self):
-        #getLogger(__name__).debug("Yielding %s", self)
-        yield self
-        for child in self.children:
-            for entry in child.gen():
-                # y=child.gen()
-                yield entry
+        """
+        yield all entries of this filesystem, depth first, parents before
+        their children
+        """
+        stack = [self]
+        while stack:
+            entry = stack.pop()
+            yield entry
+            stack.extend(reversed(entry.children))
+
+    def copy_node(self):
+        """
+        return a copy of this entry without its parent and children
+        """
+        node = MetaVFS.__new__(MetaVFS)
+        node.path = self.path
+        node.is_dir = self.is_dir
+        node.modified_at = self.modified_at
+        node.size = self.size
+        node.children = ()
+        node.parent = None
+        node._index = None
+        return node
 
     def add_paths(self, other):
-        for kid in other.children:
-            if kid.path not in self.get_paths():
-                self.add_child(deepcopy(kid))
+        """
+        merge the entries of other into this filesystem. Entries already
+        present are kept as they are, missing ones are copied (without their
+        subtree, which is visited anyway). Runs in a single pass over other.
+        """
+        index = self._get_index()
+        for kid in other.gen():
+            if kid is other or kid.path in index:
+                continue
+            if kid.parent is other:
+                parent = self
             else:
-                entry = self.get_entry(kid.path)
-                entry.add_paths(kid)
+                parent = index[kid.parent.path]
+            node = kid.copy_node()
+            parent._append_child(node)
+            index[node.path] = node
         return self
 
+    @staticmethod
+    def merge(*trees):
+        """
+        return a new filesystem holding the union of the given trees. When a
+        path exists in several trees the entry of the first one is used.
+        """
+        result = MetaVFS('0', '/', True, None)
+        for tree in trees:
+            if tree is not None:
+                result.add_paths(tree)
+        return result
+
+    @staticmethod
+    def merge_paths(paths, *trees):
+        """
+        return a new filesystem like merge(), limited to the given paths. The
+        parents of every path have to be in paths as well.
+        """
+        result = MetaVFS('0', '/', True, None)
+        index = result._get_index()
+        for path in sorted(paths):
+            if path in index:
+                continue
+            for tree in trees:
+                entry = tree.get_entry(path) if tree is not None else None
+                if entry is not None:
+                    break
+            else:
+                continue
+            parent = index.get(entry.parent.path if entry.parent is not None else None)
+            if parent is None:
+                continue
+            node = entry.copy_node()
+            parent._append_child(node)
+            index[node.path] = node
+        return result
+
     @staticmethod
     def newest(*arguments):
         """
@@ -148,13 +270,47 @@ class MetaVFS(object):
         filedescriptor = open(filename, 'r')
         value = load(filedescriptor)
         filedescriptor.close()
+        value._get_index()
         return value
 
     def add_child(self, child):
         """
-        add a child to this node, also set child's parent
+        add a child to this node, also set child's parent and register the
+        child's subtree in the index of the root
         """
-        self.children.append(child)
+        index = self._get_index()
+        self._append_child(child)
+
+        child_index = child._index
+        child._index = None
+        if not child.children:
+            index[child.path] = child
+        elif child_index is None:
+            for entry in child.gen():
+                index[entry.path] = entry
+        else:
+            # merge the smaller index into the bigger one
+            if len(child_index) > len(index):
+                index, child_index = child_index, index
+                self.get_root()._index = index
+            index.update(child_index)
+
+    def remove_child(self, child):
+        """
+        remove a child and its subtree from this node and from the index of the root
+        """
+        index = self._get_index()
+        for entry in child.gen():
+            if index.get(entry.path) is entry:
+                del index[entry.path]
+        self.children = [kid for kid in self.children if kid is not child] or ()
+        child.parent = None
+
+    def _append_child(self, child):
+        if self.children:
+            self.children.append(child)
+        else:
+            self.children = [child]
         child.parent = self
 
     def debug_print(self):
@@ -189,10 +345,10 @@ class MetaVFS(object):
         """
         return an entry (file or directory) from the system
         """
-        for entry in chain(self.yield_directories(), self.yield_files()):
-            if entry.path == path:
-                return entry
-        return None
+        entry = self._get_index().get(path)
+        if entry is None or not self._in_subtree(path):
+            return None
+        return entry
 
     def contains_directory(self, filepath):
         """
@@ -204,12 +360,6 @@ class MetaVFS(object):
         if len(filepath) == 0 or filepath[0] != '/':
             getLogger(__name__).info("adding root '/' to path")
             filepath = '/' + filepath
-        result = False
-        getLogger(__name__).info("MATCHING: " + filepath)
-        for vfsdirectory in self.yield_directories():
-            directory = vfsdirectory.path
-            getLogger(__name__).info("TO      : " + directory)
-            if directory == filepath:
-                result = True
-                break
-        return result
+        getLogger(__name__).debug("MATCHING: " + filepath)
+        entry = self.get_entry(filepath)
+        return entry is not None and bool(entry.is_dir)
@@ -271,12 +271,15 @@ class NotifHandler(Thread):
         elif code == 501:
             label = msg["label"]
             force_gui_notif = msg["force_gui_notif"]
+            latency = msg.get("latency")
 
             def gui_h():
-                self._publish_gui_notif_heartbeat({"label": label, "online": True})
+                self._publish_gui_notif_heartbeat({"label": label, "online": True, "latency": latency})
 
             def gui_n():
                 message = "Sync \"{}\" is Online".format(label)
+                if latency is not None:
+                    message += " ({:.0f} ms)".format(latency * 1000)
                 self._publish_gui_notif_popup({"title": "LocalBox", "message": message})
 
             # If the sync of the given label was offline, then set it to be online and notify user
@@ -92,12 +92,14 @@ class Notifs(object):
                      'labels':          labels,
                      'force_gui_notif': force_gui_notif })
 
-    def syncHeartbeatUp(self, label, force_gui_notif=False):
+    def syncHeartbeatUp(self, label, force_gui_notif=False, latency=None):
         """
         Notify that sync with the given label is up
+
+        @param latency Seconds its server took to answer the heartbeat, if known
         """
 
-        self._send({ 'code': 501, 'label': label, 'force_gui_notif': force_gui_notif })
+        self._send({ 'code': 501, 'label': label, 'force_gui_notif': force_gui_notif, 'latency': latency })
 
     def syncHeartbeatDown(self, label, force_gui_notif=False):
         """
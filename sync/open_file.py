@@ -2,7 +2,7 @@ import os
 
 from sync import defaults
 from sync.controllers.login_ctrl import LoginController
-from sync.localbox import LocalBox
+from sync.client_registry import get_localbox
 from sync.memory_fs import LocalBoxMemoryFS
 from sync.gui import gui_utils
 from logging import getLogger
@@ -22,7 +22,7 @@ def open_file(data_dic, memory=False):
         return None
 
     # Stat local box instance
-    localbox_client = LocalBox(data_dic["url"], data_dic["label"], "")
+    localbox_client = get_localbox(data_dic["url"], data_dic["label"], "")
 
     # Attempt to decode the file
 
@@ -0,0 +1,195 @@
+"""
+Planning stage of a sync: the remote, local and old MetaVFS trees are turned
+into a list of :py:class:`SyncAction` before anything is transferred. An
+incremental sync only plans the :py:func:`changed_paths`. The
+plan is executed by :py:meth:`sync.syncer.Syncer.syncsync` and can be shown
+without executing it with ``python -m sync --plan <label>``.
+"""
+import os
+from logging import getLogger
+from os.path import isdir
+
+from sync.controllers import openfiles_ctrl
+from sync.metavfs import MetaVFS
+
+UPLOAD = 'upload'
+DOWNLOAD = 'download'
+DELETE_LOCAL = 'delete-local'
+DELETE_REMOTE = 'delete-remote'
+MKDIR_LOCAL = 'mkdir-local'
+MKDIR_REMOTE = 'mkdir-remote'
+SKIP = 'skip'
+
+ACTIONS = (UPLOAD, DOWNLOAD, DELETE_LOCAL, DELETE_REMOTE, MKDIR_LOCAL, MKDIR_REMOTE, SKIP)
+
+
+class SyncAction(object):
+    """
+    One step of a sync plan.
+    """
+
+    __slots__ = ('action', 'metavfs', 'size')
+
+    def __init__(self, action, metavfs, size=None):
+        """
+        :param action: one of ACTIONS
+        :param metavfs: entry of the merged tree
+        :param size: bytes to transfer, None when the server did not tell
+        """
+        self.action = action
+        self.metavfs = metavfs
+        self.size = size
+
+    @property
+    def path(self):
+        return self.metavfs.path
+
+    def __repr__(self):
+        return 'SyncAction(%s, %s, %s)' % (self.action, self.path, self.size)
+
+
+class Planner(object):
+    """
+    Decides what a sync has to do with every entry of the merged tree. The
+    file system is only looked at through :py:meth:`exists`, :py:meth:`isdir`
+    and :py:meth:`is_modified`, so benchmarks can plan synthetic trees.
+    """
+
+    def __init__(self, remote, local, old, get_file_path):
+        """
+        :param remote: MetaVFS tree of the server
+        :param local: MetaVFS tree of the sync folder
+        :param old: MetaVFS tree saved after the previous sync
+        :param get_file_path: function returning the file system path of an entry
+        """
+        self.remote = remote
+        self.local = local
+        self.old = old
+        self.get_file_path = get_file_path
+
+    def exists(self, filesystem_path):
+        return os.path.exists(filesystem_path)
+
+    def isdir(self, filesystem_path):
+        return isdir(filesystem_path)
+
+    def is_modified(self, filesystem_path):
+        """
+        whether the contents differ from the ones registered with openfiles_ctrl
+        """
+        return openfiles_ctrl.is_modified(filesystem_path)
+
+    def plan(self, full_tree=None, check_stop=None):
+        """
+        :param full_tree: merge of the remote, local and old trees, made when not given
+        :param check_stop: called before every entry, may raise to stop planning
+        :return: list of SyncAction in the order of MetaVFS.gen
+        """
+        if full_tree is None:
+            full_tree = MetaVFS.merge(self.remote, self.local, self.old)
+
+        actions = []
+        for metavfs in full_tree.gen():
+            if check_stop is not None:
+                check_stop()
+            try:
+                actions.append(self.decide(metavfs))
+            except Exception as error:
+                getLogger(__name__).exception("Problem '%s' with file %s; continuing", error, metavfs.path)
+        return actions
+
+    def decide(self, metavfs):
+        """
+        :return: the SyncAction for one entry of the merged tree
+        """
+        path = metavfs.path
+
+        oldfile = self.old.get_entry(path)
+        localfile = self.local.get_entry(path)
+        remotefile = self.remote.get_entry(path)
+        getLogger(__name__).debug(
+            "====Local %s, Remote %s, Old %s ====", localfile, remotefile, oldfile)
+
+        # hammer time :(
+        # to fixed directory deletion issue
+        if localfile is None and oldfile is not None and remotefile is not None:
+            oldfile.modified_at = remotefile.modified_at
+
+        # if remotefile == oldfile and self.get_file_path(metavfs)is None:
+        if remotefile == oldfile and localfile is None:
+            return SyncAction(DELETE_REMOTE, metavfs, 0)
+        # if localfile == oldfile and self.get_url_path(metavfs) is None:
+        if localfile == oldfile and remotefile is None:
+            return SyncAction(DELETE_LOCAL, metavfs, 0)
+
+        newest = MetaVFS.newest(oldfile, localfile, remotefile)
+
+        if newest == oldfile and newest is not None:
+            getLogger(__name__).info(
+                "Skipping %s because all files are older then the previous file", newest.path)
+            return SyncAction(SKIP, metavfs)
+
+        newest = MetaVFS.newest(localfile, remotefile)
+
+        filesystem_path = self.get_file_path(metavfs)
+        if newest == localfile and self.exists(filesystem_path):
+            if not self.isdir(filesystem_path) and self.is_modified(filesystem_path):
+                return SyncAction(UPLOAD, metavfs, localfile.size)
+            elif path != '/' and path not in self.remote:
+                return SyncAction(MKDIR_REMOTE, metavfs, 0)
+            return SyncAction(SKIP, metavfs)
+        if newest == remotefile:
+            getLogger(__name__).info("%s is_dir: %s", metavfs.path, metavfs.is_dir)
+            if not metavfs.is_dir:
+                return SyncAction(DOWNLOAD, metavfs, remotefile.size)
+            elif not self.isdir(filesystem_path):
+                return SyncAction(MKDIR_LOCAL, metavfs, 0)
+        return SyncAction(SKIP, metavfs)
+
+
+def changed_paths(remote, local, old, local_paths):
+    """
+    The paths an incremental sync has to decide on, assuming the local tree
+    equals the old one outside local_paths. Every other entry is the same in
+    the three trees, which :py:meth:`Planner.decide` skips.
+
+    :param local_paths: local paths that changed since the previous sync
+    :return: local_paths and everything below them, the remote entries that
+    differ from the old tree, the old entries that are gone remotely, and the
+    parents of all of these
+    """
+    paths = set()
+    for path in local_paths:
+        for tree in (remote, local, old):
+            entry = tree.get_entry(path)
+            if entry is not None:
+                paths.update(kid.path for kid in entry.gen())
+        paths.add(path)
+    for entry in remote.gen():
+        oldfile = old.get_entry(entry.path)
+        # directories present on both sides are never acted upon, whatever their times
+        if oldfile is None or oldfile.is_dir != entry.is_dir or (not entry.is_dir and oldfile != entry):
+            paths.add(entry.path)
+    for entry in old.gen():
+        if entry.path not in remote:
+            paths.add(entry.path)
+
+    for path in list(paths):
+        while path != '/':
+            path = path.rsplit('/', 1)[0] or '/'
+            if path in paths:
+                break
+            paths.add(path)
+    paths.add('/')
+    return paths
+
+
+def summarize(actions):
+    """
+    :return: dictionary action -> (number of actions, bytes), bytes that are not known are not counted
+    """
+    summary = dict((action, (0, 0)) for action in ACTIONS)
+    for action in actions:
+        count, size = summary[action.action]
+        summary[action.action] = (count + 1, size + (action.size or 0))
+    return summary
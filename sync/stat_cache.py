@@ -0,0 +1,164 @@
+"""
+Directory listings of a sync folder kept between scans.
+
+For every directory the cache holds the directory's mtime and the name, type,
+size, mtime and inode of its entries. Adding, removing or renaming an entry
+changes the directory's mtime, so a directory whose mtime did not change can
+be listed from the cache without a stat per file. Subdirectories are still
+looked at, they carry their own mtime. Files changed in place keep the
+directory's mtime, so the plain (decrypted) files, the only ones edited in
+place, are still looked at as well; the cache is trusted for the '.lox'
+files, which are only replaced by renames (see LocalBox.get_file and
+LocalBox.upload_file).
+"""
+import gc
+import os
+from logging import getLogger
+from stat import S_ISDIR
+from time import time
+
+try:
+    from cPickle import dump, load, HIGHEST_PROTOCOL
+except ImportError:
+    from pickle import dump, load, HIGHEST_PROTOCOL
+
+try:
+    from os import scandir  # pylint: disable=E0611
+except ImportError:
+    try:
+        from scandir import scandir  # backport for python 2
+    except ImportError:
+        scandir = None
+
+from sync.defaults import STAT_CACHE, LOCALBOX_EXTENSION, PARTIAL_EXTENSION
+
+#: seconds a directory must have been unchanged when it was listed before the
+#: listing is trusted: changes in the same mtime tick would go unnoticed
+RACY_INTERVAL = 2
+
+
+class StatCache(object):
+    """
+    Listings of the directories of one sync, see the module documentation.
+    """
+
+    def __init__(self, name):
+        self.filename = STAT_CACHE + name
+        self.hits = 0
+        self.misses = 0
+        # path -> (directory mtime, time listed, {name: (is_dir, size, mtime, inode)})
+        self._old = dict()
+        self._new = dict()
+        self._changed = False
+
+    def load(self):
+        # the cache holds no cycles, collecting while unpickling the many tuples only costs time
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(self.filename, 'rb') as cache_file:
+                self._old = load(cache_file)
+        except Exception as error:  # pylint: disable=W0703
+            # unpickling a damaged or outdated file fails in many ways, it is only a cache
+            getLogger(__name__).debug('no stat cache in %s: %s', self.filename, error)
+            self._old = dict()
+        finally:
+            if gc_enabled:
+                gc.enable()
+        self._changed = False
+        return self
+
+    def save(self):
+        """
+        Keep the directories listed since load(); directories that were not
+        visited do not exist anymore. Nothing is written when no listing
+        changed.
+        """
+        if not self._changed and len(self._new) == len(self._old):
+            getLogger(__name__).debug('stat cache %s: all %d directories listed from cache',
+                                      self.filename, self.hits)
+            self._old, self._new = self._new, dict()
+            return
+        temporary = self.filename + '.tmp'
+        try:
+            with open(temporary, 'wb') as cache_file:
+                dump(self._new, cache_file, HIGHEST_PROTOCOL)
+            if os.path.exists(self.filename) and os.name == 'nt':
+                os.remove(self.filename)
+            os.rename(temporary, self.filename)
+        except (IOError, OSError) as error:
+            getLogger(__name__).warning('could not save the stat cache %s: %s', self.filename, error)
+        getLogger(__name__).debug('stat cache %s: %d directories listed from cache, %d listed again',
+                                  self.filename, self.hits, self.misses)
+        self._old, self._new = self._new, dict()
+        self._changed = False
+
+    def list_directory(self, path, fs_path, mtime):
+        """
+        :param path: path of the directory relative to the sync folder, the cache key
+        :param fs_path: file system path of the directory
+        :param mtime: current mtime of the directory
+        :return: {name: (is_dir, size, mtime, inode)}
+        """
+        cached = self._old.get(path)
+        if cached is not None and cached[0] == mtime and cached[1] - mtime > RACY_INTERVAL:
+            self.hits += 1
+            listing = dict(cached[2])
+            listed_at = cached[1]
+            for name, entry in cached[2].items():
+                # a change inside a subdirectory only changes the subdirectory's mtime, and
+                # plain files are edited in place, which leaves the directory mtime alone
+                if entry[0] or not (name.endswith(LOCALBOX_EXTENSION) or name.endswith(PARTIAL_EXTENSION)):
+                    entry = stat_entry(os.path.join(fs_path, name))
+                    if entry is None:
+                        del listing[name]
+                        self._changed = True
+                    elif entry != cached[2][name]:
+                        listing[name] = entry
+                        self._changed = True
+        else:
+            self.misses += 1
+            self._changed = True
+            listing = list_directory(fs_path)
+            listed_at = time()
+        self._new[path] = (mtime, listed_at, listing)
+        return listing
+
+
+def list_directory(fs_path):
+    """
+    List a directory with ``scandir``, which gets the stat results with the
+    listing on Windows and saves the path lookups elsewhere, or with
+    ``listdir`` and a stat per entry when it is not available.
+
+    :return: {name: (is_dir, size, mtime, inode)} of the entries of fs_path
+    """
+    listing = dict()
+    if scandir is None:
+        for name in os.listdir(fs_path):
+            entry = stat_entry(os.path.join(fs_path, name))
+            if entry is not None:
+                listing[name] = entry
+        return listing
+
+    for dir_entry in scandir(fs_path):
+        try:
+            listing[dir_entry.name] = _to_entry(dir_entry.stat())
+        except OSError:
+            # removed since it was listed
+            continue
+    return listing
+
+
+def stat_entry(fs_path):
+    """
+    :return: (is_dir, size, mtime, inode), or None when fs_path is gone
+    """
+    try:
+        return _to_entry(os.stat(fs_path))
+    except OSError:
+        return None
+
+
+def _to_entry(stats):
+    return S_ISDIR(stats.st_mode), stats.st_size, stats.st_mtime, stats.st_ino
@@ -1,18 +1,17 @@
 import os
 from logging import getLogger
-from os import listdir
 from os import makedirs
 from os import remove
 from os import sep
-from os import utime
 from os.path import dirname
 from os.path import exists
 from os.path import isdir
 from os.path import join
+from collections import OrderedDict
 from shutil import rmtree
 from threading import Thread, Lock, Event
-from time import sleep
-from time import time
+from time import sleep, time
+from timeit import default_timer
 
 try:
     from ConfigParser import ConfigParser, NoSectionError, NoOptionError
@@ -24,17 +23,30 @@ try:
 except:
     from urllib.error import URLError
 
+try:
+    from cPickle import dump, load, HIGHEST_PROTOCOL
+except ImportError:
+    from pickle import dump, load, HIGHEST_PROTOCOL
+
 from loxcommon import os_utils
-from sync import defaults, SYNCINI_PATH
+from sync import connection_pool, defaults, hash_cache, SYNCINI_PATH
+from sync.controllers import journal_ctrl
 from sync.controllers.localbox_ctrl import SyncsController
+from sync.config import get_option
 from sync.controllers.login_ctrl import LoginController
 from sync.defaults import SITESINI_PATH
-from sync.localbox import LocalBox
+from sync.client_registry import get_localbox
+from sync.localbox import CursorExpiredError, remove_decrypted_files
 from sync.profiling import profile
 from sync.notif.notifs import Notifs
+from sync.workers import map_threaded, run_dependent
 from .defaults import OLD_SYNC_STATUS
-from .metavfs import MetaVFS
-from .controllers import openfiles_ctrl
+from .metavfs import MetaVFS, normalize_path
+from .stat_cache import StatCache, list_directory, stat_entry
+from .plan import Planner, changed_paths, UPLOAD, DOWNLOAD, DELETE_LOCAL, DELETE_REMOTE, MKDIR_LOCAL, MKDIR_REMOTE, SKIP
+
+# label -> time the last sync that scanned the whole sync folder started
+_full_scans = dict()
 
 
 class Syncer(object):
@@ -47,6 +59,8 @@ class Syncer(object):
         self.direction = direction
         self.online = False
         self._stop_event = None
+        # lox_api/changes cursor of localbox_metadata, None when the server has no change feed
+        self._remote_cursor = None
 
     @property
     def stop_event(self):
@@ -70,46 +84,143 @@ class Syncer(object):
         return join(self.filepath.encode('utf8'), *path)
 
     def populate_localbox_metadata(self, path='/', parent=None):
+        """
+        Build the MetaVFS tree of the remote side, one directory level at a
+        time. The server is asked for defaults.META_DEPTH levels per call; only
+        entries that come back incomplete (older servers, or cut off by the
+        depth) are fetched again, concurrently on up to 'meta_workers' threads
+        (see sync.ini).
+        """
         self._should_stop_sync()
 
-        node = self.localbox.get_meta(path)
+        node = self.localbox.get_meta(path, depth=defaults.META_DEPTH)
         getLogger(__name__).debug('populate_localbox_metadata node: %s' % node)
-        modtime = node['modified_at']
-        getLogger(__name__).debug('%s remote modification time: %s' % (path, modtime))
-        vfsnode = MetaVFS(modtime, node['path'], node['is_dir'])
-        for child in node['children']:
-            try:
-                self.populate_localbox_metadata(child['path'], parent=vfsnode)
-            except:
-                pass
+        getLogger(__name__).debug('%s remote modification time: %s' % (path, node['modified_at']))
+        vfsnode = MetaVFS(node['modified_at'], node['path'], node['is_dir'], size=node.get('size'))
+        workers = get_option('sync', 'meta_workers', defaults.META_WORKERS)
+
+        level = [(node, vfsnode, 'depth' in node)]
+        while level:
+            self._should_stop_sync()
+            children = [(child, vfsparent, recursive)
+                        for node, vfsparent, recursive in level
+                        for child in node.get('children', [])]
+            fetch = [child['path'] for child, _, recursive in children if _needs_meta_call(child, recursive)]
+            fetched = dict(zip(fetch, map_threaded(
+                lambda child_path: self.localbox.get_meta(child_path, depth=defaults.META_DEPTH),
+                fetch, workers, self._stop_event)))
+            self._should_stop_sync()
+
+            level = []
+            for child, vfsparent, recursive in children:
+                if child['path'] in fetched:
+                    answer = fetched[child['path']]
+                    if answer is None or isinstance(answer, Exception):
+                        getLogger(__name__).debug('skipping %s: %s' % (child['path'], answer))
+                        continue
+                    child, recursive = answer, 'depth' in answer
+                vfschild = MetaVFS(child['modified_at'], child['path'], child['is_dir'], size=child.get('size'))
+                vfsparent.add_child(vfschild)
+                if child['is_dir']:
+                    level.append((child, vfschild, recursive))
+
         if parent is None:
             self.localbox_metadata = vfsnode
         else:
             getLogger(__name__).debug("parent %s gets child %s" % (parent, vfsnode))
             parent.add_child(vfsnode)
 
-    def populate_filepath_metadata(self, path='/', parent=None):
+    def fetch_localbox_metadata(self):
+        """
+        Get the remote tree into localbox_metadata. When the previous sync
+        saved the tree with a cursor of the server's change feed (see
+        :py:meth:`sync.localbox.LocalBox.get_changes`), only the changes since
+        that cursor are fetched and applied to it. Otherwise, or when the
+        server no longer knows the cursor, the whole tree is crawled with
+        populate_localbox_metadata.
+        """
+        self._should_stop_sync()
+        saved = self._load_remote_status()
+        if saved is not None:
+            cursor, tree = saved
+            try:
+                answer = self.localbox.get_changes(cursor)
+                if answer is not None:
+                    changes, self._remote_cursor = answer
+                    _apply_changes(tree, changes)
+                    getLogger(__name__).info('applied %d remote changes to the tree of %s', len(changes), self.name)
+                    self.localbox_metadata = tree
+                    return
+            except (CursorExpiredError, ValueError) as error:
+                getLogger(__name__).info('crawling the remote tree of %s: %s', self.name, error)
+
+        # the cursor is taken first: what changes during the crawl is fetched again by the next sync
+        answer = self.localbox.get_changes()
+        self._remote_cursor = answer[1] if answer is not None else None
+        self.populate_localbox_metadata(path='/', parent=None)
+
+    def _load_remote_status(self):
+        """
+        :return: (cursor, remote tree) saved by the previous sync, None when there is none
+        """
+        try:
+            with open(defaults.REMOTE_SYNC_STATUS + self.name, 'rb') as status_file:
+                cursor, tree = load(status_file)
+        except (IOError, EOFError, ValueError, TypeError) as error:
+            getLogger(__name__).debug('no remote tree of %s saved: %s', self.name, error)
+            return None
+        tree._get_index()
+        return cursor, tree
+
+    def _save_remote_status(self):
+        filename = defaults.REMOTE_SYNC_STATUS + self.name
+        if self._remote_cursor is None:
+            if exists(filename):
+                remove(filename)
+            return
+        with open(filename, 'wb') as status_file:
+            dump((self._remote_cursor, self.localbox_metadata), status_file, HIGHEST_PROTOCOL)
+
+    def populate_filepath_metadata(self, path='/', parent=None, stat_cache=None):
+        """
+        Build the MetaVFS tree of the sync folder. Directories are walked
+        iteratively and each one is listed once (see
+        :py:func:`sync.stat_cache.list_directory`), with the size, mtime and
+        inode of its entries; a 'name.lox' and its decrypted twin 'name' are
+        paired from that listing. Unless 'stat_cache' is disabled in sync.ini,
+        listings of directories that did not change since the previous scan
+        come from a :py:class:`sync.stat_cache.StatCache` kept per sync.
+        """
         self._should_stop_sync()
 
+        if parent is None and stat_cache is None and get_option('sync', 'stat_cache', defaults.STAT_CACHE_ENABLED):
+            stat_cache = StatCache(self.name).load()
+            self.populate_filepath_metadata(path, parent, stat_cache)
+            stat_cache.save()
+            return
+
         path = path.lstrip('.').rstrip("/\\")
         if path == '':
             fs_path = self.filepath
         else:
             fs_path = join(self.filepath, path)
         getLogger(__name__).info('processing "%s" transformed to "%s"' % (path, fs_path))
-        is_dir = isdir(fs_path)
+        entry = stat_entry(fs_path)
+        is_dir = entry is not None and entry[0]
 
         path_dec = os_utils.remove_extension(path, defaults.LOCALBOX_EXTENSION)
         fs_path_dec = os_utils.remove_extension(fs_path, defaults.LOCALBOX_EXTENSION)
         if is_dir:
-            modtime = os.path.getmtime(fs_path)
-            vfsnode = MetaVFS(modtime, path_dec, is_dir)
-            for entry in listdir(fs_path):
-                self.populate_filepath_metadata(join(path, entry), parent=vfsnode)
+            vfsnode = MetaVFS(entry[2], path_dec, is_dir)
+            self._walk_directory(path, fs_path, vfsnode, entry[2], stat_cache)
         else:
+            if path.endswith(defaults.LOCALBOX_EXTENSION + defaults.PARTIAL_EXTENSION):
+                # download in progress
+                return
             if not path.endswith(defaults.LOCALBOX_EXTENSION):
                 if not os.path.exists(fs_path + defaults.LOCALBOX_EXTENSION):
                     modtime = os.path.getmtime(fs_path)
+                    size = os.path.getsize(fs_path)
                 else:
                     return
             else:
@@ -117,16 +228,125 @@ class Syncer(object):
                     modtime_enc = os.path.getmtime(fs_path)
                     modtime_dec = os.path.getmtime(fs_path_dec)
                     modtime = modtime_dec if modtime_dec > modtime_enc else modtime_enc
+                    size = os.path.getsize(fs_path_dec)
                 else:
                     modtime = os.path.getmtime(fs_path)
+                    size = os.path.getsize(fs_path)
 
-            vfsnode = MetaVFS(modtime, path_dec, is_dir)
+            vfsnode = MetaVFS(modtime, path_dec, is_dir, size=size)
 
         if parent is None:
             self.filepath_metadata = vfsnode
         else:
             parent.add_child(vfsnode)
 
+    def _walk_directory(self, path, fs_path, vfsnode, mtime, stat_cache=None):
+        """
+        Add everything below a directory to its MetaVFS node.
+
+        :param path: path of the directory relative to the sync folder
+        :param mtime: mtime of the directory
+        """
+        directories = [(path, fs_path, vfsnode, mtime)]
+        while directories:
+            self._should_stop_sync()
+            dir_path, dir_fs_path, dir_node, dir_mtime = directories.pop()
+            if stat_cache is not None:
+                listing = stat_cache.list_directory(dir_path, dir_fs_path, dir_mtime)
+            else:
+                listing = list_directory(dir_fs_path)
+            for name, child in listing.items():
+                child_path = join(dir_path, name)
+                if child[0]:
+                    child_path_dec = os_utils.remove_extension(child_path, defaults.LOCALBOX_EXTENSION)
+                    child_node = MetaVFS(child[2], child_path_dec, True)
+                    dir_node.add_child(child_node)
+                    directories.append((child_path, join(dir_fs_path, name), child_node, child[2]))
+                else:
+                    self._add_file_entry(dir_node, child_path, name, listing)
+
+    def update_filepath_metadata(self, paths):
+        """
+        Bring filepath_metadata up to date for some paths only, instead of
+        scanning the whole sync folder: the entries at these paths, and
+        everything below them, are looked at again. A path whose directory is
+        gone, or not in the tree, is handled as a change of that directory.
+
+        :param paths: paths as in the MetaVFS trees, ex: '/docs/a.txt'
+        """
+        tree = self.filepath_metadata
+        updated = set()
+        for path in sorted(paths):
+            self._should_stop_sync()
+            parent_path = path.rsplit('/', 1)[0] or '/'
+            parent = tree.get_entry(parent_path)
+            parent_fs_path = self._get_fs_path(parent_path)
+            while path != '/' and (parent is None or not parent.is_dir or not isdir(parent_fs_path)):
+                path, parent_path = parent_path, parent_path.rsplit('/', 1)[0] or '/'
+                parent = tree.get_entry(parent_path)
+                parent_fs_path = self._get_fs_path(parent_path)
+            if path == '/':
+                self.populate_filepath_metadata(path='/', parent=None)
+                return
+            if _has_path_or_ancestor(path, updated):
+                continue
+            updated.add(path)
+
+            entry = tree.get_entry(path)
+            if entry is not None:
+                parent.remove_child(entry)
+            relative_path = path.lstrip('/')
+            name = relative_path.rsplit('/', 1)[-1]
+            listing = dict()
+            for entry_name in (name, name + defaults.LOCALBOX_EXTENSION):
+                stats = stat_entry(join(parent_fs_path, entry_name))
+                if stats is not None:
+                    listing[entry_name] = stats
+
+            if name in listing and listing[name][0]:
+                vfsnode = MetaVFS(listing[name][2], relative_path, True)
+                parent.add_child(vfsnode)
+                self._walk_directory(relative_path, join(parent_fs_path, name), vfsnode, listing[name][2])
+            elif name + defaults.LOCALBOX_EXTENSION in listing:
+                self._add_file_entry(parent, relative_path + defaults.LOCALBOX_EXTENSION,
+                                     name + defaults.LOCALBOX_EXTENSION, listing)
+            elif name in listing:
+                self._add_file_entry(parent, relative_path, name, listing)
+
+            # the change of an entry changes its directory
+            parent_stats = stat_entry(parent_fs_path)
+            if parent_stats is not None:
+                parent.modified_at = parent_stats[2]
+
+    def _get_fs_path(self, path):
+        """
+        :return: the file system path of a directory path as in the MetaVFS trees
+        """
+        return self.filepath if path == '/' else join(self.filepath, path.lstrip('/'))
+
+    @staticmethod
+    def _add_file_entry(vfsnode, path, name, listing):
+        """
+        Add the file 'name' of a directory listing to vfsnode, the same way
+        populate_filepath_metadata does for a single file.
+
+        :param listing: {name: (is_dir, size, mtime, inode)} of the directory
+        """
+        _, size, modtime, _ = listing[name]
+        if name.endswith(defaults.LOCALBOX_EXTENSION + defaults.PARTIAL_EXTENSION):
+            # download in progress
+            return
+        if not name.endswith(defaults.LOCALBOX_EXTENSION):
+            if name + defaults.LOCALBOX_EXTENSION in listing:
+                return
+        else:
+            decrypted = listing.get(name[:-len(defaults.LOCALBOX_EXTENSION)])
+            if decrypted is not None:
+                modtime = max(modtime, decrypted[2])
+                size = decrypted[1]
+        vfsnode.add_child(MetaVFS(modtime, os_utils.remove_extension(path, defaults.LOCALBOX_EXTENSION), False,
+                                  size=size))
+
     def mkdir(self, metavfs):
         localfilename = self.get_file_path(metavfs)
         makedirs(localfilename)
@@ -144,41 +364,92 @@ class Syncer(object):
                 getLogger(__name__).info("Already deleted " + fs_path)
 
     def download(self, path):
-        contents = self.localbox.get_file(path)
-        if contents is not None:
-            localfilename_noext = join(self.filepath, path[1:].decode('utf8'))
-            localfilename = localfilename_noext + defaults.LOCALBOX_EXTENSION
-            # precreate folder if needed
-            localdirname = dirname(localfilename)
-            if not exists(localdirname):
+        localfilename_noext = join(self.filepath, path[1:].decode('utf8'))
+        localfilename = localfilename_noext + defaults.LOCALBOX_EXTENSION
+        # precreate folder if needed
+        localdirname = dirname(localfilename)
+        if not exists(localdirname):
+            try:
                 makedirs(localdirname)
+            except OSError:
+                # created by a concurrent download
+                if not isdir(localdirname):
+                    raise
+
+        # stream new encrypted file to disk
+        getLogger(__name__).debug('Saving to disk: %s' % localfilename)
+        entry = self.localbox_metadata.get_entry(path)
+        self.localbox.get_file(path, filename=localfilename, modified_at=entry.modified_at, size=entry.size)
 
-            # save new encrypted file to disk
-            getLogger(__name__).debug('Saving to disk: %s' % localfilename)
-            localfile = open(localfilename, 'wb')
-            localfile.write(contents)
-            localfile.close()
+        # delete old decrypted file
+        if exists(localfilename_noext):
+            os.remove(localfilename_noext)
 
-            # delete old decrypted file
-            if exists(localfilename_noext):
-                os.remove(localfilename_noext)
+    def plan(self, local_paths=None):
+        """
+        Scan both sides and decide what needs to be done, without doing it.
 
-            localfilepath = self.localbox_metadata.get_entry(path)
-            modtime = localfilepath.modified_at
-            utime(localfilename, (time(), modtime))
+        :param local_paths: local paths that changed since the previous sync.
+        When given, the sync folder is not scanned: the tree saved by the
+        previous sync is updated for these paths and only the
+        :py:func:`sync.plan.changed_paths` are planned.
+        :return: list of :py:class:`sync.plan.SyncAction`
+        """
+        self.localbox_metadata = None
+        self.filepath_metadata = None
+        self.fetch_localbox_metadata()
+
+        oldmetadata = self._load_old_metadata()
+        full_tree = None
+        if local_paths is None or oldmetadata is None:
+            self.populate_filepath_metadata(path='/', parent=None)
         else:
-            getLogger(__name__).error('Failed to download %s' % path)
+            # a second copy, updated to become the local tree
+            self.filepath_metadata = self._load_old_metadata()
+            self.update_filepath_metadata(local_paths)
+            paths = changed_paths(self.localbox_metadata, self.filepath_metadata, oldmetadata, local_paths)
+            getLogger(__name__).info('incremental sync of %s: %d local changes, planning %d paths',
+                                     self.name, len(local_paths), len(paths))
+            full_tree = MetaVFS.merge_paths(paths, self.localbox_metadata, self.filepath_metadata, oldmetadata)
+        if oldmetadata is None:
+            oldmetadata = MetaVFS(path='/', modified_at=0)
 
-    @staticmethod
-    def _is_modified(filesystem_path):
-        new_hash = os_utils.hash_file(filesystem_path)
+        planner = Planner(self.localbox_metadata, self.filepath_metadata, oldmetadata, self.get_file_path)
+        return planner.plan(full_tree, check_stop=self._should_stop_sync)
+
+    def _load_old_metadata(self):
+        """
+        :return: the tree of the sync folder saved by the previous sync, None when there is none
+        """
         try:
-            is_modified = new_hash != openfiles_ctrl.load()[filesystem_path]
-        except KeyError:
-            is_modified = True
+            return MetaVFS(path='/', modified_at=0).load(OLD_SYNC_STATUS + self.name)
+        except (IOError, EOFError, AttributeError) as error:
+            getLogger(__name__).info(str(error) + " Using empty tree instead")
+            return None
+
+    def _take_journal(self, label):
+        """
+        Take the change journal of this sync, see :py:mod:`sync.controllers.journal_ctrl`.
 
-        openfiles_ctrl.load()[filesystem_path] = new_hash
-        return is_modified
+        :return: the local paths changed since the previous sync, or None when
+        the whole sync folder has to be scanned: incremental syncs are disabled
+        in sync.ini, the journal overflowed, there is no previous sync, or no
+        full scan was done since the watchdog started (changes made while it
+        did not run are not in the journal)
+        """
+        paths, overflowed = journal_ctrl.take(label)
+        if not get_option('sync', 'incremental_sync', defaults.INCREMENTAL_SYNC):
+            return None
+        watched_since = journal_ctrl.watched_since(label)
+        if watched_since is None or _full_scans.get(label, 0) < watched_since:
+            getLogger(__name__).info('full scan of %s: first sync since the watchdog started', self.name)
+            return None
+        if overflowed:
+            getLogger(__name__).info('full scan of %s: the change journal overflowed', self.name)
+            return None
+        if not exists(OLD_SYNC_STATUS + self.name):
+            return None
+        return paths
 
     @profile
     def syncsync(self):
@@ -195,84 +466,103 @@ class Syncer(object):
 
         getLogger(__name__).debug('got passphrase for label=%s' % label)
 
-        self.localbox_metadata = None
-        self.filepath_metadata = None
-        self.populate_localbox_metadata(path='/', parent=None)
-        self.populate_filepath_metadata(path='/', parent=None)
-
-        full_tree = MetaVFS('0', '/', True, None)
-        full_tree.add_paths(self.localbox_metadata)
-        full_tree.add_paths(self.filepath_metadata)
-
-        try:
-            oldmetadata = self.filepath_metadata.load(
-                OLD_SYNC_STATUS + self.name)
-            full_tree.add_paths(oldmetadata)
-        except (IOError, AttributeError) as error:
-            getLogger(__name__).info(str(error) + " Using empty tree instead")
-            oldmetadata = MetaVFS(path='/', modified_at=0)
+        started_at = time()
+        local_paths = self._take_journal(label)
+        actions = self.plan(local_paths)
+        self._prime_keys(actions, passphrase)
+        self._execute(actions, passphrase)
+        self._should_stop_sync()
 
-        for metavfs in full_tree.gen():
-            self._should_stop_sync()
+        if local_paths is None:
+            self.populate_filepath_metadata(path='./', parent=None)
+        else:
+            self.update_filepath_metadata(set(action.path for action in actions if action.action != SKIP))
+        self.filepath_metadata.save(OLD_SYNC_STATUS + self.name)
+        self._save_remote_status()
+        hash_cache.save()
+        journal_ctrl.commit(label)
+        if local_paths is None:
+            _full_scans[label] = started_at
+        getLogger(__name__).debug('HTTP connections opened/reused: %s', connection_pool.get_stats())
+        #Update workspace after sync
+        self.do_heartbeat()
 
-            try:
-                path = metavfs.path
+    def _execute(self, actions, passphrase):
+        """
+        Carry out a plan on up to 'transfer_workers' threads (see sync.ini).
+        Directories are created before anything inside them; deletes run after
+        all other actions, so a file that moved is uploaded before its old
+        location is removed. Entries inside a directory that is deleted anyway
+        are left to that delete.
 
-                oldfile = oldmetadata.get_entry(path)
-                localfile = self.filepath_metadata.get_entry(path)
-                remotefile = self.localbox_metadata.get_entry(path)
-                getLogger(__name__).debug(
-                    "====Local %s, Remote %s, Old %s ====", localfile, remotefile, oldfile)
+        :param actions: list of :py:class:`sync.plan.SyncAction` in the order of MetaVFS.gen
+        """
+        deleted, mkdir_indexes = dict(), dict()
+        functions, dependencies, deletes = [], [], []
+        for action in actions:
+            metavfs = action.metavfs
+            if action.action == SKIP:
+                continue
+            if action.action in (DELETE_LOCAL, DELETE_REMOTE):
+                if not _has_ancestor(metavfs, deleted, action.action):
+                    deleted[metavfs.path] = action.action
+                    deletes.append(self._action_function(action.action, metavfs, passphrase))
+                continue
+            depends_on = []
+            parent = metavfs.parent
+            while parent is not None:
+                if parent.path in mkdir_indexes:
+                    depends_on.append(mkdir_indexes[parent.path])
+                    break
+                parent = parent.parent
+            if action.action in (MKDIR_LOCAL, MKDIR_REMOTE):
+                mkdir_indexes[metavfs.path] = len(functions)
+            functions.append(self._action_function(action.action, metavfs, passphrase))
+            dependencies.append(depends_on)
+
+        workers = get_option('sync', 'transfer_workers', defaults.TRANSFER_WORKERS)
+        run_dependent(functions, dependencies, workers, self._stop_event)
+        self._should_stop_sync()
+        run_dependent(deletes, [[] for _ in deletes], workers, self._stop_event)
 
-                # hammer time :(
-                # to fixed directory deletion issue
-                if localfile is None and oldfile is not None and remotefile is not None:
-                    oldfile.modified_at = remotefile.modified_at
+    def _action_function(self, action, metavfs, passphrase):
+        path = metavfs.path
 
-                # if remotefile == oldfile and self.get_file_path(metavfs)is None:
-                if remotefile == oldfile and localfile is None:
+        def function():
+            try:
+                if action == DELETE_REMOTE:
                     getLogger(__name__).info("Deleting remote %s", path)
                     self.localbox.delete(metavfs)
-                    continue
-                # if localfile == oldfile and self.get_url_path(metavfs) is None:
-                if localfile == oldfile and remotefile is None:
+                elif action == DELETE_LOCAL:
                     getLogger(__name__).info("Deleting local %s", path)
                     self.delete(metavfs)
-                    continue
-
-                newest = MetaVFS.newest(oldfile, localfile, remotefile)
-
-                if newest == oldfile and newest is not None:
-                    getLogger(__name__).info(
-                        "Skipping %s because all files are older then the previous file", newest.path)
-                    continue
-
-                newest = MetaVFS.newest(localfile, remotefile)
-
-                filesystem_path = self.get_file_path(metavfs)
-                if newest == localfile and os.path.exists(filesystem_path):
-                    if not isdir(filesystem_path) and Syncer._is_modified(filesystem_path):
-                        getLogger(__name__).info('Starting upload %s:  %s', path, filesystem_path)
-                        self.localbox.upload_file(path, filesystem_path, passphrase)
-                    elif path != '/' and path not in self.localbox_metadata.get_paths():
-                        self.localbox.create_directory(path)
-                    continue
-                if newest == remotefile:
-                    getLogger(__name__).info("%s is_dir: %s", metavfs.path, metavfs.is_dir)
-                    if not metavfs.is_dir:
-                        getLogger(__name__).info("Downloading %s", newest.path)
-                        self.download(path)
-                    else:
-                        if not isdir(self.get_file_path(metavfs)):
-                            self.mkdir(metavfs)
-
-                    continue
+                elif action == UPLOAD:
+                    filesystem_path = self.get_file_path(metavfs)
+                    getLogger(__name__).info('Starting upload %s:  %s', path, filesystem_path)
+                    self.localbox.upload_file(path, filesystem_path, passphrase)
+                elif action == MKDIR_REMOTE:
+                    self.localbox.create_directory(path)
+                elif action == DOWNLOAD:
+                    getLogger(__name__).info("Downloading %s", path)
+                    self.download(path)
+                elif action == MKDIR_LOCAL:
+                    self.mkdir(metavfs)
             except Exception as error:
-                getLogger(__name__).exception("Problem '%s' with file %s; continuing", error, metavfs.path)
-        self.populate_filepath_metadata(path='./', parent=None)
-        self.filepath_metadata.save(OLD_SYNC_STATUS + self.name)
-        #Update workspace after sync
-        self.do_heartbeat()
+                getLogger(__name__).exception("Problem '%s' with file %s; continuing", error, path)
+
+        return function
+
+    def _prime_keys(self, actions, passphrase):
+        """
+        Fetch the keys of all files of the plan in one go, instead of one key
+        at a time during the transfers.
+        """
+        paths = [action.path for action in actions if action.action in (UPLOAD, DOWNLOAD)]
+        try:
+            self.localbox.prime_keys(paths, passphrase)
+        except Exception as error:  # pylint: disable=W0703
+            # the keys are fetched one at a time during the transfers instead
+            getLogger(__name__).warning('could not prime the keys for %s: %s', self.name, error)
 
     def do_heartbeat(self, force_gui_notif=False):
         getLogger(__name__).debug("Do heartbeat syncer.py")
@@ -399,27 +689,26 @@ class MainSyncer(Thread):
         map(lambda s: s.stop_event.set(), filter(lambda s: not s.stop_event.is_set(), stop_this_threads))
 
     def do_heartbeat(self, labels=None, force_gui_notif=False):
-        syncs_ctrl = SyncsController()
-
-        for sync_item in syncs_ctrl:
+        """
+        Probe the servers of the syncs of 'labels' (all syncs when None or
+        empty) at the same time, one lox_api/heartbeat per server url, and
+        notify for every sync whether its server is up and how fast it
+        answered, as soon as its server answered. A server gets
+        'heartbeat_connect_timeout' seconds to accept the connection and
+        'heartbeat_read_timeout' seconds to answer.
+        """
+        servers = OrderedDict()
+        for sync_item in SyncsController():
             if labels is None or labels == [] or sync_item.label in labels:
-                url = sync_item.url
-                path = sync_item.path
-                direction = sync_item.direction
-                label = sync_item.label
-
-                try:
-                    localbox_client = LocalBox(url, label, path)
-                    results = localbox_client.do_heartbeat()
-
-                    if results:
-                        Notifs().syncHeartbeatUp(label, force_gui_notif)
-                    else:
-                        Notifs().syncHeartbeatDown(label, force_gui_notif)
-
-                except URLError as error:
-                    Notifs().syncHeartbeatDown(sync_item.label, force_gui_notif)
+                servers.setdefault(sync_item.url.rstrip('/'), []).append(sync_item)
+        if not servers:
+            return
 
+        timeout = (get_option('sync', 'heartbeat_connect_timeout', defaults.HEARTBEAT_CONNECT_TIMEOUT),
+                   get_option('sync', 'heartbeat_read_timeout', defaults.HEARTBEAT_READ_TIMEOUT))
+        map_threaded(lambda server: _probe(server[0], server[1], timeout, force_gui_notif),
+                     servers.items(), len(servers))
+        remove_decrypted_files()
 
     def is_running(self):
         return self.waitevent.is_set()
@@ -458,7 +747,7 @@ def get_syncers():
             path = sync_item.path
             direction = sync_item.direction
             label = sync_item.label
-            localbox_client = LocalBox(url, label, path)
+            localbox_client = get_localbox(url, label, path)
 
             syncer = Syncer(localbox_client, path, direction, name=sync_item.label)
             sites.append(syncer)
@@ -476,5 +765,94 @@ def get_syncers():
     return sites
 
 
+def _probe(url, sync_items, timeout, force_gui_notif):
+    """
+    Do a heartbeat to the server at url and notify whether the syncs of
+    sync_items, all on that server, are up. A server that cannot be reached
+    in time, or answers with an error, is down.
+    """
+    sync_item = sync_items[0]
+    latency = None
+    try:
+        localbox_client = get_localbox(sync_item.url, sync_item.label, sync_item.path, timeout=timeout)
+        start = default_timer()
+        online = localbox_client.heartbeat(timeout)
+        latency = default_timer() - start
+        getLogger(__name__).debug('heartbeat of %s: %s in %.3f s', url, 'up' if online else 'down', latency)
+    except Exception as error:  # pylint: disable=W0703
+        getLogger(__name__).info('heartbeat of %s failed: %s', url, error)
+        online = False
+
+    for sync_item in sync_items:
+        if online:
+            Notifs().syncHeartbeatUp(sync_item.label, force_gui_notif, latency)
+        else:
+            Notifs().syncHeartbeatDown(sync_item.label, force_gui_notif)
+
+
+def _apply_changes(tree, changes):
+    """
+    Apply changes of lox_api/changes, see :py:meth:`sync.localbox.LocalBox.get_changes`,
+    to a MetaVFS tree of the server.
+
+    :raises ValueError: a change is about an entry whose directory is not in the tree
+    """
+    for change in changes:
+        path = normalize_path(change['path']).encode('utf-8')
+        entry = tree.get_entry(path)
+        if change.get('deleted'):
+            if entry is not None and entry.parent is not None:
+                entry.parent.remove_child(entry)
+            continue
+        if entry is not None and entry.is_dir == change['is_dir']:
+            entry.modified_at = change['modified_at']
+            entry.size = change.get('size')
+            continue
+        if entry is not None:
+            entry.parent.remove_child(entry)
+        parent = tree.get_entry(path.rsplit('/', 1)[0] or '/')
+        if parent is None or not parent.is_dir:
+            raise ValueError('the directory of changed entry %s is not known' % path)
+        parent.add_child(MetaVFS(change['modified_at'], change['path'], change['is_dir'], size=change.get('size')))
+
+
+def _has_path_or_ancestor(path, paths):
+    """
+    :return: whether path, or one of the paths above it, is in 'paths'
+    """
+    while path not in paths:
+        if path == '/':
+            return False
+        path = path.rsplit('/', 1)[0] or '/'
+    return True
+
+
+def _has_ancestor(metavfs, paths, value):
+    """
+    :return: whether an ancestor of metavfs is in 'paths' with 'value'
+    """
+    parent = metavfs.parent
+    while parent is not None:
+        if paths.get(parent.path) == value:
+            return True
+        parent = parent.parent
+    return False
+
+
+def _needs_meta_call(child, recursive):
+    """
+    Whether a child listed in a lox_api/meta answer lacks information and has
+    to be fetched with its own call.
+
+    :param child: child entry as returned by the server
+    :param recursive: whether the answer it came from honoured the 'depth'
+    """
+    if 'modified_at' not in child:
+        return True
+    if child.get('is_dir'):
+        return not (recursive and 'children' in child)
+    return False
+
+
 class StopSyncException(Exception):
     pass
@@ -0,0 +1,127 @@
+"""
+Helpers to run blocking calls (mostly HTTP requests) on a bounded number of
+threads. The threads close their database connection (see
+:py:func:`sync.database.get_connection`) when they finish.
+"""
+from collections import deque
+from threading import Condition, Thread
+
+from sync.database import close_connection
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty  # pylint: disable=F0401
+
+
+def map_threaded(function, items, workers, stop_event=None):
+    """
+    Call 'function' for every item using at most 'workers' threads.
+
+    :param function: called with one item
+    :param items: iterable of items
+    :param workers: maximum number of threads
+    :param stop_event: when set, items that were not started yet are skipped
+    :return: list with the result of each call in the order of 'items'. Calls
+    that raised get the exception as result, skipped items get None.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    queue = Queue()
+    for index, item in enumerate(items):
+        queue.put((index, item))
+
+    def work():
+        while stop_event is None or not stop_event.is_set():
+            try:
+                index, item = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[index] = function(item)
+            except Exception as error:  # pylint: disable=W0703
+                results[index] = error
+
+    threads = [Thread(target=_closing_connection, args=(work,)) for _ in range(min(max(workers, 1), len(items)))]
+    if len(threads) == 1:
+        work()
+        return results
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_dependent(functions, dependencies, workers, stop_event=None):
+    """
+    Call 'functions' using at most 'workers' threads, each one only after the
+    functions it depends on have returned.
+
+    :param functions: list of functions without arguments
+    :param dependencies: for each function, the indexes of the functions that
+    must finish before it starts
+    :param workers: maximum number of threads
+    :param stop_event: when set, functions that were not started yet are skipped
+    :return: list with the result of each call in the order of 'functions'.
+    Calls that raised get the exception as result, skipped calls get None.
+    """
+    results = [None] * len(functions)
+    remaining = [len(set(depends_on)) for depends_on in dependencies]
+    dependents = [[] for _ in functions]
+    for index, depends_on in enumerate(dependencies):
+        for dependency in set(depends_on):
+            dependents[dependency].append(index)
+    ready = deque(index for index, count in enumerate(remaining) if not count)
+    running = [0]
+    condition = Condition()
+
+    def stopped():
+        return stop_event is not None and stop_event.is_set()
+
+    def work():
+        while True:
+            with condition:
+                while not ready and running[0] and not stopped():
+                    # wake up now and then to notice the stop event
+                    condition.wait(1)
+                if not ready or stopped():
+                    condition.notify_all()
+                    return
+                index = ready.popleft()
+                running[0] += 1
+            try:
+                results[index] = functions[index]()
+            except Exception as error:  # pylint: disable=W0703
+                results[index] = error
+            with condition:
+                running[0] -= 1
+                for dependent in dependents[index]:
+                    remaining[dependent] -= 1
+                    if not remaining[dependent]:
+                        ready.append(dependent)
+                condition.notify_all()
+
+    threads = [Thread(target=_closing_connection, args=(work,)) for _ in range(min(max(workers, 1), len(functions)))]
+    if len(threads) == 1:
+        work()
+        return results
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _closing_connection(work):
+    """
+    Run work on a worker thread, then close the database connection the thread may have opened.
+    """
+    try:
+        work()
+    finally:
+        close_connection()
@@ -0,0 +1,260 @@
+from __future__ import absolute_import
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from threading import Event, Semaphore, Thread
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # pylint: disable=F0401
+
+
+class StubTokenHandler(BaseHTTPRequestHandler):
+    """
+    Answers loauth/token like loauth with 'server.tokens' in turn, each valid
+    'server.expires_in' seconds. Other paths answer {} to the last token
+    handed out and 401 to any other.
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        if not self.path.endswith('/token'):
+            if self.headers.get('Authorization') != 'Bearer %s' % self.server.token:
+                self.send_error(401)
+                return
+            self._send({})
+            return
+        time.sleep(self.server.delay)
+        token = self.server.tokens[min(self.server.calls, len(self.server.tokens) - 1)]
+        self.server.calls += 1
+        self.server.token = token
+        self._send({'access_token': token, 'expires_in': self.server.expires_in})
+
+    def _send(self, result):
+        data = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAuthenticator(unittest.TestCase):
+    """
+    Test the access token kept by :py:class:`sync.auth.Authenticator`.
+
+    """
+
+    def setUp(self):
+        from sync import config, database
+
+        self.directory = tempfile.mkdtemp()
+        self.paths = config.SYNCINI_PATH, database.DATABASE_PATH
+        config.SYNCINI_PATH = os.path.join(self.directory, 'sync.ini')
+        database.DATABASE_PATH = os.path.join(self.directory, 'database.sqlite3')
+        database.close_connection()
+        database.database_execute('insert into sites (site, user, client_id, client_secret, token) '
+                                  'values (?, ?, ?, ?, ?);', ('auth', 'user', 'id1', 'secret1', 'token0'))
+
+        self.server = HTTPServer(('127.0.0.1', 0), StubTokenHandler)
+        self.server.tokens = ['token1', 'token2']
+        self.server.expires_in = 3600
+        self.server.delay = 0
+        self.server.calls = 0
+        self.server.token = None
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        from sync import config, database
+        from sync.auth import forget
+
+        forget('auth')
+        self.server.shutdown()
+        self.server.server_close()
+        database.close_connection()
+        config.SYNCINI_PATH, database.DATABASE_PATH = self.paths
+        shutil.rmtree(self.directory)
+
+    def _get_authenticator(self):
+        from sync.auth import Authenticator
+
+        return Authenticator('http://127.0.0.1:%d/loauth/token' % self.server.server_address[1], 'auth')
+
+    def _count_queries(self):
+        from sync import auth
+
+        queries = []
+        database_execute = auth.database_execute
+
+        def counting_execute(command, params=None):
+            queries.append(command)
+            return database_execute(command, params)
+
+        auth.database_execute = counting_execute
+        self.addCleanup(setattr, auth, 'database_execute', database_execute)
+        return queries
+
+    def test_header_from_memory(self):
+        authenticator = self._get_authenticator()
+        queries = self._count_queries()
+
+        for _ in range(10):
+            self.assertEqual(authenticator.get_authorization_header(), 'Bearer token0')
+        self.assertEqual(queries, [])
+        self.assertEqual(self.server.calls, 0)
+
+    def test_single_refresh_when_expired(self):
+        from sync.database import database_execute
+
+        authenticator = self._get_authenticator()
+        authenticator.expires = time.time() - 1
+        self.server.delay = 0.2
+        headers = []
+        threads = [Thread(target=lambda: headers.append(authenticator.get_authorization_header()))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(headers, ['Bearer token1'] * 5)
+        self.assertEqual(self.server.calls, 1)
+        self.assertEqual(database_execute('select token from sites where site = ?', ('auth',)), [['token1']])
+
+    def test_unchanged_token_not_written(self):
+        authenticator = self._get_authenticator()
+        self.server.tokens = ['token0']
+        queries = self._count_queries()
+
+        authenticator.authenticate_with_client_secret()
+        self.assertEqual(queries, [])
+        self.server.tokens = ['token1']
+        self.server.calls = 0
+        authenticator.authenticate_with_client_secret()
+        self.assertEqual(len(queries), 1)
+
+    def _fake_timers(self):
+        """
+        Replace the clock and the timers of sync.auth: the clock is set with
+        'now', the timers only run when the test calls them.
+        """
+        from sync import auth
+
+        test = self
+        test.now = 1000.0
+        timers = []
+
+        class FakeTimer(object):
+            def __init__(self, interval, function, args=()):
+                self.interval = interval
+                self.function = function
+                self.args = args
+                self.started = self.cancelled = False
+                self.daemon = False
+                timers.append(self)
+
+            def start(self):
+                self.started = True
+
+            def cancel(self):
+                self.cancelled = True
+
+            def run(self):
+                test.now += self.interval
+                self.function(*self.args)
+
+        for name, fake in (('time', lambda: test.now), ('Timer', FakeTimer)):
+            self.addCleanup(setattr, auth, name, getattr(auth, name))
+            setattr(auth, name, fake)
+        return timers
+
+    def test_refresh_before_expiry(self):
+        from sync import defaults
+        from sync.auth import Authenticator, forget
+
+        timers = self._fake_timers()
+        authenticator = self._get_authenticator()
+
+        authenticator.authenticate_with_client_secret()
+        self.assertEqual(authenticator.get_authorization_header(), 'Bearer token1')
+        # renewed 'token_refresh_margin' seconds before the token expires
+        self.assertEqual(len(timers), 1)
+        self.assertTrue(timers[0].started)
+        self.assertEqual(timers[0].interval, 3600 - 5 - defaults.TOKEN_REFRESH_MARGIN)
+
+        timers[0].run()
+        self.assertEqual(self.server.calls, 2)
+        self.assertEqual(authenticator.get_authorization_header(), 'Bearer token2')
+        self.assertEqual(len(timers), 2)
+
+        # short lived tokens are renewed halfway
+        self.server.expires_in = 40
+        timers[1].run()
+        self.assertEqual(timers[2].interval, (40 - 5) / 2.0)
+
+        forget('auth')
+        self.assertTrue(timers[2].cancelled)
+        self.assertNotIn('auth', Authenticator.instance)
+        # a renewal running meanwhile does not start another timer
+        timers[2].run()
+        self.assertEqual(len(timers), 3)
+
+    def test_single_refresh_on_401(self):
+        from sync.localbox import LocalBox
+
+        try:
+            from urllib2 import Request
+        except ImportError:
+            from urllib.request import Request  # pylint: disable=F0401,E0611
+
+        localbox_client = LocalBox.__new__(LocalBox)
+        localbox_client.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        localbox_client._authenticator = self._get_authenticator()
+        # token0 is refused
+        self.server.delay = 0.2
+        answers = []
+        # every call sends token0 before any renewal
+        authenticator = localbox_client._authenticator
+        get_authorization_header = authenticator.get_authorization_header
+        started = Semaphore(0)
+        all_started = Event()
+
+        def get_first_authorization_header():
+            header = get_authorization_header()
+            started.release()
+            all_started.wait()
+            authenticator.get_authorization_header = get_authorization_header
+            return header
+
+        authenticator.get_authorization_header = get_first_authorization_header
+
+        def call():
+            request = Request(url=localbox_client.url + 'lox_api/meta', data='{}')
+            answers.append(json.loads(localbox_client._make_call(request).read()))
+
+        threads = [Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for _ in threads:
+            started.acquire()
+        all_started.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(answers, [{}] * 5)
+        self.assertEqual(self.server.calls, 1)
+        self.assertEqual(localbox_client.authenticator.refreshes, 1)
+        self.assertEqual(localbox_client.authenticator.coalesced, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # pylint: disable=F0401
+
+
+class StubUnauthorizedHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with 401 and the url of the authentication server, like a LocalBox server.
+    """
+
+    def do_GET(self):
+        self.server.calls += 1
+        self.send_response(401)
+        self.send_header('WWW-Authenticate',
+                         'Bearer domain="http://127.0.0.1:%d/loauth/token"' % self.server.server_address[1])
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestClientRegistry(unittest.TestCase):
+    """
+    Test the clients shared by :py:mod:`sync.client_registry`.
+
+    """
+
+    def setUp(self):
+        from sync import client_registry, config, database, defaults
+
+        self.directory = tempfile.mkdtemp()
+        self.paths = config.SYNCINI_PATH, database.DATABASE_PATH, defaults.AUTHENTICATION_URLS
+        config.SYNCINI_PATH = os.path.join(self.directory, 'sync.ini')
+        database.DATABASE_PATH = os.path.join(self.directory, 'database.sqlite3')
+        defaults.AUTHENTICATION_URLS = os.path.join(self.directory, 'authentication_urls.pickle')
+        database.close_connection()
+        self._reset()
+
+        self.server = HTTPServer(('127.0.0.1', 0), StubUnauthorizedHandler)
+        self.server.calls = 0
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        from sync import config, database, defaults
+        from sync.auth import forget
+
+        self.server.shutdown()
+        self.server.server_close()
+        self._reset()
+        for label in ('one', 'two'):
+            forget(label)
+        database.close_connection()
+        config.SYNCINI_PATH, database.DATABASE_PATH, defaults.AUTHENTICATION_URLS = self.paths
+        shutil.rmtree(self.directory)
+
+    def _reset(self):
+        from sync import client_registry
+
+        client_registry._clients.clear()
+        client_registry._authentication_urls = None
+
+    def test_shared_clients(self):
+        from sync.client_registry import forget, get_localbox
+
+        localbox_client = get_localbox(self.url, 'one', '/tmp/one')
+        self.assertEqual(localbox_client.authenticator.authentication_url, self.url + '/loauth/token')
+        self.assertIs(get_localbox(self.url + '/', 'one', '/tmp/one'), localbox_client)
+        self.assertIs(get_localbox(self.url, 'one', ''), localbox_client)
+        # the authentication url is asked once per server
+        self.assertIsNot(get_localbox(self.url, 'two', '/tmp/two'), localbox_client)
+        self.assertEqual(self.server.calls, 1)
+
+        self.assertIsNot(get_localbox(self.url, 'one', '/tmp/moved'), localbox_client)
+        forget('one')
+        self.assertEqual(get_localbox(self.url, 'one', '/tmp/one').path, '/tmp/one')
+        self.assertEqual(self.server.calls, 1)
+
+    def test_authentication_url_kept(self):
+        from sync import client_registry, defaults
+
+        client_registry.get_localbox(self.url, 'one', '/tmp/one')
+        # as in another process
+        self._reset()
+        self.assertEqual(client_registry.get_authentication_url(self.url), self.url + '/loauth/token')
+        client_registry.get_localbox(self.url, 'one', '/tmp/one')
+        self.assertEqual(self.server.calls, 1)
+        self.assertTrue(os.path.exists(defaults.AUTHENTICATION_URLS))
+
+        # asked again once it is too old
+        authentication_url, found_at = client_registry._authentication_urls[self.url + '/']
+        client_registry._authentication_urls[self.url + '/'] = (authentication_url,
+                                                                 found_at - defaults.AUTHENTICATION_URL_TTL - 1)
+        self.assertIsNone(client_registry.get_authentication_url(self.url))
+        client_registry.forget('one')
+        client_registry.get_localbox(self.url, 'one', '/tmp/one')
+        self.assertEqual(self.server.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestGetOption(unittest.TestCase):
+    """
+    Test :py:func:`sync.config.get_option`.
+
+    """
+
+    def setUp(self):
+        from sync import config
+
+        self.directory = tempfile.mkdtemp()
+        self.syncini_path = config.SYNCINI_PATH
+        config.SYNCINI_PATH = os.path.join(self.directory, 'sync.ini')
+
+    def tearDown(self):
+        from sync import config
+
+        config.SYNCINI_PATH = self.syncini_path
+        shutil.rmtree(self.directory)
+
+    def _write(self, contents, mtime):
+        from sync import config
+
+        with open(config.SYNCINI_PATH, 'w') as ini_file:
+            ini_file.write(contents)
+        os.utime(config.SYNCINI_PATH, (mtime, mtime))
+
+    def _count_parses(self):
+        from sync import config
+
+        parses = []
+        parser_class = config.ConfigParser
+
+        def counting_parser():
+            parses.append(None)
+            return parser_class()
+
+        config.ConfigParser = counting_parser
+        self.addCleanup(setattr, config, 'ConfigParser', parser_class)
+        return parses
+
+    def test_types_and_defaults(self):
+        from sync.config import get_option
+
+        self._write('[sync]\ndelay = 5\nenabled = yes\nratio = oops\n', 1000)
+
+        self.assertEqual(get_option('sync', 'delay', 10), 5)
+        self.assertIs(get_option('sync', 'enabled', False), True)
+        self.assertEqual(get_option('sync', 'ratio', 0.5), 0.5)
+        self.assertEqual(get_option('sync', 'missing', 'default'), 'default')
+        self.assertEqual(get_option('other', 'delay', 10), 10)
+
+    def test_parsed_once_per_change(self):
+        from sync.config import get_option
+
+        self._write('[sync]\ndelay = 5\n', 1000)
+        parses = self._count_parses()
+
+        for _ in range(10):
+            self.assertEqual(get_option('sync', 'delay', 10), 5)
+        self.assertEqual(len(parses), 1)
+
+        self._write('[sync]\ndelay = 6\n', 2000)
+        self.assertEqual(get_option('sync', 'delay', 10), 6)
+        os.remove(os.path.join(self.directory, 'sync.ini'))
+        self.assertEqual(get_option('sync', 'delay', 10), 10)
+        self.assertEqual(len(parses), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+
+class TestDatabase(unittest.TestCase):
+    """
+    Test the connections kept by :py:mod:`sync.database`.
+
+    """
+
+    def setUp(self):
+        from sync import config, database
+
+        self.directory = tempfile.mkdtemp()
+        self.paths = config.SYNCINI_PATH, database.DATABASE_PATH
+        config.SYNCINI_PATH = os.path.join(self.directory, 'sync.ini')
+        database.DATABASE_PATH = os.path.join(self.directory, 'database.sqlite3')
+        database.close_connection()
+
+    def tearDown(self):
+        from sync import config, database
+
+        database.close_connection()
+        config.SYNCINI_PATH, database.DATABASE_PATH = self.paths
+        shutil.rmtree(self.directory)
+
+    def test_connection_per_thread(self):
+        from sync import database
+
+        connection = database.get_connection()
+        self.assertIs(database.get_connection(), connection)
+        self.assertEqual(str(connection.execute('PRAGMA journal_mode').fetchone()[0]), 'wal')
+
+        other = []
+        thread = Thread(target=lambda: other.append(database.get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], connection)
+
+    def test_executemany(self):
+        from sync.database import database_execute, database_executemany
+
+        database_executemany('insert into keys (site, user, fingerprint) values (?, ?, ?)',
+                             [('site', 'user%d' % number, 'f%d' % number) for number in range(5)])
+
+        self.assertEqual(database_execute('select count(*) from keys where site = ?', ('site',)), [['5']])
+
+    def test_configuration_change(self):
+        from sync import config, database
+
+        database.database_execute('select token from sites')
+        filename = os.path.join(self.directory, 'other.sqlite3')
+        with open(config.SYNCINI_PATH, 'w') as ini_file:
+            ini_file.write('[database]\ntype = sqlite\nfilename = %s\n' % filename)
+        # the mtime of sync.ini tells it changed
+        os.utime(config.SYNCINI_PATH, (1, 1))
+
+        database.database_execute('select token from sites')
+        self.assertTrue(os.path.exists(filename))
+
+    def test_worker_connections_closed(self):
+        from sqlite3 import ProgrammingError
+        from sync import database
+        from sync.workers import map_threaded
+
+        connections = []
+        sqlite_connect = database.sqlite_connect
+
+        def recording_connect(*args, **kwargs):
+            # usable from this thread, to tell they were closed
+            connections.append(sqlite_connect(*args, check_same_thread=False, **kwargs))
+            return connections[-1]
+
+        database.sqlite_connect = recording_connect
+        self.addCleanup(setattr, database, 'sqlite_connect', sqlite_connect)
+
+        map_threaded(lambda _: database.database_execute('select token from sites'), range(4), 4)
+
+        # one per worker thread that ran a statement
+        self.assertTrue(connections)
+        for connection in connections:
+            self.assertRaises(ProgrammingError, connection.execute, 'select 1')
+
+
+if __name__ == '__main__':
+    unittest.main()
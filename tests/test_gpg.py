@@ -0,0 +1,108 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+from threading import Thread
+
+from sync.gpg import PGPKey
+
+
+@unittest.skipIf(PGPKey is None or find_executable('gpg') is None, 'needs PGPy and the gpg binary')
+class TestInProcessGpg(unittest.TestCase):
+    """
+    Test that :py:class:`sync.gpg.InProcessGpg` decrypts what the gpg binary encrypts.
+
+    """
+
+    def setUp(self):
+        from sync import config, database
+        from sync.gpg import gpg, InProcessGpg
+
+        self.directory = tempfile.mkdtemp()
+        self.paths = config.SYNCINI_PATH, database.DATABASE_PATH
+        config.SYNCINI_PATH = os.path.join(self.directory, 'sync.ini')
+        database.DATABASE_PATH = os.path.join(self.directory, 'database.sqlite3')
+        database.close_connection()
+        self.addCleanup(InProcessGpg.forget)
+
+        self.keyring = os.path.join(self.directory, 'gnupg')
+        os.mkdir(self.keyring, 0o700)
+        self.subprocess_gpg = gpg(self.keyring)
+        self.assertTrue(self.subprocess_gpg.generate('passphrase', 'site', 'user'), 'gpg did not generate a key')
+        self.inprocess_gpg = InProcessGpg(self.keyring)
+
+    def tearDown(self):
+        from sync import config, database
+
+        database.close_connection()
+        config.SYNCINI_PATH, database.DATABASE_PATH = self.paths
+        # the gpg-agent of the keyring removes its sockets when it stops, not while the keyring is removed
+        if find_executable('gpgconf') is not None:
+            subprocess.call(['gpgconf', '--homedir', self.keyring, '--kill', 'gpg-agent'])
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        key = os.urandom(32)
+        encrypted = self.subprocess_gpg.encrypt(key, 'site', 'user')
+
+        self.assertEqual(self.inprocess_gpg.decrypt(encrypted, 'passphrase'), key)
+        self.assertEqual(self.subprocess_gpg.decrypt(encrypted, 'passphrase'), key)
+        # from the kept key
+        self.assertEqual(self.inprocess_gpg.decrypt(encrypted, 'passphrase'), key)
+        self.assertEqual(self.inprocess_gpg.decrypt(encrypted, 'wrong'), '')
+
+    def test_forget(self):
+        from sync.gpg import InProcessGpg
+
+        key = os.urandom(32)
+        encrypted = self.subprocess_gpg.encrypt(key, 'site', 'user')
+        self.assertEqual(self.inprocess_gpg.decrypt(encrypted, 'passphrase'), key)
+        unlocked = list(InProcessGpg._unlocked_keys.values())[0][0]
+
+        InProcessGpg.forget()
+
+        self.assertEqual((InProcessGpg._secret_keys, InProcessGpg._unlocked_keys), (dict(), dict()))
+        self.assertFalse(unlocked.is_unlocked)
+        self.assertEqual(self.inprocess_gpg.decrypt(encrypted, 'passphrase'), key)
+
+    def test_unlocked_keys_expire(self):
+        from sync import defaults, gpg
+        from sync.gpg import InProcessGpg
+
+        key = os.urandom(32)
+        encrypted = self.subprocess_gpg.encrypt(key, 'site', 'user')
+        now = gpg.time()
+        self.addCleanup(setattr, gpg, 'time', gpg.time)
+        gpg.time = lambda: now
+        self.inprocess_gpg.decrypt(encrypted, 'passphrase')
+        unlocked = list(InProcessGpg._unlocked_keys.values())[0][0]
+
+        gpg.time = lambda: now + defaults.KEY_CACHE_TTL - 1
+        self.assertEqual(self.inprocess_gpg.decrypt(encrypted, 'passphrase'), key)
+        self.assertIs(list(InProcessGpg._unlocked_keys.values())[0][0], unlocked)
+        gpg.time = lambda: now + defaults.KEY_CACHE_TTL
+        self.assertEqual(self.inprocess_gpg.decrypt(encrypted, 'passphrase'), key)
+        self.assertIsNot(list(InProcessGpg._unlocked_keys.values())[0][0], unlocked)
+
+    def test_parallel_decryptions(self):
+        keys = [os.urandom(32) for _ in range(8)]
+        encrypted = [self.subprocess_gpg.encrypt(key, 'site', 'user') for key in keys]
+        results = [None] * len(keys)
+
+        def decrypt(index):
+            results[index] = self.inprocess_gpg.decrypt(encrypted[index], 'passphrase')
+
+        threads = [Thread(target=decrypt, args=(index,)) for index in range(len(keys))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
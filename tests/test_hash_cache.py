@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from time import time
+
+
+class TestHashCache(unittest.TestCase):
+    """
+    Test :py:class:`sync.hash_cache.HashCache`.
+
+    """
+
+    def setUp(self):
+        from sync.hash_cache import HashCache
+
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'a.txt')
+        self._write(b'a' * 100)
+        self.cache = HashCache(os.path.join(self.directory, 'hashcache.pickle'), 10, 'sha1')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, contents, age=60):
+        with open(self.filename, 'wb') as new_file:
+            new_file.write(contents)
+        # files changed just before they are hashed are not cached, see RACY_INTERVAL
+        modified_at = time() - age
+        os.utime(self.filename, (modified_at, modified_at))
+
+    def test_unchanged_file_is_not_hashed_again(self):
+        digest = self.cache.hash_file(self.filename)
+
+        self.assertEqual(digest, hashlib.sha1(b'a' * 100).hexdigest())
+        self.assertEqual(self.cache.hash_file(self.filename), digest)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_changed_file(self):
+        self.cache.hash_file(self.filename)
+        self._write(b'b' * 100, age=30)
+
+        self.assertEqual(self.cache.hash_file(self.filename), hashlib.sha1(b'b' * 100).hexdigest())
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_recent_file_is_not_cached(self):
+        self._write(b'c', age=0)
+        self.cache.hash_file(self.filename)
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_persistence(self):
+        from sync.hash_cache import HashCache
+
+        digest = self.cache.hash_file(self.filename)
+        self.cache.save()
+        cache = HashCache(self.cache.filename, 10, 'sha1').load()
+
+        self.assertEqual(cache.hash_file(self.filename), digest)
+        self.assertEqual(cache.hits, 1)
+        # hashes of another algorithm are not used
+        cache = HashCache(self.cache.filename, 10, 'md5').load()
+        self.assertEqual(cache.hash_file(self.filename), hashlib.md5(b'a' * 100).hexdigest())
+
+    def test_hash_stream(self):
+        from sync.hash_cache import hash_stream
+
+        self.assertEqual(hash_stream(self.filename, 'sha256', chunk_size=16), hashlib.sha256(b'a' * 100).hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()
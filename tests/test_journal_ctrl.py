@@ -0,0 +1,103 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestJournalCtrl(unittest.TestCase):
+    """
+    Test the change journal of :py:mod:`sync.controllers.journal_ctrl`.
+
+    """
+
+    def setUp(self):
+        from sync import defaults
+        from sync.controllers import journal_ctrl
+
+        self.directory = tempfile.mkdtemp()
+        self.journal_path = defaults.CHANGE_JOURNAL
+        self.max_entries = defaults.JOURNAL_MAX_ENTRIES
+        defaults.CHANGE_JOURNAL = os.path.join(self.directory, 'journal.')
+        journal_ctrl.remove('stub')
+        journal_ctrl._max_entries = None
+
+    def tearDown(self):
+        from sync import defaults
+        from sync.controllers import journal_ctrl
+
+        journal_ctrl.flush()
+        journal_ctrl.remove('stub')
+        journal_ctrl._max_entries = None
+        defaults.CHANGE_JOURNAL = self.journal_path
+        defaults.JOURNAL_MAX_ENTRIES = self.max_entries
+        shutil.rmtree(self.directory)
+
+    def test_take_and_commit(self):
+        from sync.controllers import journal_ctrl
+
+        journal_ctrl.append('stub', '/a.txt')
+        journal_ctrl.append('stub', '/docs/b.txt', '/a.txt')
+
+        self.assertEqual(journal_ctrl.take('stub'), ({'/a.txt', '/docs/b.txt'}, False))
+        journal_ctrl.append('stub', '/c.txt')
+        journal_ctrl.commit('stub')
+        self.assertEqual(journal_ctrl.take('stub'), ({'/c.txt'}, False))
+
+    def test_uncommitted_paths_are_taken_again(self):
+        from sync.controllers import journal_ctrl
+
+        journal_ctrl.append('stub', '/a.txt')
+        journal_ctrl.take('stub')
+        # the sync that took '/a.txt' did not finish
+        journal_ctrl.append('stub', '/b.txt')
+
+        self.assertEqual(journal_ctrl.take('stub'), ({'/a.txt', '/b.txt'}, False))
+
+    def test_overflow(self):
+        from sync import defaults
+        from sync.controllers import journal_ctrl
+
+        defaults.JOURNAL_MAX_ENTRIES = 2
+        journal_ctrl.append('stub', '/a.txt', '/b.txt')
+        journal_ctrl.append('stub', '/c.txt')
+        journal_ctrl.append('stub', '/d.txt')
+
+        self.assertEqual(journal_ctrl.take('stub'), ({'/a.txt', '/b.txt'}, True))
+        journal_ctrl.commit('stub')
+        journal_ctrl.append('stub', '/e.txt')
+        self.assertEqual(journal_ctrl.take('stub'), ({'/e.txt'}, False))
+
+    def test_group_commit(self):
+        from sync import defaults
+        from sync.controllers import journal_ctrl
+
+        fsyncs = []
+        fsync = os.fsync
+        os.fsync = lambda fileno: fsyncs.append(fileno)
+        self.addCleanup(setattr, os, 'fsync', fsync)
+        options = []
+        get_option = journal_ctrl.get_option
+        journal_ctrl.get_option = lambda *args: options.append(args) or get_option(*args)
+        self.addCleanup(setattr, journal_ctrl, 'get_option', get_option)
+        self.addCleanup(setattr, defaults, 'JOURNAL_COMMIT_DELAY', defaults.JOURNAL_COMMIT_DELAY)
+        defaults.JOURNAL_COMMIT_DELAY = 60
+
+        for name in ('/a.txt', '/b.txt', '/c.txt'):
+            journal_ctrl.append('stub', name)
+        self.assertFalse(os.path.exists(journal_ctrl.get_filename('stub')))
+        journal_ctrl.flush()
+
+        self.assertEqual(len(fsyncs), 1)
+        self.assertEqual(len(options), 1)
+        with open(journal_ctrl.get_filename('stub'), 'rb') as journal:
+            self.assertEqual(journal.read(), b'/a.txt\n/b.txt\n/c.txt\n')
+        # written by the timer, or taken before
+        defaults.JOURNAL_COMMIT_DELAY = 0.01
+        journal_ctrl.append('stub', '/d.txt')
+        self.assertEqual(journal_ctrl.take('stub'), ({'/a.txt', '/b.txt', '/c.txt', '/d.txt'}, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
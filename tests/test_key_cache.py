@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+
+import unittest
+
+
+class TestKeyCache(unittest.TestCase):
+    """
+    Test :py:class:`sync.key_cache.KeyCache`.
+
+    """
+
+    def test_get(self):
+        from sync.key_cache import KeyCache
+
+        cache = KeyCache(ttl=60, max_size=10)
+        cache.set('label', 'share', 'passphrase', b'k' * 32, b'i' * 16)
+
+        self.assertEqual(cache.get('label', 'share', 'passphrase'), (b'k' * 32, b'i' * 16))
+        self.assertIsNone(cache.get('other', 'share', 'passphrase'))
+        self.assertIsNone(cache.get('label', 'other', 'passphrase'))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_other_passphrase(self):
+        from sync.key_cache import KeyCache
+
+        cache = KeyCache(ttl=60, max_size=10)
+        cache.set('label', 'share', 'passphrase', b'k' * 32, b'i' * 16)
+
+        self.assertIsNone(cache.get('label', 'share', 'wrong'))
+        self.assertEqual(len(cache), 0)
+
+    def test_expiry(self):
+        from sync import key_cache
+
+        cache = key_cache.KeyCache(ttl=60, max_size=10)
+        cache.set('label', 'share', 'passphrase', b'k' * 32, b'i' * 16)
+        entry = cache._entries[('label', 'share')]
+
+        real_time = key_cache.time
+        key_cache.time = lambda: real_time() + 61
+        try:
+            self.assertIsNone(cache.get('label', 'share', 'passphrase'))
+        finally:
+            key_cache.time = real_time
+        self.assertEqual(entry[0], bytearray(32))
+
+    def test_lru_eviction(self):
+        from sync.key_cache import KeyCache
+
+        cache = KeyCache(ttl=60, max_size=2)
+        cache.set('label', 'a', 'passphrase', b'a' * 32, b'i' * 16)
+        cache.set('label', 'b', 'passphrase', b'b' * 32, b'i' * 16)
+        evicted = cache._entries[('label', 'b')]
+        cache.get('label', 'a', 'passphrase')
+        cache.set('label', 'c', 'passphrase', b'c' * 32, b'i' * 16)
+
+        self.assertIsNotNone(cache.get('label', 'a', 'passphrase'))
+        self.assertIsNone(cache.get('label', 'b', 'passphrase'))
+        self.assertEqual(evicted[0], bytearray(32))
+        self.assertEqual(evicted[1], bytearray(16))
+
+    def test_invalidate(self):
+        from sync.key_cache import KeyCache
+
+        cache = KeyCache(ttl=60, max_size=10)
+        cache.set('label', 'share', 'passphrase', b'k' * 32, b'i' * 16)
+        cache.set('other', 'share', 'passphrase', b'k' * 32, b'i' * 16)
+
+        cache.invalidate('label')
+        self.assertIsNone(cache.get('label', 'share', 'passphrase'))
+        self.assertIsNotNone(cache.get('other', 'share', 'passphrase'))
+
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+
+class TestGetAesKey(unittest.TestCase):
+    """
+    Test that :py:meth:`sync.localbox.LocalBox.get_aes_key` fetches a key once per keys path.
+
+    """
+
+    def test_cached(self):
+        from sync import key_cache
+        from sync.localbox import LocalBox
+
+        calls = []
+
+        def call_keys(path, passphrase):
+            calls.append(path)
+            return b'k' * 32, b'i' * 16
+
+        localbox_client = LocalBox.__new__(LocalBox)
+        localbox_client.label = 'key-cache-test'
+        localbox_client.call_keys = call_keys
+        self.addCleanup(key_cache.invalidate, 'key-cache-test')
+
+        first = localbox_client.get_aes_key('/share/a.txt', 'passphrase')
+        second = localbox_client.get_aes_key('/share/sub/b.txt', 'passphrase')
+
+        self.assertEqual(calls, ['/share/a.txt'])
+        self.assertEqual(second.decrypt(first.encrypt(b'x' * 16)), b'x' * 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,362 @@
+from __future__ import absolute_import
+
+import json
+from base64 import b64decode
+import os
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import urlsplit, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # pylint: disable=F0401
+    from urllib.parse import urlsplit, parse_qs  # pylint: disable=F0401,E0611
+
+#: remote files served by the stub server: path -> encrypted contents
+REMOTE_FILES = {
+    '/docs/a.txt': b'0123456789abcdef' * 1000,
+}
+
+
+class StubFilesHandler(BaseHTTPRequestHandler):
+    """
+    Answers lox_api/files like a LocalBox server. Uploads are stored in the
+    'uploads' list of the server, raw ones only if 'raw' is set on the server,
+    upload sessions only if 'sessions' is set. 'drop_download_at' and
+    'fail_chunk_at' make the next download or chunk upload fail at that offset.
+    """
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append((self.path, self.headers.get('Range')))
+        if self.path.startswith('/lox_api/files/raw'):
+            if not self.server.raw:
+                self.send_error(404)
+                return
+            self.server.uploads.append(('raw', self.path, data))
+            self._send(b'')
+            return
+        if self.path.startswith('/lox_api/files/upload'):
+            self._session(data)
+            return
+
+        body = json.loads(data)
+        if 'contents' in body:
+            self.server.uploads.append(('json', body['path'], b64decode(body['contents'])))
+            self._send(b'')
+            return
+        if body['path'] not in REMOTE_FILES:
+            self.send_error(404)
+            return
+
+        self._download(REMOTE_FILES[body['path']])
+
+    do_GET = do_POST
+
+    def _download(self, data):
+        offset = 0
+        if self.headers.get('Range'):
+            offset = int(self.headers['Range'][len('bytes='):-1])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (offset, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - offset))
+        self.end_headers()
+        if self.server.drop_download_at is not None:
+            self.wfile.write(data[offset:self.server.drop_download_at])
+            self.server.drop_download_at = None
+            return
+        self.wfile.write(data[offset:])
+
+    def _session(self, data):
+        if not self.server.sessions:
+            self.send_error(404)
+            return
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path == '/lox_api/files/upload':
+            session_id = str(len(self.server.sessions_data) + 1)
+            self.server.sessions_data[session_id] = [query['path'][0], b'']
+            self._send(json.dumps({'id': session_id, 'offset': 0}).encode('utf-8'))
+            return
+
+        session_id = parts.path.split('/')[4]
+        session = self.server.sessions_data[session_id]
+        if parts.path.endswith('/commit'):
+            self.server.uploads.append(('session', session[0], session[1]))
+            self._send(b'')
+            return
+        if 'offset' in query:
+            offset = int(query['offset'][0])
+            if offset == self.server.fail_chunk_at:
+                self.server.fail_chunk_at = None
+                self.send_error(500)
+                return
+            session[1] = session[1][:offset] + data
+        self._send(json.dumps({'offset': len(session[1])}).encode('utf-8'))
+
+    def _send(self, data):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeAuthenticator(object):
+    label = 'stub'
+
+    def get_authorization_header(self):
+        return 'Bearer stub'
+
+
+class StubServerTestCase(unittest.TestCase):
+    """
+    Runs the stub server and sets up a LocalBox client for it.
+    """
+
+    def setUp(self):
+        from sync import defaults
+        from sync.controllers import transfers_ctrl
+        from sync.localbox import LocalBox
+
+        self.server = HTTPServer(('127.0.0.1', 0), StubFilesHandler)
+        self.server.raw = True
+        self.server.sessions = False
+        self.server.sessions_data = {}
+        self.server.drop_download_at = None
+        self.server.fail_chunk_at = None
+        self.server.uploads = []
+        self.server.requests = []
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.directory = tempfile.mkdtemp()
+        self.state_directory = tempfile.mkdtemp()
+        self.transfers_path = defaults.LOCALBOX_TRANSFERS
+        defaults.LOCALBOX_TRANSFERS = os.path.join(self.state_directory, 'transfers.pickle')
+        self.localbox_client = LocalBox.__new__(LocalBox)
+        self.localbox_client.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        self.localbox_client.label = 'stub'
+        self.localbox_client.path = self.directory
+        self.localbox_client._authentication_url = None
+        self.localbox_client._authenticator = FakeAuthenticator()
+        self.localbox_client._upload_sessions = None
+        self.localbox_client._raw_upload = None
+
+    def tearDown(self):
+        from sync import defaults
+        from sync.controllers import transfers_ctrl
+
+        transfers_ctrl.flush()
+        defaults.LOCALBOX_TRANSFERS = self.transfers_path
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+        shutil.rmtree(self.state_directory)
+
+
+class TestGetFile(StubServerTestCase):
+    """
+    Test :py:meth:`sync.localbox.LocalBox.get_file` against a stub server.
+
+    """
+
+    def test_in_memory(self):
+        self.assertEqual(self.localbox_client.get_file('/docs/a.txt'), REMOTE_FILES['/docs/a.txt'])
+
+    def test_streamed_to_file(self):
+        from sync import defaults
+
+        filename = os.path.join(self.directory, 'a.txt.lox')
+        with open(filename, 'wb') as old_file:
+            old_file.write(b'old contents')
+        defaults_chunk_size, defaults.TRANSFER_CHUNK_SIZE = defaults.TRANSFER_CHUNK_SIZE, 1024
+        try:
+            size = self.localbox_client.get_file('/docs/a.txt', filename=filename, modified_at=1000000000)
+        finally:
+            defaults.TRANSFER_CHUNK_SIZE = defaults_chunk_size
+
+        self.assertEqual(size, len(REMOTE_FILES['/docs/a.txt']))
+        with open(filename, 'rb') as new_file:
+            self.assertEqual(new_file.read(), REMOTE_FILES['/docs/a.txt'])
+        self.assertEqual(int(os.path.getmtime(filename)), 1000000000)
+        self.assertEqual(os.listdir(self.directory), ['a.txt.lox'])
+
+    def _small_chunks(self):
+        from sync import defaults
+
+        self.addCleanup(setattr, defaults, 'TRANSFER_CHUNK_SIZE', defaults.TRANSFER_CHUNK_SIZE)
+        defaults.TRANSFER_CHUNK_SIZE = 1024
+
+    def test_resume_download(self):
+        from sync.controllers import transfers_ctrl
+
+        self._small_chunks()
+        filename = os.path.join(self.directory, 'a.txt.lox')
+        size = len(REMOTE_FILES['/docs/a.txt'])
+        self.server.drop_download_at = 5000
+
+        self.assertRaises(IOError, self.localbox_client.get_file, '/docs/a.txt', filename=filename, modified_at=1,
+                          size=size)
+        self.assertEqual(os.path.getsize(filename + '.part'), 5000)
+        # as after a restart
+        transfers_ctrl.flush()
+        transfers_ctrl._transfers = None
+
+        self.localbox_client.get_file('/docs/a.txt', filename=filename, modified_at=1, size=size)
+
+        with open(filename, 'rb') as new_file:
+            self.assertEqual(new_file.read(), REMOTE_FILES['/docs/a.txt'])
+        self.assertEqual([range_header for _, range_header in self.server.requests], [None, 'bytes=5000-'])
+        self.assertEqual(os.listdir(self.directory), ['a.txt.lox'])
+
+    def test_partial_download_of_other_version(self):
+        self._small_chunks()
+        filename = os.path.join(self.directory, 'a.txt.lox')
+        size = len(REMOTE_FILES['/docs/a.txt'])
+        self.server.drop_download_at = 5000
+        self.assertRaises(IOError, self.localbox_client.get_file, '/docs/a.txt', filename=filename, modified_at=1,
+                          size=size)
+        self.server.drop_download_at = 5000
+        # same modified_at, other size
+        self.assertRaises(IOError, self.localbox_client.get_file, '/docs/a.txt', filename=filename, modified_at=1,
+                          size=size + 1)
+
+        self.localbox_client.get_file('/docs/a.txt', filename=filename, modified_at=2, size=size)
+
+        with open(filename, 'rb') as new_file:
+            self.assertEqual(new_file.read(), REMOTE_FILES['/docs/a.txt'])
+        self.assertEqual([range_header for _, range_header in self.server.requests], [None, None, None])
+
+    def test_small_download_not_recorded(self):
+        from sync import defaults
+        from sync.controllers import transfers_ctrl
+
+        filename = os.path.join(self.directory, 'a.txt.lox')
+        self.localbox_client.get_file('/docs/a.txt', filename=filename, modified_at=1,
+                                      size=len(REMOTE_FILES['/docs/a.txt']))
+
+        self.assertIsNone(transfers_ctrl._save_timer)
+        self.assertFalse(os.path.exists(defaults.LOCALBOX_TRANSFERS))
+
+    def test_transfers_follow_path_change(self):
+        from sync import defaults
+        from sync.controllers import transfers_ctrl
+
+        transfers_ctrl.put(('download', 'stub', '/docs/a.txt'), 1)
+        transfers_ctrl.flush()
+        defaults.LOCALBOX_TRANSFERS = os.path.join(self.state_directory, 'other.pickle')
+
+        self.assertIsNone(transfers_ctrl.get(('download', 'stub', '/docs/a.txt')))
+
+    def test_failed_download_leaves_no_file(self):
+        try:
+            from urllib2 import HTTPError
+        except ImportError:
+            from urllib.error import HTTPError  # pylint: disable=F0401,E0611
+
+        filename = os.path.join(self.directory, 'missing.lox')
+
+        self.assertRaises(HTTPError, self.localbox_client.get_file, '/missing', filename=filename)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class TestUploadFile(StubServerTestCase):
+    """
+    Test :py:meth:`sync.localbox.LocalBox.upload_file` against a stub server.
+
+    """
+
+    def _upload(self, size=5000, attempts=1):
+        from Crypto.Cipher.AES import MODE_CFB
+        from Crypto.Cipher.AES import new as AES_Key
+        from sync import defaults
+        from sync.gpg import gpg
+
+        key = lambda: AES_Key(b'k' * 32, MODE_CFB, b'i' * 16, segment_size=128)
+        self.localbox_client.get_aes_key = lambda path, passphrase: key()
+        filename = os.path.join(self.directory, 'b.txt')
+        contents = os.urandom(size)
+        with open(filename, 'wb') as plain_file:
+            plain_file.write(contents)
+
+        defaults_chunk_size, defaults.TRANSFER_CHUNK_SIZE = defaults.TRANSFER_CHUNK_SIZE, 1024
+        try:
+            for _ in range(attempts):
+                self.localbox_client.upload_file('/b.txt', filename, 'passphrase', remove=False)
+        finally:
+            defaults.TRANSFER_CHUNK_SIZE = defaults_chunk_size
+
+        expected = key().encrypt(gpg.add_pkcs7_padding(contents))
+        with open(filename + '.lox', 'rb') as encrypted_file:
+            self.assertEqual(encrypted_file.read(), expected)
+        return expected
+
+    def test_raw_upload(self):
+        expected = self._upload()
+
+        self.assertEqual(self.server.uploads, [('raw', '/lox_api/files/raw?path=%2Fb.txt', expected)])
+
+    def test_json_fallback(self):
+        self.server.raw = False
+
+        expected = self._upload()
+
+        self.assertEqual(self.server.uploads, [('json', '/b.txt', expected)])
+        self.assertFalse(self.localbox_client._raw_upload)
+
+    def test_upload_session(self):
+        self.server.sessions = True
+
+        expected = self._upload()
+
+        self.assertEqual(self.server.uploads, [('session', '/b.txt', expected)])
+
+    def test_resume_upload_session(self):
+        self.server.sessions = True
+        self.server.fail_chunk_at = 2048
+
+        expected = self._upload(attempts=2)
+
+        self.assertEqual(self.server.uploads, [('session', '/b.txt', expected)])
+        chunks = [path for path, _ in self.server.requests if 'offset=' in path]
+        self.assertEqual(chunks, ['/lox_api/files/upload/1?offset=%d' % offset for offset in (0, 1024, 2048, 2048, 3072, 4096)])
+
+    def test_encrypted_file_replaced(self):
+        filename = os.path.join(self.directory, 'b.txt.lox')
+        self._upload()
+        inode = os.stat(filename).st_ino
+
+        self._upload()
+
+        # renamed over the previous one, which changes the mtime of the directory
+        self.assertNotEqual(os.stat(filename).st_ino, inode)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['b.txt', 'b.txt.lox'])
+
+    def test_encrypt_stream(self):
+        from io import BytesIO
+        from Crypto.Cipher.AES import MODE_CFB
+        from Crypto.Cipher.AES import new as AES_Key
+        from sync.gpg import gpg
+        from sync.localbox import encrypt_stream
+
+        key = lambda: AES_Key(b'k' * 32, MODE_CFB, b'i' * 16, segment_size=128)
+        for size in (0, 15, 16, 17, 100):
+            contents = os.urandom(size)
+            encrypted_file = BytesIO()
+
+            encrypt_stream(key(), BytesIO(contents), encrypted_file, chunk_size=16)
+
+            self.assertEqual(encrypted_file.getvalue(), key().encrypt(gpg.add_pkcs7_padding(contents)))
+
+
+if __name__ == '__main__':
+    unittest.main()
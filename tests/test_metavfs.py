@@ -0,0 +1,112 @@
+from __future__ import absolute_import
+
+import os
+import tempfile
+import unittest
+
+
+def _build_tree():
+    from sync.metavfs import MetaVFS
+
+    root = MetaVFS(0, '/', True)
+    docs = MetaVFS(10, '/docs', True)
+    docs.add_child(MetaVFS(11, '/docs/a.txt', False))
+    sub = MetaVFS(12, '/docs/sub', True)
+    sub.add_child(MetaVFS(13, '/docs/sub/b.txt', False))
+    docs.add_child(sub)
+    root.add_child(docs)
+    root.add_child(MetaVFS(20, '/c.txt', False))
+    return root
+
+
+class TestMetaVFSIndex(unittest.TestCase):
+    """
+    Test the path index of :py:class:`sync.metavfs.MetaVFS`.
+
+    """
+
+    def test_get_entry(self):
+        root = _build_tree()
+
+        for path in ('/', '/docs', '/docs/a.txt', '/docs/sub', '/docs/sub/b.txt', '/c.txt'):
+            entry = root.get_entry(path)
+            self.assertIsNotNone(entry)
+            self.assertEqual(entry.path, path)
+
+        self.assertIsNone(root.get_entry('/missing'))
+
+    def test_get_entry_from_subtree(self):
+        root = _build_tree()
+        docs = root.get_entry('/docs')
+
+        self.assertEqual(docs.get_entry('/docs/sub/b.txt').path, '/docs/sub/b.txt')
+        self.assertIsNone(docs.get_entry('/c.txt'))
+
+    def test_contains(self):
+        root = _build_tree()
+
+        self.assertIn('/docs/sub/b.txt', root)
+        self.assertNotIn('/docs/sub/c.txt', root)
+
+    def test_contains_directory(self):
+        root = _build_tree()
+
+        self.assertTrue(root.contains_directory('docs/sub'))
+        self.assertTrue(root.contains_directory('./docs'))
+        self.assertFalse(root.contains_directory('/docs/a.txt'))
+        self.assertFalse(root.contains_directory('/nope'))
+
+    def test_index_rebuilt_after_load(self):
+        root = _build_tree()
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            root.save(filename)
+            loaded = root.load(filename)
+        finally:
+            os.remove(filename)
+
+        self.assertEqual(sorted(loaded.get_paths()), sorted(root.get_paths()))
+        self.assertEqual(loaded.get_entry('/docs/sub/b.txt').modified_at, 13)
+
+
+class TestMetaVFSMerge(unittest.TestCase):
+    """
+    Test :py:meth:`sync.metavfs.MetaVFS.merge`.
+
+    """
+
+    def test_union(self):
+        from sync.metavfs import MetaVFS
+
+        other = MetaVFS(0, '/', True)
+        docs = MetaVFS(99, '/docs', True)
+        docs.add_child(MetaVFS(30, '/docs/new.txt', False))
+        other.add_child(docs)
+        other.add_child(MetaVFS(31, '/d.txt', False))
+
+        merged = MetaVFS.merge(_build_tree(), other)
+
+        self.assertEqual(sorted(merged.get_paths()),
+                         ['/', '/c.txt', '/d.txt', '/docs', '/docs/a.txt', '/docs/new.txt',
+                          '/docs/sub', '/docs/sub/b.txt'])
+        # the first tree wins
+        self.assertEqual(merged.get_entry('/docs').modified_at, 10)
+        self.assertIs(merged.get_entry('/docs/new.txt').parent, merged.get_entry('/docs'))
+
+    def test_sources_untouched(self):
+        from sync.metavfs import MetaVFS
+
+        tree = _build_tree()
+        merged = MetaVFS.merge(tree)
+
+        self.assertIsNot(merged.get_entry('/docs/a.txt'), tree.get_entry('/docs/a.txt'))
+        self.assertIs(tree.get_entry('/docs/a.txt').parent, tree.get_entry('/docs'))
+
+    def test_gen_order(self):
+        self.assertEqual([entry.path for entry in _build_tree().gen()],
+                         ['/', '/docs', '/docs/a.txt', '/docs/sub', '/docs/sub/b.txt', '/c.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
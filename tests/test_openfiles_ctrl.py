@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from time import sleep
+
+
+class TestOpenfilesCtrl(unittest.TestCase):
+    """
+    Test the in-memory registry of :py:mod:`sync.controllers.openfiles_ctrl`.
+
+    """
+
+    def setUp(self):
+        from sync import defaults
+        from sync.controllers import openfiles_ctrl
+
+        self.directory = tempfile.mkdtemp()
+        self.openfiles_path = defaults.LOCALBOX_OPENFILES
+        self.save_delay = defaults.OPENFILES_SAVE_DELAY
+        defaults.LOCALBOX_OPENFILES = os.path.join(self.directory, 'openfiles.pickle')
+        defaults.OPENFILES_SAVE_DELAY = 0.2
+        openfiles_ctrl._openfiles = None
+        self.files = []
+        for name in ('a.txt', 'b.txt', 'c.txt'):
+            self.files.append(os.path.join(self.directory, name))
+            with open(self.files[-1], 'wb') as new_file:
+                new_file.write(name.encode('utf8'))
+
+    def tearDown(self):
+        from sync import defaults
+        from sync.controllers import openfiles_ctrl
+
+        openfiles_ctrl.flush()
+        openfiles_ctrl._openfiles = None
+        defaults.LOCALBOX_OPENFILES = self.openfiles_path
+        defaults.OPENFILES_SAVE_DELAY = self.save_delay
+        shutil.rmtree(self.directory)
+
+    def _on_disk(self):
+        from sync import defaults
+
+        with open(defaults.LOCALBOX_OPENFILES, 'rb') as f:
+            return pickle.load(f)
+
+    def test_write_behind(self):
+        from sync import defaults
+        from sync.controllers import openfiles_ctrl
+
+        for filename in self.files:
+            openfiles_ctrl.add(filename)
+
+        self.assertTrue(openfiles_ctrl.contains(self.files[0]))
+        self.assertIsNotNone(openfiles_ctrl.get_hash(self.files[1]))
+        self.assertFalse(os.path.exists(defaults.LOCALBOX_OPENFILES))
+        sleep(0.5)
+        self.assertEqual(sorted(self._on_disk()), sorted(self.files))
+
+    def test_changes_of_other_processes(self):
+        from sync import defaults
+        from sync.controllers import openfiles_ctrl
+
+        openfiles_ctrl.add(self.files[0])
+        openfiles_ctrl.flush()
+        openfiles_ctrl.add(self.files[1])
+        # another process opens a file
+        temporary = defaults.LOCALBOX_OPENFILES + '.other'
+        with open(temporary, 'wb') as f:
+            pickle.dump({self.files[0]: 'a', self.files[2]: 'c'}, f)
+        os.rename(temporary, defaults.LOCALBOX_OPENFILES)
+
+        self.assertEqual(openfiles_ctrl.get_hash(self.files[2]), 'c')
+        self.assertTrue(openfiles_ctrl.contains(self.files[1]))
+        openfiles_ctrl.flush()
+        self.assertEqual(sorted(self._on_disk()), sorted(self.files))
+
+    def test_missing_files_are_not_saved(self):
+        from sync.controllers import openfiles_ctrl
+
+        openfiles_ctrl.add(self.files[0])
+        openfiles_ctrl.add(self.files[1])
+        os.remove(self.files[0])
+        openfiles_ctrl.flush()
+
+        self.assertEqual(list(self._on_disk()), [self.files[1]])
+        self.assertEqual(list(openfiles_ctrl.load()), [self.files[1]])
+
+    def test_remove_all(self):
+        from sync.controllers import openfiles_ctrl
+
+        for filename in self.files:
+            openfiles_ctrl.add(filename)
+
+        openfiles_ctrl.remove_all()
+
+        self.assertEqual([filename for filename in self.files if os.path.exists(filename)], [])
+        self.assertFalse(openfiles_ctrl.contains(self.files[0]))
+        self.assertEqual(self._on_disk(), dict())
+
+
+    def test_is_modified(self):
+        from sync import hash_cache
+        from sync.controllers import openfiles_ctrl
+
+        self.addCleanup(setattr, hash_cache, '_cache', hash_cache._cache)
+        hash_cache._cache = hash_cache.HashCache(os.path.join(self.directory, 'hashes.pickle'), 10, 'sha1')
+        openfiles_ctrl.add(self.files[0])
+        openfiles_ctrl.add(self.files[1])
+
+        self.assertEqual(openfiles_ctrl.get_hash(self.files[0])[0], 'sha1')
+        self.assertFalse(openfiles_ctrl.is_modified(self.files[0]))
+        self.assertTrue(openfiles_ctrl.is_modified(self.files[2]))
+        with open(self.files[1], 'ab') as opened_file:
+            opened_file.write(b'changed')
+        self.assertTrue(openfiles_ctrl.is_modified(self.files[1]))
+
+    def test_is_modified_after_algorithm_change(self):
+        from loxcommon import os_utils
+        from sync import hash_cache
+        from sync.controllers import openfiles_ctrl
+
+        self.addCleanup(setattr, hash_cache, '_cache', hash_cache._cache)
+        hash_cache._cache = hash_cache.HashCache(os.path.join(self.directory, 'hashes.pickle'), 10, 'sha1')
+        openfiles_ctrl.add(self.files[0])
+        # registered by an older version, and with md5 before 'hash_algorithm' changed
+        openfiles_ctrl._get_openfiles()[self.files[1]] = os_utils.hash_file(self.files[1])
+        openfiles_ctrl._get_openfiles()[self.files[2]] = ('md5', hash_cache.hash_stream(self.files[2], 'md5'))
+        hash_cache._cache = hash_cache.HashCache(os.path.join(self.directory, 'hashes.pickle'), 10, 'sha256')
+
+        for filename in self.files:
+            self.assertFalse(openfiles_ctrl.is_modified(filename))
+            self.assertEqual(openfiles_ctrl.get_hash(filename)[0], 'sha256')
+        with open(self.files[0], 'ab') as opened_file:
+            opened_file.write(b'changed')
+        self.assertTrue(openfiles_ctrl.is_modified(self.files[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+from __future__ import absolute_import
+
+import unittest
+
+
+def _tree(entries):
+    """
+    :param entries: list of (path, is_dir, modified_at, size), parents first
+    """
+    from sync.metavfs import MetaVFS
+
+    root = MetaVFS(0, '/', True)
+    for path, is_dir, modified_at, size in entries:
+        parent = root.get_entry(path.rsplit('/', 1)[0] or '/')
+        parent.add_child(MetaVFS(modified_at, path, is_dir, size=size))
+    return root
+
+
+def _planner(remote, local, old):
+    from sync.plan import Planner
+
+    class TreePlanner(Planner):
+        """
+        looks at the local tree instead of the file system
+        """
+
+        def exists(self, filesystem_path):
+            return filesystem_path in self.local
+
+        def isdir(self, filesystem_path):
+            return filesystem_path in self.local and self.local.get_entry(filesystem_path).is_dir
+
+        def is_modified(self, filesystem_path):
+            return True
+
+    return TreePlanner(_tree(remote), _tree(local), _tree(old), lambda metavfs: metavfs.path)
+
+
+class TestPlanner(unittest.TestCase):
+    """
+    Test :py:class:`sync.plan.Planner` on synthetic trees.
+
+    """
+
+    def _plan(self, remote, local, old):
+        return dict((action.path, (action.action, action.size))
+                    for action in _planner(remote, local, old).plan())
+
+    def test_new_files(self):
+        plan = self._plan(remote=[('/remote.txt', False, 10, 300), ('/remote', True, 10, None)],
+                          local=[('/local.txt', False, 10, 200), ('/local', True, 10, None)],
+                          old=[])
+
+        self.assertEqual(plan['/remote.txt'], ('download', 300))
+        self.assertEqual(plan['/remote'], ('mkdir-local', 0))
+        self.assertEqual(plan['/local.txt'], ('upload', 200))
+        self.assertEqual(plan['/local'], ('mkdir-remote', 0))
+
+    def test_deleted_files(self):
+        plan = self._plan(remote=[('/kept.txt', False, 5, 1)],
+                          local=[('/kept.txt', False, 5, 1), ('/gone-remote.txt', False, 5, 1)],
+                          old=[('/kept.txt', False, 5, 1), ('/gone-remote.txt', False, 5, 1)])
+
+        self.assertEqual(plan['/gone-remote.txt'], ('delete-local', 0))
+        self.assertEqual(plan['/kept.txt'], ('skip', None))
+
+    def test_remote_deleted_locally(self):
+        plan = self._plan(remote=[('/gone-local.txt', False, 5, 1)],
+                          local=[],
+                          old=[('/gone-local.txt', False, 5, 1)])
+
+        self.assertEqual(plan['/gone-local.txt'], ('delete-remote', 0))
+
+    def test_summarize(self):
+        from sync.plan import summarize
+
+        actions = _planner(remote=[('/a.txt', False, 10, 300), ('/b.txt', False, 10, None)],
+                           local=[('/c.txt', False, 10, 200)], old=[]).plan()
+        summary = summarize(actions)
+
+        self.assertEqual(summary['download'], (2, 300))
+        self.assertEqual(summary['upload'], (1, 200))
+        self.assertEqual(summary['skip'], (1, 0))
+
+
+class TestChangedPaths(unittest.TestCase):
+    """
+    Test that planning the :py:func:`sync.plan.changed_paths` of an incremental sync gives the actions of a full one.
+
+    """
+
+    def test_same_actions_as_full_plan(self):
+        from sync.metavfs import MetaVFS
+        from sync.plan import changed_paths, SKIP
+
+        old = [('/docs', True, 1, None), ('/docs/same.txt', False, 5, 1), ('/docs/edited.txt', False, 5, 1),
+               ('/docs/gone-remote.txt', False, 5, 1), ('/docs/gone-local.txt', False, 5, 1),
+               ('/docs/changed-remote.txt', False, 5, 1)]
+        remote = [('/docs', True, 30, None), ('/docs/same.txt', False, 5, 1), ('/docs/edited.txt', False, 5, 1),
+                  ('/docs/gone-local.txt', False, 5, 1), ('/docs/changed-remote.txt', False, 20, 2),
+                  ('/new-remote', True, 20, None), ('/new-remote/a.txt', False, 20, 3)]
+        local = [('/docs', True, 1, None), ('/docs/same.txt', False, 5, 1), ('/docs/edited.txt', False, 20, 4),
+                 ('/docs/gone-remote.txt', False, 5, 1), ('/docs/changed-remote.txt', False, 5, 1),
+                 ('/new-local', True, 20, None), ('/new-local/b.txt', False, 20, 5)]
+        journaled = {'/docs/edited.txt', '/docs/gone-local.txt', '/new-local'}
+
+        planner = _planner(remote, local, old)
+        full = [(action.path, action.action) for action in planner.plan() if action.action != SKIP]
+        planner = _planner(remote, local, old)
+        paths = changed_paths(planner.remote, planner.local, planner.old, journaled)
+        incremental = planner.plan(MetaVFS.merge_paths(paths, planner.remote, planner.local, planner.old))
+
+        self.assertEqual(sorted((action.path, action.action) for action in incremental if action.action != SKIP),
+                         sorted(full))
+        self.assertNotIn('/docs/same.txt', paths)
+        self.assertIn('/new-local/b.txt', paths)
+
+
+if __name__ == '__main__':
+    unittest.main()
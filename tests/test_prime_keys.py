@@ -0,0 +1,130 @@
+from __future__ import absolute_import
+
+import json
+import unittest
+from threading import Thread
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # pylint: disable=F0401
+
+
+class StubKeysHandler(BaseHTTPRequestHandler):
+    """
+    Answers lox_api/keys, only if 'batch' is set on the server, and lox_api/key
+    like a LocalBox server. The 'key' and 'iv' are base64 of the keys path.
+    """
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.calls.append(self.path)
+        if self.path == '/lox_api/keys':
+            if not self.server.batch:
+                self.send_error(404)
+                return
+            result = dict((keys_path, _key_data(keys_path)) for keys_path in json.loads(data)['paths'])
+        else:
+            result = _key_data(self.path[len('/lox_api/key/'):])
+        self._send(json.dumps(result).encode('utf-8'))
+
+    do_GET = do_POST
+
+    def _send(self, data):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def _key_data(keys_path):
+    from base64 import b64encode
+
+    return {'key': b64encode(keys_path.encode('utf8')).decode('ascii'),
+            'iv': b64encode(keys_path.encode('utf8')).decode('ascii')}
+
+
+class FakeAuthenticator(object):
+    label = 'stub'
+
+    def get_authorization_header(self):
+        return 'Bearer stub'
+
+
+class FakeGpg(object):
+    def decrypt(self, data, passphrase):
+        return data
+
+
+class TestPrimeKeys(unittest.TestCase):
+    """
+    Test :py:meth:`sync.localbox.LocalBox.prime_keys` against a stub server.
+
+    """
+
+    def setUp(self):
+        from sync import localbox, key_cache
+        from sync.localbox import LocalBox
+
+        self.server = HTTPServer(('127.0.0.1', 0), StubKeysHandler)
+        self.server.batch = True
+        self.server.calls = []
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.get_gpg = localbox.get_gpg
+        localbox.get_gpg = FakeGpg
+        self.localbox_client = LocalBox.__new__(LocalBox)
+        self.localbox_client.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        self.localbox_client.label = 'prime-keys-test'
+        self.localbox_client._authentication_url = None
+        self.localbox_client._authenticator = FakeAuthenticator()
+        self.localbox_client._batch_keys = None
+        self.cache = key_cache.get_key_cache()
+
+    def tearDown(self):
+        from sync import localbox
+
+        localbox.get_gpg = self.get_gpg
+        self.cache.invalidate('prime-keys-test')
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _keys_path(self, path):
+        from loxcommon import os_utils
+
+        return os_utils.get_keys_path(path)
+
+    def test_batch(self):
+        paths = ['/share/a.txt', '/share/sub/b.txt', '/other/c.txt']
+
+        self.assertEqual(self.localbox_client.prime_keys(paths, 'passphrase'), 2)
+
+        self.assertEqual(self.server.calls, ['/lox_api/keys'])
+        for path in paths:
+            keys_path = self._keys_path(path)
+            self.assertEqual(self.cache.get('prime-keys-test', keys_path, 'passphrase'),
+                             (keys_path.encode('utf8'), keys_path.encode('utf8')))
+
+    def test_fallback(self):
+        self.server.batch = False
+
+        self.assertEqual(self.localbox_client.prime_keys(['/share/a.txt', '/other/c.txt'], 'passphrase'), 2)
+
+        self.assertEqual(sorted(self.server.calls), sorted(['/lox_api/keys'] + [
+            '/lox_api/key/' + self._keys_path(path) for path in ('/share/a.txt', '/other/c.txt')]))
+        self.assertFalse(self.localbox_client._batch_keys)
+
+    def test_cached_keys_not_fetched(self):
+        self.localbox_client.prime_keys(['/share/a.txt'], 'passphrase')
+
+        self.assertEqual(self.localbox_client.prime_keys(['/share/b.txt'], 'passphrase'), 0)
+        self.assertEqual(self.server.calls, ['/lox_api/keys'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+from __future__ import absolute_import
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # pylint: disable=F0401
+
+
+class StubChangesHandler(BaseHTTPRequestHandler):
+    """
+    Answers lox_api/meta (the whole tree at once) and lox_api/changes like a
+    LocalBox server with a change feed. The cursor is the number of changes in
+    the server's log; cursors older than 'server.oldest_cursor' are expired.
+    Answers hold at most 'server.page_size' changes.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        route = self.path.rsplit('/', 1)[-1]
+        self.server.calls.append(route)
+        if route == 'meta':
+            self._send(self._meta('/'))
+        elif route == 'changes' and self.server.changes_enabled:
+            log = self.server.log
+            if body['cursor'] is None:
+                self._send({'cursor': str(len(log)), 'changes': []})
+                return
+            cursor = int(body['cursor'])
+            if cursor < self.server.oldest_cursor:
+                self.send_error(410)
+                return
+            end = min(len(log), cursor + self.server.page_size)
+            self._send({'cursor': str(end), 'changes': log[cursor:end], 'has_more': end < len(log)})
+        else:
+            self.send_error(404)
+
+    def _meta(self, path):
+        is_dir, modified_at = self.server.tree[path]
+        node = {'path': path, 'is_dir': is_dir, 'modified_at': modified_at}
+        if is_dir:
+            prefix = path.rstrip('/') + '/'
+            node['depth'] = -1
+            node['children'] = [self._meta(child) for child in sorted(self.server.tree)
+                                if child != path and child.startswith(prefix) and '/' not in child[len(prefix):]]
+        return node
+
+    def _send(self, result):
+        data = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeAuthenticator(object):
+    label = 'stub'
+
+    def get_authorization_header(self):
+        return 'Bearer stub'
+
+
+class TestRemoteChanges(unittest.TestCase):
+    """
+    Test :py:meth:`sync.syncer.Syncer.fetch_localbox_metadata` against a stub server with a change feed.
+
+    """
+
+    def setUp(self):
+        from sync import defaults
+
+        self.directory = tempfile.mkdtemp()
+        self.remote_status = defaults.REMOTE_SYNC_STATUS
+        defaults.REMOTE_SYNC_STATUS = os.path.join(self.directory, 'remote.')
+
+        self.server = HTTPServer(('127.0.0.1', 0), StubChangesHandler)
+        self.server.tree = {'/': (True, 1), '/docs': (True, 2), '/docs/a.txt': (False, 3), '/c.txt': (False, 4)}
+        self.server.log = []
+        self.server.oldest_cursor = 0
+        self.server.page_size = 2
+        self.server.changes_enabled = True
+        self.server.calls = []
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        from sync import defaults
+
+        self.server.shutdown()
+        self.server.server_close()
+        defaults.REMOTE_SYNC_STATUS = self.remote_status
+        shutil.rmtree(self.directory)
+
+    def _get_syncer(self):
+        from sync.localbox import LocalBox
+        from sync.syncer import Syncer
+
+        localbox_client = LocalBox.__new__(LocalBox)
+        localbox_client.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        localbox_client.label = 'stub'
+        localbox_client.path = '/tmp/stub'
+        localbox_client._authentication_url = None
+        localbox_client._authenticator = FakeAuthenticator()
+        localbox_client._changes = None
+        return Syncer(localbox_client, '/tmp/stub', 'sync', name='stub')
+
+    def _change(self, path, is_dir=False, modified_at=None, deleted=False):
+        if deleted:
+            for removed in [tree_path for tree_path in self.server.tree
+                            if tree_path == path or tree_path.startswith(path + '/')]:
+                del self.server.tree[removed]
+            self.server.log.append({'path': path, 'deleted': True})
+        else:
+            self.server.tree[path] = (is_dir, modified_at)
+            self.server.log.append({'path': path, 'is_dir': is_dir, 'modified_at': modified_at, 'size': 1})
+
+    def _sync(self):
+        """
+        fetch the remote tree and save it like a finished sync does
+        """
+        self.server.calls = []
+        syncer = self._get_syncer()
+        syncer.fetch_localbox_metadata()
+        syncer._save_remote_status()
+        tree = syncer.localbox_metadata
+        self.assertEqual(dict((entry.path, (entry.is_dir, entry.modified_at)) for entry in tree.gen()),
+                         self.server.tree)
+        return self.server.calls
+
+    def test_delta(self):
+        self.assertEqual(self._sync(), ['changes', 'meta'])
+
+        self._change('/new', is_dir=True, modified_at=5)
+        self._change('/new/b.txt', modified_at=6)
+        self._change('/docs/a.txt', modified_at=7)
+        self._change('/c.txt', deleted=True)
+        self._change('/docs', deleted=True)
+
+        # three pages of changes, no crawl
+        self.assertEqual(self._sync(), ['changes', 'changes', 'changes'])
+        self.assertEqual(self._sync(), ['changes'])
+
+    def test_expired_cursor(self):
+        self._sync()
+        self._change('/d.txt', modified_at=5)
+        self.server.oldest_cursor = 1
+
+        self.assertEqual(self._sync(), ['changes', 'changes', 'meta'])
+
+    def test_server_without_changes(self):
+        self.server.changes_enabled = False
+
+        self.assertEqual(self._sync(), ['changes', 'meta'])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'remote.stub')))
+        self.assertEqual(self._sync(), ['changes', 'meta'])
+
+
+if __name__ == '__main__':
+    unittest.main()
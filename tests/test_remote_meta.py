@@ -0,0 +1,144 @@
+from __future__ import absolute_import
+
+import json
+import unittest
+from threading import Thread
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # pylint: disable=F0401
+
+#: remote tree served by the stub server: path -> (is_dir, modified_at)
+REMOTE_TREE = {
+    '/': (True, 1),
+    '/docs': (True, 2),
+    '/docs/a.txt': (False, 3),
+    '/docs/sub': (True, 4),
+    '/docs/sub/b.txt': (False, 5),
+    '/c.txt': (False, 6),
+}
+
+
+def _children(path):
+    prefix = path.rstrip('/') + '/'
+    return sorted(p for p in REMOTE_TREE
+                  if p != path and p.startswith(prefix) and '/' not in p[len(prefix):])
+
+
+def _meta(path, depth):
+    is_dir, modified_at = REMOTE_TREE[path]
+    node = {'path': path, 'is_dir': is_dir, 'modified_at': modified_at}
+    if is_dir and depth != 0:
+        node['children'] = [_meta(child, depth - 1) for child in _children(path)]
+    return node
+
+
+class StubLocalBoxHandler(BaseHTTPRequestHandler):
+    """
+    Answers lox_api/meta like a LocalBox server. With 'recursive' set on the
+    server the 'depth' parameter is honoured, otherwise one level is returned.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.calls.append(body)
+        path = body['path']
+        if path not in REMOTE_TREE:
+            self.send_error(404)
+            return
+
+        if self.server.recursive and 'depth' in body:
+            result = _meta(path, body['depth'])
+            result['depth'] = body['depth']
+        else:
+            result = _meta(path, 0)
+            result['children'] = [dict((key, value) for key, value in _meta(child, 0).items() if key != 'modified_at')
+                                  for child in _children(path)] if result['is_dir'] else []
+
+        data = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeAuthenticator(object):
+    label = 'stub'
+
+    def get_authorization_header(self):
+        return 'Bearer stub'
+
+
+class TestPopulateLocalBoxMetadata(unittest.TestCase):
+    """
+    Test :py:meth:`sync.syncer.Syncer.populate_localbox_metadata` against a stub server.
+
+    """
+
+    def _start_server(self, recursive):
+        server = HTTPServer(('127.0.0.1', 0), StubLocalBoxHandler)
+        server.recursive = recursive
+        server.calls = []
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def _get_syncer(self, server):
+        from sync.localbox import LocalBox
+        from sync.syncer import Syncer
+
+        localbox_client = LocalBox.__new__(LocalBox)
+        localbox_client.url = 'http://127.0.0.1:%d/' % server.server_address[1]
+        localbox_client.label = 'stub'
+        localbox_client.path = '/tmp/stub'
+        localbox_client._authentication_url = None
+        localbox_client._authenticator = FakeAuthenticator()
+        return Syncer(localbox_client, '/tmp/stub', 'sync', name='stub')
+
+    def _check_tree(self, syncer):
+        tree = syncer.localbox_metadata
+        self.assertEqual(sorted(tree.get_paths()), sorted(REMOTE_TREE))
+        for path, (is_dir, modified_at) in REMOTE_TREE.items():
+            self.assertEqual(tree.get_entry(path).is_dir, is_dir)
+            self.assertEqual(tree.get_entry(path).modified_at, modified_at)
+
+    def test_recursive_server(self):
+        server = self._start_server(recursive=True)
+        syncer = self._get_syncer(server)
+
+        syncer.populate_localbox_metadata()
+
+        self._check_tree(syncer)
+        self.assertEqual(len(server.calls), 1)
+
+    def test_legacy_server(self):
+        server = self._start_server(recursive=False)
+        syncer = self._get_syncer(server)
+
+        syncer.populate_localbox_metadata()
+
+        self._check_tree(syncer)
+        self.assertEqual(len(server.calls), len(REMOTE_TREE))
+
+    def test_stop(self):
+        from threading import Event
+        from sync.syncer import StopSyncException
+
+        server = self._start_server(recursive=False)
+        syncer = self._get_syncer(server)
+        syncer.stop_event = Event()
+        syncer.stop_event.set()
+
+        self.assertRaises(StopSyncException, syncer.populate_localbox_metadata)
+        self.assertEqual(server.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+from time import time
+
+
+class TestStatCache(unittest.TestCase):
+    """
+    Test the local scan of :py:meth:`sync.syncer.Syncer.populate_filepath_metadata` with a stat cache.
+
+    """
+
+    def setUp(self):
+        from sync import stat_cache
+        from sync.syncer import Syncer
+
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = stat_cache.STAT_CACHE
+        stat_cache.STAT_CACHE = os.path.join(self.directory, 'statcache.')
+        self.root = os.path.join(self.directory, 'box')
+        os.makedirs(os.path.join(self.root, 'docs', 'sub'))
+        self._write('docs/a.txt.lox', b'a' * 10)
+        self._write('docs/a.txt', b'a' * 5)
+        self._write('docs/sub/b.txt.lox', b'b' * 20)
+        self._write('docs/sub/c.txt.lox.part', b'c')
+        self._write('new.txt', b'n' * 3)
+        self.aged = int(time()) - 60
+        self._age_directories()
+        self.syncer = Syncer(None, self.root, 'sync', name='stub')
+
+    def tearDown(self):
+        from sync import stat_cache
+
+        stat_cache.STAT_CACHE = self.cache_path
+        shutil.rmtree(self.directory)
+
+    def _write(self, path, contents):
+        with open(os.path.join(self.root, path), 'wb') as new_file:
+            new_file.write(contents)
+
+    def _age_directories(self):
+        # directories changed just before a scan are listed again, see RACY_INTERVAL
+        for path in ('docs/sub', 'docs', ''):
+            os.utime(os.path.join(self.root, path), (self.aged, self.aged))
+
+    def _scan(self):
+        self.syncer.populate_filepath_metadata(path='/', parent=None)
+        tree = self.syncer.filepath_metadata
+        return dict((entry.path, entry.size) for entry in tree.gen() if not entry.is_dir)
+
+    def test_scan(self):
+        self.assertEqual(self._scan(), {'/docs/a.txt': 5, '/docs/sub/b.txt': 20, '/new.txt': 3})
+
+    def test_unchanged_directories_from_cache(self):
+        self._scan()
+        # rewritten in place, the directory mtime stays the same
+        self._write('docs/sub/b.txt.lox', b'b' * 30)
+        self._write('docs/a.txt', b'a' * 7)
+        self._age_directories()
+
+        # the '.lox' file comes from the cache, plain files are looked at again
+        self.assertEqual(self._scan(), {'/docs/a.txt': 7, '/docs/sub/b.txt': 20, '/new.txt': 3})
+
+    def test_changed_directory(self):
+        self._scan()
+        self._write('docs/sub/d.txt.lox', b'd')
+        os.remove(os.path.join(self.root, 'docs', 'a.txt.lox'))
+        os.remove(os.path.join(self.root, 'docs', 'a.txt'))
+
+        self.assertEqual(self._scan(), {'/docs/sub/b.txt': 20, '/docs/sub/d.txt': 1, '/new.txt': 3})
+
+    def test_damaged_cache(self):
+        from sync.stat_cache import StatCache
+
+        self._scan()
+        cache = StatCache('stub')
+        for contents in (b'damaged', b'csync.nonexistent\nStatCache\n.', b''):
+            with open(cache.filename, 'wb') as cache_file:
+                cache_file.write(contents)
+
+            self.assertEqual(cache.load()._old, dict())
+            self.assertEqual(self._scan(), {'/docs/a.txt': 5, '/docs/sub/b.txt': 20, '/new.txt': 3})
+        self.assertFalse(os.path.exists(cache.filename + '.tmp'))
+
+    def test_deep_tree(self):
+        import sys
+
+        path = self.root
+        for _ in range(300):
+            path = os.path.join(path, 'd')
+            os.mkdir(path)
+        with open(os.path.join(path, 'deep.txt.lox'), 'wb') as new_file:
+            new_file.write(b'deep')
+
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(200)
+        try:
+            scanned = self._scan()
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+
+        self.assertEqual(len(scanned), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,265 @@
+from __future__ import absolute_import
+
+import unittest
+from threading import Event, Lock
+
+try:
+    from urllib2 import URLError
+except ImportError:
+    from urllib.error import URLError  # pylint: disable=F0401,E0611
+
+
+class RecordingLocalBox(object):
+    """
+    Records the calls syncsync makes to the server.
+    """
+    label = 'stub'
+
+    def __init__(self, done):
+        self.done = done
+
+    def delete(self, metavfs):
+        self.done('delete-remote', metavfs.path)
+
+    def upload_file(self, path, fs_path, passphrase):
+        self.done('upload', path)
+
+    def create_directory(self, path):
+        self.done('mkdir-remote', path)
+
+
+class TestExecute(unittest.TestCase):
+    """
+    Test the order in which :py:meth:`sync.syncer.Syncer._execute` runs actions.
+
+    """
+
+    def setUp(self):
+        from sync.syncer import Syncer
+
+        self.order = []
+        self.lock = Lock()
+        self.syncer = Syncer(RecordingLocalBox(self._done), '/tmp/stub', 'sync', name='stub')
+        self.syncer.mkdir = lambda metavfs: self._done('mkdir-local', metavfs.path)
+        self.syncer.download = lambda path: self._done('download', path)
+        self.syncer.delete = lambda metavfs: self._done('delete-local', metavfs.path)
+
+    def _done(self, action, path):
+        with self.lock:
+            self.order.append((action, path))
+
+    def _tree(self):
+        from sync.metavfs import MetaVFS
+
+        root = MetaVFS(0, '/', True)
+        new = MetaVFS(1, '/new', True)
+        sub = MetaVFS(1, '/new/sub', True)
+        sub.add_child(MetaVFS(1, '/new/sub/a.txt', False))
+        new.add_child(sub)
+        new.add_child(MetaVFS(1, '/new/b.txt', False))
+        root.add_child(new)
+        gone = MetaVFS(1, '/gone', True)
+        gone.add_child(MetaVFS(1, '/gone/c.txt', False))
+        root.add_child(gone)
+        root.add_child(MetaVFS(1, '/moved.txt', False))
+        return root
+
+    def _actions(self, *actions):
+        from sync.plan import SyncAction
+
+        tree = self._tree()
+        return [SyncAction(action, tree.get_entry(path)) for action, path in actions]
+
+    def test_order(self):
+        actions = self._actions(('mkdir-local', '/new'),
+                                ('mkdir-local', '/new/sub'),
+                                ('download', '/new/sub/a.txt'),
+                                ('download', '/new/b.txt'),
+                                ('delete-local', '/gone'),
+                                ('delete-local', '/gone/c.txt'),
+                                ('skip', '/'),
+                                ('upload', '/moved.txt'))
+
+        self.syncer._execute(actions, 'passphrase')
+
+        position = dict((path, self.order.index((action, path))) for action, path in self.order)
+        self.assertEqual(len(self.order), 6)
+        self.assertLess(position['/new'], position['/new/sub'])
+        self.assertLess(position['/new/sub'], position['/new/sub/a.txt'])
+        self.assertLess(position['/new'], position['/new/b.txt'])
+        self.assertEqual(self.order[-1], ('delete-local', '/gone'))
+
+    def test_stop(self):
+        from threading import Event
+        from sync.syncer import StopSyncException
+
+        self.syncer.stop_event = Event()
+        self.syncer.mkdir = lambda metavfs: self.syncer.stop_event.set()
+
+        self.assertRaises(StopSyncException, self.syncer._execute,
+                          self._actions(('mkdir-local', '/new'), ('download', '/new/b.txt'),
+                                        ('delete-local', '/gone')), 'passphrase')
+        self.assertEqual(self.order, [])
+
+
+class TestUpdateFilepathMetadata(unittest.TestCase):
+    """
+    Test that :py:meth:`sync.syncer.Syncer.update_filepath_metadata` on the changed paths gives the tree of a full scan.
+
+    """
+
+    def setUp(self):
+        import os
+        import tempfile
+        from sync import defaults
+        from sync.syncer import Syncer
+
+        self.directory = tempfile.mkdtemp()
+        self.stat_cache_enabled = defaults.STAT_CACHE_ENABLED
+        defaults.STAT_CACHE_ENABLED = False
+        self.root = os.path.join(self.directory, 'box')
+        os.makedirs(os.path.join(self.root, 'docs', 'sub'))
+        self._write('docs/a.txt.lox', b'a' * 10)
+        self._write('docs/sub/b.txt.lox', b'b' * 20)
+        self._write('c.txt', b'c' * 3)
+        self.syncer = Syncer(None, self.root, 'sync', name='stub')
+
+    def tearDown(self):
+        import shutil
+        from sync import defaults
+
+        defaults.STAT_CACHE_ENABLED = self.stat_cache_enabled
+        shutil.rmtree(self.directory)
+
+    def _write(self, path, contents):
+        import os
+
+        with open(os.path.join(self.root, path), 'wb') as new_file:
+            new_file.write(contents)
+
+    def _entries(self):
+        return dict((entry.path, (entry.is_dir, entry.size, entry.modified_at))
+                    for entry in self.syncer.filepath_metadata.gen())
+
+    def test_changed_paths(self):
+        import os
+        import shutil
+
+        self.syncer.populate_filepath_metadata()
+        self._write('docs/a.txt', b'a' * 5)
+        self._write('c.txt', b'c' * 4)
+        os.makedirs(os.path.join(self.root, 'new', 'dir'))
+        self._write('new/dir/d.txt.lox', b'd')
+        shutil.rmtree(os.path.join(self.root, 'docs', 'sub'))
+
+        self.syncer.update_filepath_metadata({'/docs/a.txt', '/c.txt', '/new/dir/d.txt', '/docs/sub/b.txt'})
+        updated = self._entries()
+        self.syncer.populate_filepath_metadata()
+
+        self.assertEqual(updated, self._entries())
+        self.assertEqual(updated['/docs/a.txt'][1], 5)
+        self.assertNotIn('/docs/sub', updated)
+
+
+
+class ProbedLocalBox(object):
+    """
+    Answers heartbeats as the server at 'url' would. The slow server answers
+    once the syncs of the other servers have been notified.
+    """
+
+    def __init__(self, url, test):
+        self.url = url
+        self.test = test
+
+    def heartbeat(self, timeout):
+        self.test.probes.append((self.url, timeout))
+        if self.url == 'http://slow':
+            self.test.others_notified.wait(2)
+        return self.url != 'http://down'
+
+
+class TestHeartbeat(unittest.TestCase):
+    """
+    Test :py:meth:`sync.syncer.MainSyncer.do_heartbeat`.
+
+    """
+
+    def setUp(self):
+        from sync import syncer
+        from sync.controllers.localbox_ctrl import SyncItem
+
+        self.probes = []
+        self.clients = []
+        self.notifications = []
+        self.others_notified = Event()
+        self.lock = Lock()
+        test = self
+
+        class RecordingNotifs(object):
+            def syncHeartbeatUp(self, label, force_gui_notif=False, latency=None):
+                test._notified(label, True, latency)
+
+            def syncHeartbeatDown(self, label, force_gui_notif=False):
+                test._notified(label, False, None)
+
+        def get_localbox(url, label, path, timeout=None):
+            self.clients.append((label, timeout))
+            return ProbedLocalBox(url.rstrip('/'), self)
+
+        items = [SyncItem(label='a', url='http://slow', path='/tmp/a'),
+                 SyncItem(label='b', url='http://fast/', path='/tmp/b'),
+                 SyncItem(label='c', url='http://fast', path='/tmp/c'),
+                 SyncItem(label='d', url='http://down', path='/tmp/d')]
+        for name, value in (('SyncsController', lambda: items),
+                            ('Notifs', RecordingNotifs),
+                            ('get_localbox', get_localbox),
+                            ('remove_decrypted_files', lambda: None)):
+            self.addCleanup(setattr, syncer, name, getattr(syncer, name))
+            setattr(syncer, name, value)
+
+    def _notified(self, label, online, latency):
+        with self.lock:
+            self.notifications.append((label, online, latency))
+            if set(label for label, _, _ in self.notifications) >= set('bcd'):
+                self.others_notified.set()
+
+    def test_parallel_probes(self):
+        from sync import defaults
+        from sync.syncer import MainSyncer
+
+        MainSyncer(None).do_heartbeat()
+
+        # the slow server was still being probed when the others were notified
+        self.assertTrue(self.others_notified.is_set())
+        self.assertEqual(self.notifications[-1][:2], ('a', True))
+        self.assertEqual(sorted(url for url, _ in self.probes), ['http://down', 'http://fast', 'http://slow'])
+        timeout = (defaults.HEARTBEAT_CONNECT_TIMEOUT, defaults.HEARTBEAT_READ_TIMEOUT)
+        self.assertEqual(set(timeouts for _, timeouts in self.probes + self.clients), set([timeout]))
+        self.assertEqual(sorted((label, online) for label, online, _ in self.notifications),
+                         [('a', True), ('b', True), ('c', True), ('d', False)])
+        latencies = dict((label, latency) for label, _, latency in self.notifications)
+        self.assertEqual(latencies['b'], latencies['c'])
+
+    def test_unreachable_server(self):
+        from sync import syncer
+        from sync.syncer import MainSyncer
+
+        def unreachable(url, label, path, timeout=None):
+            raise URLError('timed out')
+
+        syncer.get_localbox = unreachable
+        MainSyncer(None).do_heartbeat(['a', 'b'])
+
+        self.assertEqual(sorted(self.notifications), [('a', False, None), ('b', False, None)])
+
+    def test_labels(self):
+        from sync.syncer import MainSyncer
+
+        MainSyncer(None).do_heartbeat(['c'])
+
+        self.assertEqual([url for url, _ in self.probes], ['http://fast'])
+        self.assertEqual([label for label, _, _ in self.notifications], ['c'])
+
+if __name__ == '__main__':
+    unittest.main()
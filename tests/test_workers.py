@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+
+import unittest
+from threading import Event
+
+
+class TestMapThreaded(unittest.TestCase):
+    """
+    Test :py:func:`sync.workers.map_threaded`.
+
+    """
+
+    def test_results_in_order(self):
+        from sync.workers import map_threaded
+
+        self.assertEqual(map_threaded(lambda x: x * 2, range(20), 4), [x * 2 for x in range(20)])
+
+    def test_exceptions_are_results(self):
+        from sync.workers import map_threaded
+
+        results = map_threaded(lambda x: 1 // x, [1, 0], 2)
+
+        self.assertEqual(results[0], 1)
+        self.assertIsInstance(results[1], ZeroDivisionError)
+
+    def test_stop_event(self):
+        from sync.workers import map_threaded
+
+        stop_event = Event()
+        stop_event.set()
+
+        self.assertEqual(map_threaded(lambda x: x, range(5), 2, stop_event), [None] * 5)
+
+
+class TestRunDependent(unittest.TestCase):
+    """
+    Test :py:func:`sync.workers.run_dependent`.
+
+    """
+
+    def test_dependencies_first(self):
+        from threading import Lock
+        from sync.workers import run_dependent
+
+        order = []
+        lock = Lock()
+
+        def call(name):
+            def function():
+                with lock:
+                    order.append(name)
+                return name
+            return function
+
+        # 0 <- 1 <- 3, 0 <- 2, 4 on its own
+        dependencies = [[], [0], [0], [1], []]
+        results = run_dependent([call(index) for index in range(5)], dependencies, 4)
+
+        self.assertEqual(results, list(range(5)))
+        for index, depends_on in enumerate(dependencies):
+            for dependency in depends_on:
+                self.assertLess(order.index(dependency), order.index(index))
+
+    def test_exceptions_are_results(self):
+        from sync.workers import run_dependent
+
+        results = run_dependent([lambda: 1 // 0, lambda: 2], [[], [0]], 2)
+
+        self.assertIsInstance(results[0], ZeroDivisionError)
+        self.assertEqual(results[1], 2)
+
+    def test_stop_event(self):
+        from sync.workers import run_dependent
+
+        stop_event = Event()
+
+        def stop():
+            stop_event.set()
+            return 'stopped'
+
+        results = run_dependent([stop, lambda: 'after'], [[], [0]], 2, stop_event)
+
+        self.assertEqual(results, ['stopped', None])
+
+
+if __name__ == '__main__':
+    unittest.main()